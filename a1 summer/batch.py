@@ -0,0 +1,211 @@
+"""Batched dispatch with optimal driver-passenger assignment"""
+
+from typing import List, Optional, Tuple
+import numpy as np
+from dispatcher import Dispatcher
+from driver import Driver
+from oracle import TravelTimeOracle
+from passenger import Passenger
+
+
+def min_cost_assignment(cost: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the rows and columns of an assignment of rows to columns of the
+    2D array <cost> with the lowest total cost.
+
+    Every row is assigned a different column if there are at least as many
+    columns as rows; otherwise every column is assigned a different row. The
+    rows are returned in increasing order.
+
+    This is the shortest augmenting path form of the Hungarian algorithm,
+    which takes O(n^2 m) time for n rows and m columns. The scan over the
+    columns for each augmenting step is vectorized.
+
+    >>> rows, cols = min_cost_assignment(np.array([[4, 1, 3], [2, 0, 5],
+    ...                                            [3, 2, 2]]))
+    >>> rows.tolist(), cols.tolist()
+    ([0, 1, 2], [1, 0, 2])
+    >>> rows, cols = min_cost_assignment(np.array([[1], [0], [5]]))
+    >>> rows.tolist(), cols.tolist()
+    ([1], [0])
+    """
+    cost = np.asarray(cost, dtype=float)
+    if cost.shape[0] > cost.shape[1]:
+        cols, rows = min_cost_assignment(cost.T)
+        order = np.argsort(rows)
+        return rows[order], cols[order]
+    n, m = cost.shape
+    # Potentials of the rows and columns, and for each column the row it is
+    # assigned to. Index 0 of the columns is a placeholder for the row being
+    # added, so real rows and columns are numbered from 1.
+    row_potential = np.zeros(n + 1)
+    col_potential = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=int)
+    for row in range(1, n + 1):
+        owner[0] = row
+        col = 0
+        slack = np.full(m + 1, np.inf)
+        previous = np.zeros(m + 1, dtype=int)
+        used = np.zeros(m + 1, dtype=bool)
+        while owner[col] != 0:
+            used[col] = True
+            reduced = cost[owner[col] - 1] - row_potential[owner[col]] - \
+                col_potential[1:]
+            better = ~used[1:] & (reduced < slack[1:])
+            slack[1:][better] = reduced[better]
+            previous[1:][better] = col
+            candidates = np.where(used[1:], np.inf, slack[1:])
+            next_col = int(np.argmin(candidates)) + 1
+            delta = candidates[next_col - 1]
+            row_potential[owner[used]] += delta
+            col_potential[used] -= delta
+            slack[~used] -= delta
+            col = next_col
+        while col != 0:
+            owner[col] = owner[previous[col]]
+            col = previous[col]
+    cols = np.flatnonzero(owner[1:])
+    rows = owner[1:][cols] - 1
+    order = np.argsort(rows)
+    return rows[order], cols[order]
+
+
+def _manhattan_times(drivers: List[Driver],
+                     passengers: List[Passenger]) -> np.ndarray:
+    """Return the travel time of each of <drivers> to each of <passengers>
+    over Manhattan distances, one row per driver.
+
+    """
+    driver_rows = np.array([d.location.row for d in drivers])
+    driver_cols = np.array([d.location.column for d in drivers])
+    speeds = np.array([d.get_speed() for d in drivers])
+    passenger_rows = np.array([p.origin.row for p in passengers])
+    passenger_cols = np.array([p.origin.column for p in passengers])
+    distance = np.abs(driver_rows[:, None] - passenger_rows[None, :]) + \
+        np.abs(driver_cols[:, None] - passenger_cols[None, :])
+    # np.round rounds halves to even, just like Driver.get_travel_time.
+    return np.round(distance / speeds[:, None])
+
+
+def _oracle_times(oracle: TravelTimeOracle, drivers: List[Driver],
+                  passengers: List[Passenger]) -> np.ndarray:
+    """Return the travel time of each of <drivers> to each of <passengers>
+    from <oracle>, one row per driver, with infinity for each driver that
+    cannot reach a passenger.
+    """
+    travel_time = np.full((len(drivers), len(passengers)), np.inf)
+    for row, driver in enumerate(drivers):
+        for col, passenger in enumerate(passengers):
+            try:
+                travel_time[row, col] = oracle.travel_time(
+                    driver.location, passenger.origin, driver.get_speed())
+            except ValueError:
+                pass
+    return travel_time
+
+
+class BatchDispatcher(Dispatcher):
+    """A dispatcher that collects requests over a window of time, and then
+    assigns them all at once.
+
+    Passenger and driver requests only put the passenger on the waiting list
+    or register the driver. At the end of each window, a Dispatch event
+    assigns the waiting passengers to the idle drivers so that the total
+    travel time of the drivers to their passengers is as small as possible.
+
+    === Attributes ===
+    window: The length of the windows requests are collected over. With a
+        window of 0, requests are collected until every event with the same
+        timestamp has been done.
+    """
+
+    window: int
+
+    # === Private Attributes ===
+    _next_batch: Optional[int]
+    #     The time of the Dispatch event that is waiting to be done, or None
+    #     if there isn't one.
+
+    def __init__(self, window: int = 0,
+                 oracle: Optional[TravelTimeOracle] = None) -> None:
+        """Initialize a BatchDispatcher.
+
+        >>> BatchDispatcher(5).window
+        5
+        """
+        super().__init__(oracle)
+        self.window = window
+        self._next_batch = None
+
+    def request_driver(self, passenger: Passenger) -> Optional[Driver]:
+        """Add the passenger to the waiting list for the next batch, and
+        return None.
+
+        """
+        if passenger.id not in self._waiting_passengers:
+            self._waiting_passengers[passenger.id] = passenger
+        return None
+
+    def request_passenger(self, driver: Driver) -> Optional[Passenger]:
+        """Register the driver, if this is a new driver, and return None. The
+        driver is assigned a passenger in the next batch if it is still idle.
+
+        """
+        self._register(driver)
+        return None
+
+    def next_dispatch(self, timestamp: int) -> Optional[int]:
+        """Return the end of the window containing <timestamp>, if no batch
+        has been scheduled yet, or None otherwise.
+
+        >>> dispatcher = BatchDispatcher(5)
+        >>> dispatcher.next_dispatch(7), dispatcher.next_dispatch(8)
+        (10, None)
+        """
+        if self._next_batch is not None:
+            return None
+        if self.window == 0:
+            self._next_batch = timestamp
+        else:
+            self._next_batch = (timestamp // self.window + 1) * self.window
+        return self._next_batch
+
+    def dispatch(self) -> List[Tuple[Driver, Passenger]]:
+        """Assign waiting passengers to idle drivers with the smallest total
+        travel time, and return the (driver, passenger) pairs.
+
+        Passengers who are not assigned a driver stay on the waiting list in
+        the same order. A driver is never assigned a passenger it cannot
+        reach, so a passenger no idle driver can reach keeps waiting.
+        """
+        self._next_batch = None
+        drivers = list(self._idle)
+        passengers = list(self._waiting_passengers.values())
+        if not drivers or not passengers:
+            return []
+        self._idle.scanned += len(drivers) * len(passengers)
+        if self._oracle.is_manhattan():
+            travel_time = _manhattan_times(drivers, passengers)
+        else:
+            travel_time = _oracle_times(self._oracle, drivers, passengers)
+        reachable = np.isfinite(travel_time)
+        if not reachable.all():
+            # An unreachable pair costs more than every reachable pair
+            # together, so the assignment pairs as many drivers as it can
+            # before it minimizes their travel time.
+            travel_time[~reachable] = travel_time[reachable].sum() + 1
+        pairs = []
+        for row, col in zip(*min_cost_assignment(travel_time)):
+            if not reachable[row, col]:
+                continue
+            passenger = passengers[col]
+            del self._waiting_passengers[passenger.id]
+            pairs.append((drivers[row], passenger))
+        return pairs
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={'extra-imports': ['typing', 'numpy', 'dispatcher', 'driver',
+                                  'oracle', 'passenger']})
@@ -0,0 +1,365 @@
+"""
+The benchmarks module times the hot paths of the simulation.
+
+Each benchmark builds its input from a seeded Workload, so every run times
+the same work, and reports the best time over a few repeats together with
+the number of operations it did. Results are saved as JSON, and a run can be
+compared against a saved baseline to find benchmarks that got slower.
+
+Usage:
+    python benchmarks.py [--scale N ...] [--output FILE]
+                         [--baseline FILE] [--threshold FRACTION]
+
+For example, to compare the two ways of loading a 10M-line events file:
+    python benchmarks.py --scale 10000000 --only parse_events load_columns
+
+=== Constants ===
+SCALES: The default numbers of events each benchmark is run with.
+BENCHMARKS: The benchmarks, keyed by name.
+THRESHOLD: The default fraction by which a benchmark must be slower than
+    its baseline to count as a regression.
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from columnar import load_event_columns
+from container import PriorityQueue, CalendarQueue
+from dispatcher import Dispatcher
+from event import Event, DriverRequest, PassengerRequest, create_event_list
+from monitor import Monitor, PASSENGER, DRIVER, REQUEST, PICKUP, DROPOFF
+from simulation import Simulation
+from workload import Hotspot, Workload, write_events
+from location import Location
+
+SCALES = (1000, 100000)
+THRESHOLD = 0.1
+
+# A benchmark takes a scale and returns a function that builds fresh input,
+# a function that does the timed work on that input, and the number of
+# operations the work does.
+Benchmark = Callable[[int], Tuple[Callable[[], object],
+                                  Callable[[object], None], int]]
+
+
+def _workload(scale: int) -> Workload:
+    """Return a workload with about <scale> events.
+
+    """
+    drivers = max(scale // 20, 1)
+    duration = 1440
+    return Workload(drivers=drivers, duration=duration,
+                    demand=[(scale - drivers) / duration],
+                    hotspots=[Hotspot(Location(30, 30), 5.0, 2.0),
+                              Hotspot(Location(70, 60), 8.0)],
+                    speeds=[(1, 1.0), (2, 2.0), (3, 1.0)])
+
+
+def _passengers(scale: int) -> List[PassengerRequest]:
+    """Return about <scale> passenger requests.
+
+    """
+    return [e for e in _workload(scale).events(0)
+            if isinstance(e, PassengerRequest)]
+
+
+def _timestamps(scale: int) -> List[Event]:
+    """Return <scale> events with shuffled timestamps.
+
+    """
+    rng = random.Random(0)
+    return [Event(rng.randrange(scale)) for _ in range(scale)]
+
+
+def _drain(queue: object) -> None:
+    """Remove every item from <queue>.
+
+    """
+    while not queue.is_empty():
+        queue.remove()
+
+
+def bench_priority_queue(scale: int) -> tuple:
+    """Time adding <scale> events to a PriorityQueue one at a time and then
+    removing them all.
+
+    """
+    events = _timestamps(scale)
+
+    def work(queue: PriorityQueue) -> None:
+        for event in events:
+            queue.add(event)
+        _drain(queue)
+    return PriorityQueue, work, 2 * scale
+
+
+def bench_calendar_queue(scale: int) -> tuple:
+    """Time adding <scale> events to a CalendarQueue one at a time and then
+    removing them all.
+
+    """
+    events = _timestamps(scale)
+
+    def work(queue: CalendarQueue) -> None:
+        for event in events:
+            queue.add(event)
+        _drain(queue)
+    return CalendarQueue, work, 2 * scale
+
+
+def bench_request_driver(scale: int) -> tuple:
+    """Time nearest-driver requests for about <scale> passengers against a
+    fleet of idle drivers.
+
+    """
+    workload = _workload(scale)
+    events = list(workload.events(0))
+    drivers = [e.driver for e in events if isinstance(e, DriverRequest)]
+    passengers = [e.passenger for e in events
+                  if isinstance(e, PassengerRequest)]
+
+    def setup() -> Dispatcher:
+        dispatcher = Dispatcher()
+        for driver in drivers:
+            dispatcher.request_passenger(driver)
+        return dispatcher
+
+    def work(dispatcher: Dispatcher) -> None:
+        for passenger in passengers:
+            dispatcher.request_driver(passenger)
+    return setup, work, len(passengers)
+
+
+def bench_cancel_ride(scale: int) -> tuple:
+    """Time cancelling about <scale> waiting passengers in random order.
+
+    """
+    passengers = [e.passenger for e in _passengers(scale)]
+    order = passengers[:]
+    random.Random(0).shuffle(order)
+
+    def setup() -> Dispatcher:
+        dispatcher = Dispatcher()
+        for passenger in passengers:
+            dispatcher.request_driver(passenger)
+        return dispatcher
+
+    def work(dispatcher: Dispatcher) -> None:
+        for passenger in order:
+            dispatcher.cancel_ride(passenger)
+    return setup, work, len(order)
+
+
+def bench_parse_events(scale: int) -> tuple:
+    """Time create_event_list on an events file of about <scale> events.
+
+    """
+    # The file is deleted once the benchmark, which holds it, is discarded.
+    file = tempfile.NamedTemporaryFile(suffix=".txt")
+    count = write_events(_workload(scale).events(0), file.name)
+
+    def work(_: object) -> None:
+        create_event_list(file.name)
+    return lambda: None, work, count
+
+
+def bench_load_columns(scale: int) -> tuple:
+    """Time load_event_columns on the same events file as parse_events.
+
+    """
+    file = tempfile.NamedTemporaryFile(suffix=".txt")
+    count = write_events(_workload(scale).events(0), file.name)
+
+    def work(_: object) -> None:
+        load_event_columns(file.name)
+    return lambda: None, work, count
+
+
+def bench_monitor_notify(scale: int) -> tuple:
+    """Time notifying a Monitor of a request and a pickup for about <scale>
+    passengers, and of the matching driver activities.
+
+    """
+    passengers = [e.passenger for e in _passengers(scale)]
+
+    def work(monitor: Monitor) -> None:
+        for n, passenger in enumerate(passengers):
+            driver = f"d{n % 50}"
+            monitor.notify(n, PASSENGER, REQUEST, passenger.id,
+                           passenger.origin)
+            monitor.notify(n, DRIVER, PICKUP, driver, passenger.origin)
+            monitor.notify(n + 1, PASSENGER, PICKUP, passenger.id,
+                           passenger.origin)
+            monitor.notify(n + 2, DRIVER, DROPOFF, driver,
+                           passenger.destination)
+    return lambda: Monitor(history=False), work, 4 * len(passengers)
+
+
+def bench_monitor_report(scale: int) -> tuple:
+    """Time <scale> calls to Monitor.report on a monitor with activities.
+
+    """
+    def setup() -> Monitor:
+        monitor = Monitor()
+        for n, passenger in enumerate(e.passenger for e in _passengers(1000)):
+            monitor.notify(n, PASSENGER, REQUEST, passenger.id,
+                           passenger.origin)
+            monitor.notify(n + 1, PASSENGER, PICKUP, passenger.id,
+                           passenger.origin)
+            monitor.notify(n, DRIVER, REQUEST, f"d{n}", passenger.origin)
+        return monitor
+
+    def work(monitor: Monitor) -> None:
+        for _ in range(scale):
+            monitor.report()
+    return setup, work, scale
+
+
+def bench_simulation(scale: int) -> tuple:
+    """Time a whole Simulation.run over a streamed workload of about <scale>
+    events. The time includes generating the events, so that no scale has
+    to fit in memory.
+
+    """
+    workload = _workload(scale)
+    count = sum(1 for _ in workload.events(0))
+
+    def work(simulation: Simulation) -> None:
+        simulation.run(workload.events(0), presorted=True)
+    return lambda: Simulation(monitor=Monitor(history=False)), work, count
+
+
+BENCHMARKS: Dict[str, Benchmark] = {
+    "priority_queue": bench_priority_queue,
+    "calendar_queue": bench_calendar_queue,
+    "request_driver": bench_request_driver,
+    "cancel_ride": bench_cancel_ride,
+    "parse_events": bench_parse_events,
+    "load_columns": bench_load_columns,
+    "monitor_notify": bench_monitor_notify,
+    "monitor_report": bench_monitor_report,
+    "simulation": bench_simulation,
+}
+
+
+def time_benchmark(benchmark: Benchmark, scale: int,
+                   repeat: int = 3) -> Dict[str, float]:
+    """Run <benchmark> at <scale> <repeat> times, and return its best time,
+    its number of operations and the time per operation in nanoseconds.
+
+    >>> result = time_benchmark(bench_cancel_ride, 100, repeat=1)
+    >>> sorted(result)
+    ['nanoseconds_per_operation', 'operations', 'seconds']
+    """
+    setup, work, operations = benchmark(scale)
+    best = float("inf")
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        work(state)
+        best = min(best, time.perf_counter() - start)
+    return {"seconds": best, "operations": operations,
+            "nanoseconds_per_operation": best * 1e9 / max(operations, 1)}
+
+
+def run_benchmarks(scales: Tuple[int, ...] = SCALES,
+                   names: Optional[List[str]] = None,
+                   repeat: int = 3) -> Dict[str, object]:
+    """Run the benchmarks called <names>, or all of them, at every scale in
+    <scales>, and return the results in the form saved as JSON.
+
+    Results are keyed like 'priority_queue@1000'.
+    """
+    results = {}
+    for name in BENCHMARKS if names is None else names:
+        for scale in scales:
+            results[f"{name}@{scale}"] = time_benchmark(BENCHMARKS[name],
+                                                        scale, repeat)
+    return {"python": platform.python_version(),
+            "machine": platform.machine(),
+            "scales": list(scales),
+            "results": results}
+
+
+def compare(current: Dict[str, object], baseline: Dict[str, object],
+            threshold: float = THRESHOLD) -> List[Tuple[str, float]]:
+    """Return the benchmarks in both <current> and <baseline> whose time per
+    operation grew by more than <threshold>, each with the ratio of its
+    current time to its baseline time, slowest first.
+
+    >>> old = {"results": {"a@1": {"nanoseconds_per_operation": 100.0},
+    ...                    "b@1": {"nanoseconds_per_operation": 100.0}}}
+    >>> new = {"results": {"a@1": {"nanoseconds_per_operation": 150.0},
+    ...                    "b@1": {"nanoseconds_per_operation": 105.0}}}
+    >>> compare(new, old)
+    [('a@1', 1.5)]
+    """
+    slower = []
+    for key, result in current["results"].items():
+        before = baseline["results"].get(key)
+        if before is None or before["nanoseconds_per_operation"] <= 0:
+            continue
+        ratio = result["nanoseconds_per_operation"] / \
+            before["nanoseconds_per_operation"]
+        if ratio > 1 + threshold:
+            slower.append((key, ratio))
+    slower.sort(key=lambda item: item[1], reverse=True)
+    return slower
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run the benchmarks from the command line <argv>, print the results,
+    and return 1 if any benchmark regressed against the baseline, or 0
+    otherwise.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Time the simulation hot paths.")
+    parser.add_argument("--scale", type=int, nargs="+", default=list(SCALES),
+                        help="numbers of events, such as 1000 100000 "
+                             "10000000")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS),
+                        default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None,
+                        help="JSON file to save the results to")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    args = parser.parse_args(argv)
+
+    current = run_benchmarks(tuple(args.scale), args.only, args.repeat)
+    for key, result in current["results"].items():
+        print(f"{key:32} {result['seconds']:10.4f} s "
+              f"{result['nanoseconds_per_operation']:12.1f} ns/op")
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(current, file, indent=2)
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    slower = compare(current, baseline, args.threshold)
+    for key, ratio in slower:
+        print(f"REGRESSION {key}: {ratio:.2f}x the baseline time")
+    return 1 if slower else 0
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'allowed-io': ['main'],
+            'extra-imports': ['argparse', 'json', 'platform', 'random',
+                              'sys', 'tempfile', 'time', 'typing',
+                              'columnar', 'container', 'dispatcher', 'event',
+                              'monitor', 'simulation', 'workload',
+                              'location']})
+
+    sys.exit(main())
@@ -0,0 +1,240 @@
+"""
+The columnar module stores events and activities in typed arrays, one array
+per field, instead of as Python objects.
+
+Events files are loaded into NumPy arrays, and Events are only built when they
+are needed, so a large file costs a few bytes per event until the simulation
+consumes it. The columnar_monitor module keeps activities the same way.
+
+=== Constants ===
+DRIVER_REQUEST: The event type code for a DriverRequest.
+PASSENGER_REQUEST: The event type code for a PassengerRequest.
+"""
+
+from typing import Iterator, List
+import numpy as np
+from driver import Driver
+from event import Event, DriverRequest, PassengerRequest
+from location import Location, deserialize_locations
+from passenger import Passenger
+
+DRIVER_REQUEST = 0
+PASSENGER_REQUEST = 1
+
+# The number of whitespace or comma separated fields on each kind of line.
+_DRIVER_FIELDS = 6
+_PASSENGER_FIELDS = 8
+
+# Maps the whitespace characters other than spaces and newlines to spaces.
+_SPACES = str.maketrans("\t\r\v\f", "    ")
+
+# The array type of lines of text, which stores each line at its own length.
+_TEXT = np.dtypes.StringDType()
+
+
+class EventColumns:
+    """The events of an events file, stored column by column.
+
+    Row i of every column describes the i-th event of the file. Columns that
+    don't apply to an event type hold -1.
+
+    === Attributes ===
+    names: The distinct driver and passenger ids in the file.
+    timestamp: The timestamp of each event.
+    kind: The event type code of each event.
+    ident: The index in names of the id of each event's driver or passenger.
+    origin_row: The row of the driver location or passenger origin.
+    origin_col: The column of the driver location or passenger origin.
+    destination_row: The row of the passenger destination.
+    destination_col: The column of the passenger destination.
+    speed: The speed of the driver.
+    patience: The patience of the passenger.
+    """
+
+    names: List[str]
+    timestamp: np.ndarray
+    kind: np.ndarray
+    ident: np.ndarray
+    origin_row: np.ndarray
+    origin_col: np.ndarray
+    destination_row: np.ndarray
+    destination_col: np.ndarray
+    speed: np.ndarray
+    patience: np.ndarray
+
+    def __init__(self, names: List[str], columns: np.ndarray) -> None:
+        """Initialize EventColumns from the ids in the file and a 2D array
+        whose columns are timestamp, kind, ident, origin_row, origin_col,
+        destination_row, destination_col, speed and patience.
+
+        """
+        self.names = names
+        self.timestamp, self.kind, self.ident, self.origin_row, \
+            self.origin_col, self.destination_row, self.destination_col, \
+            self.speed, self.patience = columns.T
+
+    def __len__(self) -> int:
+        """Return the number of events.
+
+        """
+        return len(self.timestamp)
+
+    def event(self, index: int) -> Event:
+        """Return a new Event for the event at <index>.
+
+        """
+        timestamp = int(self.timestamp[index])
+        name = self.names[self.ident[index]]
+        origin = Location(int(self.origin_row[index]),
+                          int(self.origin_col[index]))
+        if self.kind[index] == DRIVER_REQUEST:
+            return DriverRequest(timestamp, Driver(name, origin,
+                                                   int(self.speed[index])))
+        destination = Location(int(self.destination_row[index]),
+                               int(self.destination_col[index]))
+        return PassengerRequest(timestamp, Passenger(
+            name, int(self.patience[index]), origin, destination))
+
+    def __iter__(self) -> Iterator[Event]:
+        """Yield a new Event for each event, in file order.
+
+        """
+        for index in range(len(self)):
+            yield self.event(index)
+
+    def sorted_events(self) -> Iterator[Event]:
+        """Yield a new Event for each event, in timestamp order.
+
+        Events with equal timestamps stay in file order, so this can be passed
+        to Simulation.run with presorted=True.
+        """
+        for index in np.argsort(self.timestamp, kind='stable'):
+            yield self.event(index)
+
+
+def _check_lines(lines: List[str], line_numbers: List[int]) -> None:
+    """Raise ValueError naming the first of <lines> that is malformed.
+
+    """
+    for line, line_number in zip(lines, line_numbers):
+        tokens = line.split()
+        expected = 5 if tokens[1] == "DriverRequest" else 6
+        if len(tokens) != expected:
+            raise ValueError(f"line {line_number}: expected {expected} "
+                             f"fields, found {len(tokens)}")
+        location_end = 4 if expected == 5 else 5
+        deserialize_locations(tokens[3:location_end],
+                              [line_number] * (location_end - 3))
+        for token in [tokens[0], tokens[-1]]:
+            try:
+                int(token)
+            except ValueError:
+                raise ValueError(f"line {line_number}: invalid integer "
+                                 f"{token!r}") from None
+
+
+def _fields(lines: List[str], line_numbers: List[int],
+            width: int) -> List[str]:
+    """Return the fields of <lines>, <width> per line, splitting on both
+    whitespace and commas.
+
+    """
+    tokens = ' '.join(lines).replace(',', ' ').split()
+    if len(tokens) != width * len(lines):
+        _check_lines(lines, line_numbers)
+    return tokens
+
+
+def _integers(tokens: List[str], width: int, lines: List[str],
+              line_numbers: List[int]) -> np.ndarray:
+    """Return every field of <tokens> but the event type and id, converted
+    to integers, as a 2D array with one row per line of <width> fields.
+
+    """
+    # Each column is parsed in one call, rather than one token at a time.
+    columns = []
+    for column in range(width):
+        if column not in (1, 2):
+            try:
+                values = np.fromstring(' '.join(tokens[column::width]),
+                                       dtype=np.int64, sep=' ')
+            except ValueError:
+                _check_lines(lines, line_numbers)
+                raise
+            if len(values) != len(lines):
+                _check_lines(lines, line_numbers)
+            columns.append(values)
+    return np.stack(columns, axis=1)
+
+
+def load_event_columns(filename: str) -> EventColumns:
+    """Return the events in <filename> as EventColumns.
+
+    Blank lines and lines that start with '#' are skipped, as is any line
+    that is not a DriverRequest or PassengerRequest, and fields may be
+    separated by any whitespace, just like iter_events. A file with no
+    events gives empty columns. Raise ValueError naming the line of any
+    malformed event.
+
+    Precondition: the file stored at <filename> is in the format specified
+    by the assignment handout.
+
+    >>> columns = load_event_columns('events.txt')
+    >>> len(columns)
+    12
+    >>> columns.names[columns.ident[0]]
+    'Amaranth'
+    """
+    # Tabs and other whitespace become spaces across the whole text at once,
+    # so the lines below only need to be searched for spaces.
+    with open(filename, "r") as file:
+        text = file.read().translate(_SPACES)
+    lines = np.strings.lstrip(np.array(text.split("\n"), dtype=_TEXT))
+    line_numbers = np.arange(1, len(lines) + 1)
+    # The event type is the start of whatever follows the first space.
+    rest = np.strings.lstrip(
+        np.strings.partition(lines, np.array(" ", dtype=_TEXT))[2])
+    is_event = ~np.strings.startswith(lines, "#")
+    is_driver = is_event & np.strings.startswith(rest, "DriverRequest ")
+    is_passenger = is_event & np.strings.startswith(rest,
+                                                    "PassengerRequest ")
+    if not (is_driver.any() or is_passenger.any()):
+        return EventColumns([], np.empty((0, 9), dtype=np.int64))
+
+    parts = []
+    names = []
+    for mask, kind, width in [(is_driver, DRIVER_REQUEST, _DRIVER_FIELDS),
+                              (is_passenger, PASSENGER_REQUEST,
+                               _PASSENGER_FIELDS)]:
+        kept = lines[mask].tolist()
+        kept_numbers = line_numbers[mask].tolist()
+        tokens = _fields(kept, kept_numbers, width)
+        numbers = _integers(tokens, width, kept, kept_numbers)
+        part = np.full((len(kept), 10), -1, dtype=np.int64)
+        part[:, 0] = line_numbers[mask]
+        part[:, 1] = numbers[:, 0]
+        part[:, 2] = kind
+        part[:, 4:6] = numbers[:, 1:3]
+        if kind == DRIVER_REQUEST:
+            part[:, 8] = numbers[:, 3]
+        else:
+            part[:, 6:8] = numbers[:, 3:5]
+            part[:, 9] = numbers[:, 5]
+        parts.append(part)
+        names.append(tokens[2::width])
+
+    unique, ident = np.unique(np.concatenate(names), return_inverse=True)
+    columns = np.concatenate(parts)
+    columns[:, 3] = ident
+    columns = columns[np.argsort(columns[:, 0], kind='stable')]
+    return EventColumns(unique.tolist(), columns[:, 1:])
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'allowed-io': ['load_event_columns'],
+            'extra-imports': ['typing', 'numpy', 'driver', 'event',
+                              'location', 'passenger']})
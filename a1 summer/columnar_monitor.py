@@ -0,0 +1,225 @@
+"""
+The columnar_monitor module contains the ColumnarMonitor, which keeps the
+activities of a simulation in typed arrays, one array per field, instead of
+as Activity objects, and computes its report with vectorized operations.
+"""
+
+from __future__ import annotations
+from array import array
+from typing import Dict, Iterable, Tuple
+import numpy as np
+from location import Location
+from monitor import PASSENGER, DRIVER, REQUEST, CANCEL, PICKUP, DROPOFF, \
+    QUANTILES
+
+# The codes stored for activity categories and descriptions.
+_CATEGORIES = {PASSENGER: 0, DRIVER: 1}
+_DESCRIPTIONS = {REQUEST: 0, CANCEL: 1, PICKUP: 2, DROPOFF: 3}
+
+
+class ColumnarMonitor:
+    """A monitor that keeps every activity in typed columns.
+
+    Recording an activity appends one number to each column, which is much
+    smaller than an Activity object and a list entry. The report is computed
+    at the end with vectorized operations over all activities of each actor,
+    and gives the same statistics as a Monitor, so a ColumnarMonitor can be
+    given to a Simulation in place of one. Distances are Manhattan distances.
+    """
+
+    # === Private Attributes ===
+    _time: array
+    #       The time of each activity.
+    _category: array
+    #       The category code of each activity.
+    _description: array
+    #       The description code of each activity.
+    _actor: array
+    #       The index in _actors of the identifier of each activity.
+    _row: array
+    #       The row of the location of each activity.
+    _col: array
+    #       The column of the location of each activity.
+    _actors: Dict[str, Dict[str, int]]
+    #       A dictionary whose key is a category, and value is another
+    #       dictionary. The key of the second dictionary is an identifier
+    #       and its value is the index of that actor within the category.
+
+    def __init__(self) -> None:
+        """Initialize a ColumnarMonitor.
+
+        """
+        self._time = array('q')
+        self._category = array('b')
+        self._description = array('b')
+        self._actor = array('i')
+        self._row = array('q')
+        self._col = array('q')
+        self._actors = {PASSENGER: {}, DRIVER: {}}
+
+    def __str__(self) -> str:
+        """Return a string representation.
+
+        """
+        return f"Monitor ({len(self._actors[DRIVER])} drivers, " \
+               f"{len(self._actors[PASSENGER])} passengers)"
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        """Notify the monitor of the activity.
+
+        timestamp: The time of the activity.
+        category: The category (DRIVER or PASSENGER) for the activity.
+        description: A description (REQUEST | CANCEL | PICKUP | DROPOFF)
+            of the activity.
+        identifier: The identifier for the actor.
+        location: The location of the activity.
+        """
+        actors = self._actors[category]
+        actor = actors.get(identifier)
+        if actor is None:
+            actor = actors[identifier] = len(actors)
+        self._time.append(timestamp)
+        self._category.append(_CATEGORIES[category])
+        self._description.append(_DESCRIPTIONS[description])
+        self._actor.append(actor)
+        self._row.append(location.row)
+        self._col.append(location.column)
+
+    def notify_all(self, timestamp: int, category: str, description: str,
+                   actors: Iterable[Tuple[str, Location]]) -> None:
+        """Notify the monitor of the same activity by each of <actors>, in
+        order. Each actor is an (identifier, location) pair.
+
+        >>> monitor = ColumnarMonitor()
+        >>> monitor.notify_all(0, PASSENGER, REQUEST,
+        ...                    [('a', Location(0, 0)), ('b', Location(1, 1))])
+        >>> print(monitor)
+        Monitor (0 drivers, 2 passengers)
+        """
+        notify = self.notify
+        for identifier, location in actors:
+            notify(timestamp, category, description, identifier, location)
+
+    def _by_actor(self, category: str) -> np.ndarray:
+        """Return the positions of the activities in <category>, grouped by
+        actor, and in the order they were recorded within each actor.
+
+        """
+        category_codes = np.frombuffer(self._category, dtype=np.int8)
+        positions = np.flatnonzero(category_codes == _CATEGORIES[category])
+        actors = np.frombuffer(self._actor, dtype=np.int32)
+        return positions[np.argsort(actors[positions], kind='stable')]
+
+    def _same_actor(self, order: np.ndarray) -> np.ndarray:
+        """Return whether each activity in <order> belongs to the same actor
+        as the activity after it.
+
+        """
+        actors = np.frombuffer(self._actor, dtype=np.int32)
+        return actors[order[:-1]] == actors[order[1:]]
+
+    def _waits(self) -> np.ndarray:
+        """Return the wait time of each passenger that has either been picked
+        up or has cancelled their trip.
+
+        """
+        order = self._by_actor(PASSENGER)
+        same = self._same_actor(order)
+        # A pair of activities is the first two of a passenger if they belong
+        # to the same passenger and the first one starts that passenger.
+        first_two = same.copy()
+        first_two[1:] &= ~same[:-1]
+        times = np.frombuffer(self._time, dtype=np.int64)
+        return times[order[1:][first_two]] - times[order[:-1][first_two]]
+
+    def _driver_legs(self) -> tuple[np.ndarray, np.ndarray, np.ndarray,
+                                    np.ndarray]:
+        """Return the distance between each pair of consecutive activities of
+        a driver, whether each of those legs starts at a pickup, whether each
+        ends at a pickup, and whether each ends at a dropoff.
+
+        """
+        order = self._by_actor(DRIVER)
+        same = self._same_actor(order)
+        order_from, order_to = order[:-1][same], order[1:][same]
+        rows = np.frombuffer(self._row, dtype=np.int64)
+        cols = np.frombuffer(self._col, dtype=np.int64)
+        distances = np.abs(rows[order_to] - rows[order_from]) + \
+            np.abs(cols[order_to] - cols[order_from])
+        descriptions = np.frombuffer(self._description, dtype=np.int8)
+        pickup = _DESCRIPTIONS[PICKUP]
+        return distances, descriptions[order_from] == pickup, \
+            descriptions[order_to] == pickup, \
+            descriptions[order_to] == _DESCRIPTIONS[DROPOFF]
+
+    def report(self) -> Dict[str, float]:
+        """Return a report of the activities that have occurred.
+
+        """
+        drivers = len(self._actors[DRIVER])
+        distances, on_trip, _, _ = self._driver_legs()
+        total = int(distances.sum())
+        trip = int(distances[on_trip].sum())
+        return {"average_passenger_wait_time": self._average_wait_time(),
+                "average_driver_total_distance":
+                    total / drivers if drivers else 0,
+                "average_driver_trip_distance":
+                    trip / drivers if drivers else 0}
+
+    def percentiles(self) -> Dict[str, float]:
+        """Return the exact QUANTILES of passenger wait time, driver pickup
+        distance and driver trip distance, keyed like
+        'passenger_wait_time_p90'.
+
+        """
+        distances, on_trip, to_pickup, to_dropoff = self._driver_legs()
+        stats = {}
+        for name, values in [("passenger_wait_time", self._waits()),
+                             ("driver_pickup_distance",
+                              distances[to_pickup & ~on_trip]),
+                             ("driver_trip_distance",
+                              distances[on_trip & to_dropoff])]:
+            for q in QUANTILES:
+                stats[f"{name}_p{round(q * 100)}"] = float(np.quantile(
+                    values, q, method='inverted_cdf')) if len(values) else 0.0
+        return stats
+
+    def merge(self, other: ColumnarMonitor) -> None:
+        """Add the activities recorded by <other> to this monitor, after the
+        ones already recorded here.
+
+        """
+        actors = np.frombuffer(other._actor, dtype=np.int32).copy()
+        categories = np.frombuffer(other._category, dtype=np.int8)
+        for category, code in _CATEGORIES.items():
+            ours = self._actors[category]
+            mapping = np.zeros(len(other._actors[category]), dtype=np.int32)
+            for identifier, actor in other._actors[category].items():
+                mapping[actor] = ours.setdefault(identifier, len(ours))
+            mask = categories == code
+            actors[mask] = mapping[actors[mask]]
+        self._time.extend(other._time)
+        self._category.extend(other._category)
+        self._description.extend(other._description)
+        self._actor.frombytes(actors.tobytes())
+        self._row.extend(other._row)
+        self._col.extend(other._col)
+
+    def _average_wait_time(self) -> float:
+        """Return the average wait time of passengers that have either been
+        picked up or have cancelled their trip.
+
+        """
+        waits = self._waits()
+        if len(waits) == 0:
+            return 0
+        return int(waits.sum()) / len(waits)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={'extra-imports': ['array', 'typing', 'numpy', 'location',
+                                  'monitor']})
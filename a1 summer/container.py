@@ -1,4 +1,15 @@
-"""Containers of objects"""
+"""Containers of objects
+
+=== Constants ===
+COMPACT_FRACTION: A queue is compacted once more than this fraction of the
+    items it stores have been discarded.
+"""
+
+from collections import deque
+from heapq import heapify, heappop, heappush
+from typing import Iterable
+
+COMPACT_FRACTION = 0.5
 
 
 class Container:
@@ -19,12 +30,51 @@ class Container:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def bulk_add(self, items: Iterable) -> None:
+        """Add every item in <items> to this Container, in order.
+
+        """
+        for item in items:
+            self.add(item)
+
+    def peek(self) -> object:
+        """Return the item that remove() would return, without removing it.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
     def is_empty(self) -> bool:
         """Return True iff this Container is empty.
 
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def __len__(self) -> int:
+        """Return the number of items in this Container.
+
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def discard(self, item: object) -> None:
+        """Remove <item> from this Container, wherever it is.
+
+        Precondition: <item> is in this Container, and was added once.
+        """
+        raise NotImplementedError("Implemented in a subclass")
+
+    def remove_batch(self) -> list:
+        """Remove and return every item with the same timestamp as the next
+        item, in the order remove() would return them.
+
+        Precondition: <self> should not be empty, and every item has an
+        integer timestamp attribute.
+        """
+        timestamp = self.peek().timestamp
+        batch = [self.remove()]
+        while not self.is_empty() and self.peek().timestamp == timestamp:
+            batch.append(self.remove())
+        return batch
+
 
 class PriorityQueue(Container):
     """A queue of items that operates in priority order.
@@ -44,18 +94,29 @@ class PriorityQueue(Container):
 
     # === Private Attributes ===
     _items: list
-
-    #     The items stored in the priority queue.
+    #     The entries stored in the priority queue. Each entry is a tuple
+    #     (item, sequence number).
+    _count: int
+    #     The sequence number given to the next item added to the queue.
+    _dead: set[int]
+    #     The ids of the items that have been discarded but are still stored
+    #     in _items. They are skipped when they reach the top of the heap.
     #
     # === Representation Invariants ===
-    # _items is a sorted list, where the first item in the queue is the
-    # item with the highest priority.
+    # _items is a binary min-heap of entries, so _items[0] is the entry of
+    # the item with the highest priority.
+    # Every id in _dead is the id of an item in _items, and the item in
+    # _items[0], if any, is not dead.
+    # Sequence numbers are unique and increase in insertion order, so two
+    # entries with equal items are ordered by when they were added.
 
     def __init__(self) -> None:
         """Initialize an empty PriorityQueue.
 
         """
         self._items = []
+        self._count = 0
+        self._dead = set()
 
     def remove(self) -> object:
         """Remove and return the next item from this PriorityQueue.
@@ -76,7 +137,23 @@ class PriorityQueue(Container):
         >>> pq.remove()
         'yellow'
         """
-        return self._items.pop(0)
+        item = heappop(self._items)[0]
+        if self._dead:
+            self._bury()
+        return item
+
+    def peek(self) -> object:
+        """Return the next item in this PriorityQueue without removing it.
+
+        Precondition: <self> should not be empty.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("red")
+        >>> pq.add("blue")
+        >>> pq.peek()
+        'blue'
+        """
+        return self._items[0][0]
 
     def is_empty(self) -> bool:
         """
@@ -91,6 +168,63 @@ class PriorityQueue(Container):
         """
         return len(self._items) == 0
 
+    def __len__(self) -> int:
+        """Return the number of items in this PriorityQueue.
+
+        >>> pq = PriorityQueue()
+        >>> pq.bulk_add(["red", "blue"])
+        >>> len(pq)
+        2
+        """
+        return len(self._items) - len(self._dead)
+
+    def discard(self, item: object) -> None:
+        """Remove <item> from this PriorityQueue in O(1) amortized time.
+
+        The item is marked dead and left in the heap until it reaches the
+        top, or until the dead items make up more than COMPACT_FRACTION of
+        the heap and it is rebuilt without them.
+
+        Precondition: <item> is in this PriorityQueue, and was added once.
+
+        >>> pq = PriorityQueue()
+        >>> pq.bulk_add(["red", "blue", "green"])
+        >>> pq.discard("blue")
+        >>> len(pq), pq.peek()
+        (2, 'green')
+        """
+        self._dead.add(id(item))
+        if len(self._dead) > COMPACT_FRACTION * len(self._items):
+            self._compact()
+        else:
+            self._bury()
+
+    def _bury(self) -> None:
+        """Pop dead items off the top of the heap.
+
+        """
+        items, dead = self._items, self._dead
+        while items and id(items[0][0]) in dead:
+            dead.remove(id(heappop(items)[0]))
+
+    def _compact(self) -> None:
+        """Rebuild the heap without its dead items.
+
+        """
+        dead = self._dead
+        self._items = [entry for entry in self._items
+                       if id(entry[0]) not in dead]
+        heapify(self._items)
+        dead.clear()
+
+    def __getstate__(self) -> dict:
+        """Return the state of this PriorityQueue for pickling.
+
+        Dead items are dropped first, since they are only known by id.
+        """
+        self._compact()
+        return self.__dict__
+
     def add(self, item: object) -> None:
         """Add <item> to this PriorityQueue.
 
@@ -99,24 +233,257 @@ class PriorityQueue(Container):
         >>> pq.add("blue")
         >>> pq.add("red")
         >>> pq.add("green")
-        >>> pq._items
+        >>> [entry[0] for entry in sorted(pq._items)]
         ['blue', 'green', 'red', 'yellow']
         """
-        if self.is_empty():
-            self._items.append(item)
+        heappush(self._items, (item, self._count))
+        self._count += 1
+
+    def bulk_add(self, items: Iterable) -> None:
+        """Add every item in <items> to this PriorityQueue, in order.
+
+        The heap is rebuilt once in linear time instead of sifting each item
+        in separately.
+
+        >>> pq = PriorityQueue()
+        >>> pq.add("red")
+        >>> pq.bulk_add(["blue", "red", "green"])
+        >>> [pq.remove() for _ in range(4)]
+        ['blue', 'green', 'red', 'red']
+        """
+        count = self._count
+        for item in items:
+            self._items.append((item, count))
+            count += 1
+        self._count = count
+        heapify(self._items)
+
+
+class CalendarQueue(Container):
+    """A queue of timestamped items that operates in timestamp order.
+
+    Items are removed in increasing order of their integer <timestamp>
+    attribute. Ties are resolved in FIFO order, just like PriorityQueue, so
+    the two can be used interchangeably for simulation events.
+
+    Items are kept in one bucket per timestamp. Adding to a timestamp that
+    already has a bucket, and removing anything but the last item of a
+    bucket, are O(1). Only creating or emptying a bucket touches the ordered
+    index of timestamps, which costs O(log d) for d pending timestamps. When
+    many items share few timestamps, as they do in the simulation, both
+    operations are amortized O(1) per item.
+    """
+
+    # === Private Attributes ===
+    _buckets: dict[int, deque]
+    #     A dictionary whose key is a timestamp, and value is the items with
+    #     that timestamp in the order they were added.
+    _times: list[int]
+    #     A binary min-heap of the timestamps that have a bucket.
+    _size: int
+    #     The number of items in the queue, not counting discarded ones.
+    _dead: set[int]
+    #     The ids of the items that have been discarded but are still stored
+    #     in a bucket. They are skipped when they reach the front of it.
+    #
+    # === Representation Invariants ===
+    # Every bucket in _buckets is non-empty.
+    # _times contains exactly the keys of _buckets, each once.
+    # _size plus the size of _dead is the total number of items across all
+    # buckets.
+    # Every id in _dead is the id of an item in a bucket, and the first item
+    # of the bucket of _times[0], if any, is not dead.
+
+    def __init__(self) -> None:
+        """Initialize an empty CalendarQueue.
+
+        """
+        self._buckets = {}
+        self._times = []
+        self._size = 0
+        self._dead = set()
+
+    def add(self, item: object) -> None:
+        """Add <item> to this CalendarQueue.
+
+        Precondition: <item> has an integer timestamp attribute.
+
+        >>> from event import Event
+        >>> cq = CalendarQueue()
+        >>> cq.add(Event(4))
+        >>> cq.add(Event(2))
+        >>> cq.remove().timestamp
+        2
+        """
+        timestamp = item.timestamp
+        bucket = self._buckets.get(timestamp)
+        if bucket is None:
+            bucket = self._buckets[timestamp] = deque()
+            heappush(self._times, timestamp)
+        bucket.append(item)
+        self._size += 1
+
+    def bulk_add(self, items: Iterable) -> None:
+        """Add every item in <items> to this CalendarQueue, in order.
+
+        The timestamp index is rebuilt once instead of being updated for each
+        new timestamp.
+
+        Precondition: every item has an integer timestamp attribute.
+        """
+        buckets = self._buckets
+        for item in items:
+            bucket = buckets.get(item.timestamp)
+            if bucket is None:
+                bucket = buckets[item.timestamp] = deque()
+            bucket.append(item)
+            self._size += 1
+        self._times = list(buckets)
+        heapify(self._times)
+
+    def remove(self) -> object:
+        """Remove and return the next item from this CalendarQueue.
+
+        Precondition: <self> should not be empty.
+
+        >>> from event import Event
+        >>> first, second = Event(3), Event(3)
+        >>> cq = CalendarQueue()
+        >>> cq.bulk_add([first, Event(5), second])
+        >>> cq.remove() is first
+        True
+        >>> cq.remove() is second
+        True
+        """
+        timestamp = self._times[0]
+        bucket = self._buckets[timestamp]
+        item = bucket.popleft()
+        if not bucket:
+            del self._buckets[timestamp]
+            heappop(self._times)
+        self._size -= 1
+        if self._dead:
+            self._bury()
+        return item
+
+    def peek(self) -> object:
+        """Return the next item in this CalendarQueue without removing it.
+
+        Precondition: <self> should not be empty.
+        """
+        return self._buckets[self._times[0]][0]
+
+    def is_empty(self) -> bool:
+        """Return True iff this CalendarQueue is empty.
+
+        >>> cq = CalendarQueue()
+        >>> cq.is_empty()
+        True
+        """
+        return self._size == 0
+
+    def __len__(self) -> int:
+        """Return the number of items in this CalendarQueue.
+
+        """
+        return self._size
+
+    def discard(self, item: object) -> None:
+        """Remove <item> from this CalendarQueue in O(1) amortized time.
+
+        The item is marked dead and left in its bucket until it reaches the
+        front, or until the dead items make up more than COMPACT_FRACTION of
+        the queue and the buckets are rebuilt without them.
+
+        Precondition: <item> is in this CalendarQueue, and was added once.
+
+        >>> from event import Event
+        >>> first, second = Event(3), Event(3)
+        >>> cq = CalendarQueue()
+        >>> cq.bulk_add([first, second, Event(5)])
+        >>> cq.discard(first)
+        >>> len(cq), cq.peek() is second
+        (2, True)
+        """
+        self._dead.add(id(item))
+        self._size -= 1
+        if len(self._dead) > COMPACT_FRACTION * (self._size + len(self._dead)):
+            self._compact()
+        else:
+            self._bury()
+
+    def remove_batch(self) -> list:
+        """Remove and return every item with the earliest timestamp, in the
+        order they were added.
+
+        The whole bucket is taken at once.
+
+        Precondition: <self> should not be empty.
+
+        >>> from event import Event
+        >>> first, second = Event(3), Event(3)
+        >>> cq = CalendarQueue()
+        >>> cq.bulk_add([first, Event(5), second])
+        >>> cq.remove_batch() == [first, second], len(cq)
+        (True, 1)
+        """
+        timestamp = heappop(self._times)
+        bucket = self._buckets.pop(timestamp)
+        if self._dead:
+            dead = self._dead
+            batch = []
+            for item in bucket:
+                if id(item) in dead:
+                    dead.remove(id(item))
+                else:
+                    batch.append(item)
+            self._bury()
         else:
-            for x in range(len(self._items)):
-                if item < self._items[x]:
-                    self._items.insert(x, item)
-                    break
-                elif item == self._items[x]:
-                    self._items.insert(x + 1, item)
-                    break
-                elif x == len(self._items) - 1:
-                    self._items.append(item)
+            batch = list(bucket)
+        self._size -= len(batch)
+        return batch
+
+    def _bury(self) -> None:
+        """Pop dead items off the front of the earliest bucket.
+
+        """
+        dead = self._dead
+        while self._times:
+            timestamp = self._times[0]
+            bucket = self._buckets[timestamp]
+            if id(bucket[0]) not in dead:
+                return
+            dead.remove(id(bucket.popleft()))
+            if not bucket:
+                del self._buckets[timestamp]
+                heappop(self._times)
+
+    def _compact(self) -> None:
+        """Rebuild the buckets without their dead items.
+
+        """
+        dead = self._dead
+        buckets = {}
+        for timestamp, bucket in self._buckets.items():
+            live = deque(item for item in bucket if id(item) not in dead)
+            if live:
+                buckets[timestamp] = live
+        self._buckets = buckets
+        self._times = list(buckets)
+        heapify(self._times)
+        dead.clear()
+
+    def __getstate__(self) -> dict:
+        """Return the state of this CalendarQueue for pickling.
+
+        Dead items are dropped first, since they are only known by id.
+        """
+        self._compact()
+        return self.__dict__
 
 
 if __name__ == '__main__':
     import python_ta
 
-    python_ta.check_all()
+    python_ta.check_all(
+        config={'extra-imports': ['collections', 'heapq', 'typing']})
@@ -1,7 +1,10 @@
 """Dispatcher for the simulation"""
 
-from typing import Optional
+from collections import OrderedDict
+from typing import List, Optional, Tuple
 from driver import Driver
+from grid import DriverGrid
+from oracle import TravelTimeOracle
 from passenger import Passenger
 
 
@@ -18,85 +21,173 @@ class Dispatcher:
     the waiting list to the driver. If there is no passenger on the waiting list
     the dispatcher does nothing. Once a driver requests a passenger, the driver
     is registered with the dispatcher, and will be used to fulfill future
-    passenger requests.
+    passenger requests whenever it is idle.
 
-     === Attributes ===
-    queue: A list of passengers of who is waiting for a driver.
+    Registered drivers share the dispatcher's travel time oracle, so a travel
+    time worked out for one of them is remembered for all of them.
 
     === Private Attributes ===
     _drivers:
         A dictionary whose key is driver.id, and value is the driver
+    _idle:
+        A spatial index over the registered drivers that are idle.
     _waiting_passengers:
-        A list of passengers waiting to be assigned a driver.
+        An ordered dictionary whose key is passenger.id, and value is a
+        passenger waiting to be assigned a driver, in the order the
+        passengers started waiting.
+    _oracle:
+        The travel time oracle shared by the registered drivers.
     """
 
     _drivers: dict[str, Driver]
-    _waiting_passengers: list[Passenger]
-    queue: list[Passenger]
+    _idle: DriverGrid
+    _waiting_passengers: OrderedDict[str, Passenger]
+    _oracle: TravelTimeOracle
 
-    def __init__(self) -> None:
-        """Initialize a Dispatcher.
+    def __init__(self, oracle: Optional[TravelTimeOracle] = None) -> None:
+        """Initialize a Dispatcher whose drivers look up travel times in
+        <oracle>, or in a new TravelTimeOracle if it is None.
         >>> eiad = Dispatcher()
         >>> print(eiad._drivers)
         {}
         """
+        self._oracle = TravelTimeOracle() if oracle is None else oracle
         self._drivers = {}
-        self._waiting_passengers = []
-        self.queue = []
+        self._idle = DriverGrid(oracle=self._oracle)
+        self._waiting_passengers = OrderedDict()
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
-        return '{self._drivers}, {self._waiting_passengers}'.format(self=self)
+        return '{self._drivers}, {passengers}'.format(
+            self=self, passengers=list(self._waiting_passengers.values()))
 
     def request_driver(self, passenger: Passenger) -> Optional[Driver]:
         """Return a driver for the passenger, or None if no driver is available.
 
-        Add the passenger to the waiting list if there is no available driver.
+        Only idle drivers that can reach the passenger are considered. The
+        one with the shortest travel time to the passenger is found with a
+        nearest-neighbour search of the idle drivers' locations.
+
+        Add the passenger to the back of the waiting list if there is no
+        available driver. A passenger that is already waiting keeps their
+        place.
         """
-        if len(self._drivers) == 0:
-            self._waiting_passengers.insert(0, passenger)
-            self.queue.insert(0, passenger)
-            return None
-        else:
-            final_drive = list(self._drivers.values())[0]
-            for x in self._drivers:
-                driver = self._drivers[x]
-                if driver.get_travel_time(passenger.origin) < \
-                        final_drive.get_travel_time(passenger.origin):
-                    final_drive = driver
-            return final_drive
+        driver = self._idle.nearest(passenger.origin)
+        if driver is None and passenger.id not in self._waiting_passengers:
+            self._waiting_passengers[passenger.id] = passenger
+        return driver
+
+    def request_drivers(self, passengers: List[Passenger]) \
+            -> List[Optional[Driver]]:
+        """Return a driver, or None, for each of <passengers>, as if each had
+        requested a driver in order, and start each driver driving to the
+        passenger it was assigned.
+
+        """
+        drivers = []
+        for passenger in passengers:
+            driver = self.request_driver(passenger)
+            if driver is not None:
+                driver.start_drive(passenger.origin)
+            drivers.append(driver)
+        return drivers
 
     def cancel_ride(self, passenger: Passenger) -> None:
-        """Cancel the ride for passenger.
+        """Cancel the ride for passenger, removing them from the waiting list.
+
+        """
+        self._waiting_passengers.pop(passenger.id, None)
+
+    def next_dispatch(self, timestamp: int) -> Optional[int]:
+        """Return the time of a new batch dispatch needed because of a request
+        made at <timestamp>, or None if no new batch is needed.
+
+        This dispatcher assigns every request as it arrives, so it never
+        needs a batch.
+        """
+        return None
+
+    def dispatch(self) -> List[Tuple[Driver, Passenger]]:
+        """Assign waiting passengers to idle drivers in one batch, and return
+        the (driver, passenger) pairs.
+
+        This dispatcher assigns every request as it arrives, so there is
+        never anything to assign in a batch.
+        """
+        return []
+
+    def scan_count(self) -> int:
+        """Return the number of candidate drivers this dispatcher has
+        compared while choosing drivers for passengers.
 
+        >>> Dispatcher().scan_count()
+        0
         """
-        if passenger in self._waiting_passengers:
-            y = []
-            for x in range(len(self._waiting_passengers)):
-                if self._waiting_passengers[x] == passenger:
-                    y.append(x)
-            c = 0
-            for i in y:
-                self._waiting_passengers.pop(i - c)
-                c += 1
+        return self._idle.scanned
+
+    def _register(self, driver: Driver) -> None:
+        """Register <driver>, if this is a new driver.
+
+        """
+        if driver.id not in self._drivers:
+            self._drivers[driver.id] = driver
+            driver.use_oracle(self._oracle)
+            driver.watch(self._driver_changed)
+            self._driver_changed(driver)
+
+    def _driver_changed(self, driver: Driver) -> None:
+        """Move <driver> into or out of the idle drivers to match its state.
+
+        """
+        if driver.is_idle:
+            self._idle.add(driver)
+        elif driver in self._idle:
+            self._idle.remove(driver)
 
     def request_passenger(self, driver: Driver) -> Optional[Passenger]:
         """Return a passenger for the driver, or None if no passenger is availab
 
+        The passenger who has been waiting the longest, of those the driver
+        can reach, is taken off the waiting list.
+
         If this is a new driver, register the driver for future passenger reques
         """
-        if driver.id not in self._drivers:
-            self._drivers[driver.id] = driver
-        if not self.queue:
+        self._register(driver)
+        if not self._waiting_passengers:
             return None
-        else:
-            return self.queue.pop()
+        if self._oracle.is_manhattan():
+            return self._waiting_passengers.popitem(last=False)[1]
+        for passenger in self._waiting_passengers.values():
+            try:
+                self._oracle.travel_time(driver.location, passenger.origin,
+                                         driver.get_speed())
+            except ValueError:
+                continue
+            del self._waiting_passengers[passenger.id]
+            return passenger
+        return None
+
+    def request_passengers(self, drivers: List[Driver]) \
+            -> List[Optional[Passenger]]:
+        """Return a passenger, or None, for each of <drivers>, as if each had
+        requested a passenger in order, and start each driver that was
+        assigned a passenger driving to them.
+
+        """
+        passengers = []
+        for driver in drivers:
+            passenger = self.request_passenger(driver)
+            if passenger is not None:
+                driver.start_drive(passenger.origin)
+            passengers.append(passenger)
+        return passengers
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(
-        config={'extra-imports': ['typing', 'driver', 'passenger']})
+        config={'extra-imports': ['collections', 'typing', 'driver', 'grid',
+                                  'oracle', 'passenger']})
@@ -1,8 +1,12 @@
 """Drivers for the simulation"""
 
+from __future__ import annotations
+
+import sys
 from location import Location, manhattan_distance
+from oracle import TravelTimeOracle
 from passenger import Passenger
-from typing import Optional
+from typing import Callable, Optional
 
 
 class Driver:
@@ -19,7 +23,13 @@ class Driver:
         and is idle.
     _passenger: The current passenger for the driver, or None if the driver is not
           currently driving a passenger.
+    _on_change: A function that is called with the driver whenever its location
+          or idle state changes, or None.
+    _oracle: The oracle travel times are looked up in, or None to compute them
+          from the Manhattan distance.
     """
+    __slots__ = ('id', 'location', 'is_idle', '_speed', '_destination',
+                 '_passenger', '_on_change', '_oracle')
 
     id: str
     location: Location
@@ -27,6 +37,8 @@ class Driver:
     _speed: int
     _destination: Optional[Location]
     _passenger: Optional[Passenger]
+    _on_change: Optional[Callable[[Driver], None]]
+    _oracle: Optional[TravelTimeOracle]
 
     def __init__(self, identifier: str, location: Location, speed: int) -> None:
         """Initialize a Driver.
@@ -36,12 +48,14 @@ class Driver:
         >>> print(eiad.location)
         (1, 2)
         """
-        self.id = identifier
+        self.id = sys.intern(identifier)
         self.location = location
         self._speed = speed
         self.is_idle = True
         self._destination = None
         self._passenger = None
+        self._on_change = None
+        self._oracle = None
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -64,11 +78,49 @@ class Driver:
                    self._destination == other._destination
         return False
 
+    def _changed(self) -> None:
+        """Report a change of location or idle state to self._on_change.
+
+        """
+        if self._on_change is not None:
+            self._on_change(self)
+
+    def watch(self, on_change: Optional[Callable[[Driver], None]]) -> None:
+        """Call <on_change> with this driver whenever its location or idle
+        state changes. Passing None stops reporting changes.
+
+        """
+        self._on_change = on_change
+
+    def use_oracle(self, oracle: Optional[TravelTimeOracle]) -> None:
+        """Look up travel times in <oracle>, which is usually shared with
+        other drivers. Passing None computes them from the Manhattan distance
+        again.
+
+        """
+        self._oracle = oracle
+
+    def get_speed(self) -> int:
+        """Return the speed of the driver.
+        >>> Driver('eiad', Location(1, 2), 2).get_speed()
+        2
+        """
+        return self._speed
+
     def get_travel_time(self, destination: Location) -> int:
         """Return the time it will take to arrive at the destination,
         rounded to the nearest integer.
 
+        >>> eiad = Driver('eiad', Location(1, 1), 2)
+        >>> eiad.get_travel_time(Location(4, 5))
+        4
+        >>> eiad.use_oracle(TravelTimeOracle())
+        >>> eiad.get_travel_time(Location(4, 5))
+        4
         """
+        if self._oracle is not None:
+            return self._oracle.travel_time(self.location, destination,
+                                            self._speed)
         distance = manhattan_distance(self.location, destination)
         return round(distance / self._speed)
 
@@ -79,6 +131,7 @@ class Driver:
         """
         self.is_idle = False
         self._destination = location
+        self._changed()
         return self.get_travel_time(location)
 
     def end_drive(self) -> None:
@@ -90,6 +143,7 @@ class Driver:
         self.location = self._destination
         self._destination = None
         self.is_idle = True
+        self._changed()
 
     def start_trip(self, passenger: Passenger) -> int:
         """Start a ride and return the time the ride will take.
@@ -99,6 +153,7 @@ class Driver:
         self.is_idle = False
         self._destination = passenger.destination
         self._passenger = passenger
+        self._changed()
         return self.get_travel_time(self._destination)
 
     def end_trip(self) -> None:
@@ -112,10 +167,12 @@ class Driver:
         self._destination = None
         self.is_idle = True
         self._passenger = None
+        self._changed()
 
 
 if __name__ == '__main__':
     import python_ta
 
     python_ta.check_all(
-        config={'extra-imports': ['location', 'passenger']})
+        config={'extra-imports': ['sys', 'location', 'oracle', 'passenger',
+                                  'typing']})
@@ -4,7 +4,7 @@ This file should contain all of the classes necessary to model the different
 kinds of events in the simulation.
 """
 from __future__ import annotations
-from typing import List
+from typing import Iterator, List, Optional
 from passenger import Passenger, WAITING, CANCELLED, SATISFIED
 from dispatcher import Dispatcher
 from driver import Driver
@@ -150,6 +150,26 @@ class Event:
         """
         raise NotImplementedError("Implemented in a subclass")
 
+    def revokes(self) -> List[Event]:
+        """Return the scheduled events that doing this event has made
+        pointless, so that the simulation can drop them without doing them.
+
+        """
+        return []
+
+    @classmethod
+    def do_batch(cls, events: List[Event], dispatcher: Dispatcher,
+                 monitor: Monitor) -> List[Event]:
+        """Do each of <events>, which are all of this class and have the same
+        timestamp, in order, and return the events they spawn.
+
+        Subclasses may override this to share work between the events.
+        """
+        spawned = []
+        for event in events:
+            spawned.extend(event.do(dispatcher, monitor))
+        return spawned
+
 
 class PassengerRequest(Event):
     """A passenger requests a driver.
@@ -179,7 +199,8 @@ class PassengerRequest(Event):
         the passenger.
 
         Return a Cancellation event. If the passenger is assigned to a driver,
-        also return a Pickup event.
+        also return a Pickup event. If the dispatcher assigns requests in
+        batches, also return a Dispatch event when a new batch is needed.
 
         """
         monitor.notify(self.timestamp, PASSENGER, REQUEST,
@@ -191,8 +212,12 @@ class PassengerRequest(Event):
             travel_time = driver.start_drive(self.passenger.origin)
             events.append(Pickup(self.timestamp + travel_time,
                                  self.passenger, driver))
-        events.append(Cancellation(self.timestamp + self.passenger.patience,
-                                   self.passenger))
+        self.passenger.cancellation = Cancellation(
+            self.timestamp + self.passenger.patience, self.passenger)
+        events.append(self.passenger.cancellation)
+        batch = dispatcher.next_dispatch(self.timestamp)
+        if batch is not None:
+            events.append(Dispatch(batch))
         return events
 
     def __str__(self) -> str:
@@ -201,6 +226,32 @@ class PassengerRequest(Event):
         """
         return f"{self.timestamp} -- {self.passenger}: Request a driver"
 
+    @classmethod
+    def do_batch(cls, events: List[PassengerRequest], dispatcher: Dispatcher,
+                 monitor: Monitor) -> List[Event]:
+        """Do every request in <events> with one call to the monitor and one
+        to the dispatcher, and return the events they spawn.
+
+        """
+        timestamp = events[0].timestamp
+        passengers = [event.passenger for event in events]
+        monitor.notify_all(timestamp, PASSENGER, REQUEST,
+                           [(p.id, p.origin) for p in passengers])
+        spawned = []
+        for passenger, driver in zip(passengers,
+                                     dispatcher.request_drivers(passengers)):
+            if driver is not None:
+                spawned.append(Pickup(
+                    timestamp + driver.get_travel_time(passenger.origin),
+                    passenger, driver))
+            passenger.cancellation = Cancellation(
+                timestamp + passenger.patience, passenger)
+            spawned.append(passenger.cancellation)
+        batch = dispatcher.next_dispatch(timestamp)
+        if batch is not None:
+            spawned.append(Dispatch(batch))
+        return spawned
+
 
 class DriverRequest(Event):
     """A driver requests a passenger.
@@ -228,7 +279,9 @@ class DriverRequest(Event):
         """Register the driver, if this is the first request, and
         assign a passenger to the driver, if one is available.
 
-        If a passenger is available, return a Pickup event.
+        If a passenger is available, return a Pickup event. If the dispatcher
+        assigns requests in batches, also return a Dispatch event when a new
+        batch is needed.
 
         """
         # Notify the monitor about the request.
@@ -246,6 +299,9 @@ class DriverRequest(Event):
             travel_time = self.driver.start_drive(passenger.origin)
             events.append(Pickup(self.timestamp + travel_time,
                                  passenger, self.driver))
+        batch = dispatcher.next_dispatch(self.timestamp)
+        if batch is not None:
+            events.append(Dispatch(batch))
         return events
 
     def __str__(self) -> str:
@@ -255,6 +311,55 @@ class DriverRequest(Event):
         return "{} -- {}: Request a passenger".format(self.timestamp,
                                                       self.driver)
 
+    @classmethod
+    def do_batch(cls, events: List[DriverRequest], dispatcher: Dispatcher,
+                 monitor: Monitor) -> List[Event]:
+        """Do every request in <events> with one call to the monitor and one
+        to the dispatcher, and return the events they spawn.
+
+        """
+        timestamp = events[0].timestamp
+        drivers = [event.driver for event in events]
+        monitor.notify_all(timestamp, DRIVER, REQUEST,
+                           [(d.id, d.location) for d in drivers])
+        spawned = []
+        for driver, passenger in zip(drivers,
+                                     dispatcher.request_passengers(drivers)):
+            if passenger is not None:
+                spawned.append(Pickup(
+                    timestamp + driver.get_travel_time(passenger.origin),
+                    passenger, driver))
+        batch = dispatcher.next_dispatch(timestamp)
+        if batch is not None:
+            spawned.append(Dispatch(batch))
+        return spawned
+
+
+class Dispatch(Event):
+    """The dispatcher assigns a batch of waiting passengers to idle drivers.
+
+    """
+
+    def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
+        """Assign waiting passengers to idle drivers, and start each assigned
+        driver driving to their passenger.
+
+        Return a Pickup event for each assignment.
+
+        """
+        events = []
+        for driver, passenger in dispatcher.dispatch():
+            travel_time = driver.start_drive(passenger.origin)
+            events.append(Pickup(self.timestamp + travel_time,
+                                 passenger, driver))
+        return events
+
+    def __str__(self) -> str:
+        """Return a string representation of this event.
+
+        """
+        return f"{self.timestamp} -- Dispatch a batch"
+
 
 class Cancellation(Event):
     """A driver requests a passenger.
@@ -270,6 +375,7 @@ class Cancellation(Event):
 
     def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
         events = []
+        self.passenger.cancellation = None
         if self.passenger.status == WAITING:
             self.passenger.status = CANCELLED
             monitor.notify(self.timestamp, PASSENGER, CANCEL, self.passenger.id,
@@ -287,10 +393,16 @@ class Pickup(Event):
     passenger: Passenger
     driver: Driver
 
+    # === Private Attributes ===
+    _revoked: Optional[Event]
+    #     The Cancellation of the passenger, once this pickup has made it
+    #     pointless.
+
     def __init__(self, time: int, passenger: Passenger, driver: Driver):
         super().__init__(time)
         self.passenger = passenger
         self.driver = driver
+        self._revoked = None
 
     def do(self, dispatcher: Dispatcher, monitor: Monitor) -> List[Event]:
         events = []
@@ -302,12 +414,21 @@ class Pickup(Event):
                            self.passenger.origin)
             x = self.driver.start_trip(self.passenger)
             self.passenger.status = SATISFIED
+            self._revoked = self.passenger.cancellation
+            self.passenger.cancellation = None
             events.append(Dropoff((x + self.timestamp), self.passenger,
                                   self.driver))
         else:
             events.append(DriverRequest(self.timestamp, self.driver))
         return events
 
+    def revokes(self) -> List[Event]:
+        """Return the Cancellation of the passenger if this pickup picked the
+        passenger up, since the passenger can no longer cancel.
+
+        """
+        return [] if self._revoked is None else [self._revoked]
+
 
 class Dropoff(Event):
     """A driver requests a passenger.
@@ -332,17 +453,19 @@ class Dropoff(Event):
         return events
 
 
-def create_event_list(filename: str) -> List[Event]:
-    """Return a list of Events based on raw list of events in <filename>.
+def iter_events(filename: str) -> Iterator[Event]:
+    """Yield the Events in <filename> one at a time, in file order.
+
+    Only the current line of the file is held in memory, so this can be used
+    on files far too large for create_event_list.
 
      Precondition: the file stored at <filename> is in the format specified
      by the assignment handout.
 
      filename: The name of a file that contains the list of events.
      """
-    events = []
     with open(filename, "r") as file:
-        for line in file:
+        for line_number, line in enumerate(file, 1):
             line = line.strip()
 
             if not line or line.startswith("#"):
@@ -361,21 +484,25 @@ def create_event_list(filename: str) -> List[Event]:
             # a location.
 
             if event_type == "DriverRequest":
-                events.append(DriverRequest(timestamp, Driver(tokens[2],
-                                                              deserialize_location(
-                                                                  tokens[3]),
-                                                              int(tokens[4]))))
+                yield DriverRequest(timestamp, Driver(
+                    tokens[2], deserialize_location(tokens[3], line_number),
+                    int(tokens[4])))
             elif event_type == "PassengerRequest":
-                events.append(PassengerRequest(timestamp, Passenger((tokens[2]),
-                                                                    int(tokens[
-                                                                            5]),
-                                                                    deserialize_location(
-                                                                        tokens[
-                                                                            3]),
-                                                                    deserialize_location(
-                                                                        tokens[
-                                                                            4]))))
-    return events
+                yield PassengerRequest(timestamp, Passenger(
+                    tokens[2], int(tokens[5]),
+                    deserialize_location(tokens[3], line_number),
+                    deserialize_location(tokens[4], line_number)))
+
+
+def create_event_list(filename: str) -> List[Event]:
+    """Return a list of Events based on raw list of events in <filename>.
+
+     Precondition: the file stored at <filename> is in the format specified
+     by the assignment handout.
+
+     filename: The name of a file that contains the list of events.
+     """
+    return list(iter_events(filename))
 
 
 if __name__ == '__main__':
@@ -383,6 +510,6 @@ if __name__ == '__main__':
 
     python_ta.check_all(
         config={
-            'allowed-io': ['create_event_list'],
-            'extra-imports': ['passenger', 'dispatcher', 'driver',
+            'allowed-io': ['iter_events'],
+            'extra-imports': ['typing', 'passenger', 'dispatcher', 'driver',
                               'location', 'monitor']})
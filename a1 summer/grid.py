@@ -0,0 +1,263 @@
+"""Spatial index of drivers for the simulation"""
+
+from typing import Iterator, Optional
+from driver import Driver
+from location import Location
+from oracle import TravelTimeOracle
+
+CELL_SIZE = 8
+
+
+class DriverGrid:
+    """A uniform grid over driver locations that answers nearest-driver
+    queries.
+
+    The grid is divided into square cells of <cell_size> rows by <cell_size>
+    columns, and each driver is stored in the cell containing its location.
+    A query searches rings of cells in increasing Manhattan distance from the
+    cell of the target, and stops as soon as no unsearched cell can hold a
+    driver that would arrive sooner than the best one found.
+
+    Ties in travel time are broken in favour of the driver that was added to
+    the grid first.
+
+    Travel times come from an oracle. When its distances are Manhattan
+    distances, the search works them out itself and looks the travel times
+    up in the oracle's table for each driver's speed, which saves two calls
+    per driver compared.
+
+    === Attributes ===
+    scanned: The number of drivers whose travel time nearest() has
+        compared, over all queries.
+    """
+
+    scanned: int
+
+    # === Private Attributes ===
+    _cell_size: int
+    #     The number of rows and columns covered by one cell.
+    _cells: dict[tuple[int, int], dict[str, Driver]]
+    #     A dictionary whose key is a cell, and value is a dictionary of the
+    #     drivers in that cell, keyed by driver.id.
+    _where: dict[str, tuple[int, int]]
+    #     A dictionary whose key is driver.id, and value is the cell the
+    #     driver is stored in.
+    _rank: dict[str, int]
+    #     A dictionary whose key is driver.id, and value is the order in
+    #     which the driver was first added to the grid. Drivers keep their
+    #     rank after they are removed.
+    _times: dict[str, list[int]]
+    #     A dictionary whose key is driver.id, and value is the oracle's
+    #     table of travel times by distance for the driver's speed.
+    _oracle: TravelTimeOracle
+    #     The oracle travel times come from. Its distances are never shorter
+    #     than Manhattan distances, or the search could stop too early.
+    _max_speed: int
+    #     The highest speed of any driver that has been in the grid.
+    _bounds: list[int]
+    #     The smallest and largest cell row, then the smallest and largest
+    #     cell column, that has ever held a driver.
+    #
+    # === Representation Invariants ===
+    # _where and the union of the dictionaries in _cells hold exactly the
+    # same drivers, and every one of them has a rank in _rank and a table in
+    # _times.
+    # No dictionary in _cells is empty.
+
+    def __init__(self, cell_size: int = CELL_SIZE,
+                 oracle: Optional[TravelTimeOracle] = None) -> None:
+        """Initialize an empty DriverGrid that gets travel times from
+        <oracle>, or from a new TravelTimeOracle if it is None.
+
+        >>> grid = DriverGrid()
+        >>> len(grid)
+        0
+        """
+        self._cell_size = cell_size
+        self._cells = {}
+        self._where = {}
+        self._rank = {}
+        self._times = {}
+        self._oracle = TravelTimeOracle() if oracle is None else oracle
+        self._max_speed = 0
+        self._bounds = []
+        self.scanned = 0
+
+    def __len__(self) -> int:
+        """Return the number of drivers in this grid.
+
+        """
+        return len(self._where)
+
+    def __iter__(self) -> Iterator[Driver]:
+        """Yield the drivers in this grid.
+
+        """
+        for drivers in self._cells.values():
+            yield from drivers.values()
+
+    def __contains__(self, driver: Driver) -> bool:
+        """Return True iff <driver> is in this grid.
+
+        """
+        return driver.id in self._where
+
+    def _cell(self, location: Location) -> tuple[int, int]:
+        """Return the cell containing <location>.
+
+        """
+        return (location.row // self._cell_size,
+                location.column // self._cell_size)
+
+    def _place(self, driver: Driver, cell: tuple[int, int]) -> None:
+        """Store <driver> in <cell>.
+
+        """
+        drivers = self._cells.get(cell)
+        if drivers is None:
+            drivers = self._cells[cell] = {}
+        drivers[driver.id] = driver
+        self._where[driver.id] = cell
+        if not self._bounds:
+            self._bounds = [cell[0], cell[0], cell[1], cell[1]]
+        else:
+            bounds = self._bounds
+            bounds[0] = min(bounds[0], cell[0])
+            bounds[1] = max(bounds[1], cell[0])
+            bounds[2] = min(bounds[2], cell[1])
+            bounds[3] = max(bounds[3], cell[1])
+
+    def _take(self, driver: Driver) -> None:
+        """Remove <driver> from the cell it is stored in.
+
+        """
+        cell = self._where.pop(driver.id)
+        drivers = self._cells[cell]
+        del drivers[driver.id]
+        if not drivers:
+            del self._cells[cell]
+
+    def add(self, driver: Driver) -> None:
+        """Add <driver> to this grid at its current location.
+
+        A driver keeps its place in the tie-breaking order from the first
+        time it was added, even if it has been removed since.
+
+        >>> grid = DriverGrid()
+        >>> grid.add(Driver('a', Location(1, 1), 1))
+        >>> len(grid)
+        1
+        """
+        if driver.id in self._where:
+            self.update(driver)
+            return
+        if driver.id not in self._rank:
+            self._rank[driver.id] = len(self._rank)
+            self._times[driver.id] = self._oracle.times(driver.get_speed())
+            self._max_speed = max(self._max_speed, driver.get_speed())
+        self._place(driver, self._cell(driver.location))
+
+    def remove(self, driver: Driver) -> None:
+        """Remove <driver> from this grid.
+
+        Precondition: <driver> is in this grid.
+        """
+        self._take(driver)
+
+    def update(self, driver: Driver) -> None:
+        """Move <driver> to the cell containing its current location.
+
+        Precondition: <driver> is in this grid.
+        """
+        cell = self._cell(driver.location)
+        if cell != self._where[driver.id]:
+            self._take(driver)
+            self._place(driver, cell)
+
+    def _ring(self, center: tuple[int, int], distance: int) \
+            -> Iterator[tuple[int, int]]:
+        """Yield the cells that have ever held a driver, among those at
+        Manhattan distance <distance> from <center>.
+
+        """
+        row, col = center
+        min_row, max_row, min_col, max_col = self._bounds
+        for d_row in range(max(-distance, min_row - row),
+                           min(distance, max_row - row) + 1):
+            d_col = distance - abs(d_row)
+            if min_col <= col + d_col <= max_col:
+                yield row + d_row, col + d_col
+            if d_col != 0 and min_col <= col - d_col <= max_col:
+                yield row + d_row, col - d_col
+
+    def _lower_bound(self, distance: int) -> int:
+        """Return a lower bound on the travel time of any driver in a cell at
+        Manhattan distance <distance> from the cell of a target.
+
+        """
+        if distance <= 1:
+            blocks = distance
+        else:
+            blocks = (distance - 2) * self._cell_size + 2
+        return round(blocks / self._max_speed)
+
+    def nearest(self, location: Location) -> Optional[Driver]:
+        """Return the driver in this grid with the shortest travel time to
+        <location>, or None if the grid has no driver that can reach it.
+        Drivers that cannot reach <location> are skipped.
+
+        >>> grid = DriverGrid(2)
+        >>> grid.add(Driver('far', Location(9, 9), 1))
+        >>> grid.add(Driver('near', Location(1, 2), 1))
+        >>> grid.add(Driver('tied', Location(2, 1), 1))
+        >>> grid.nearest(Location(1, 1)).id
+        'near'
+        """
+        if not self._where:
+            return None
+        center = self._cell(location)
+        min_row, max_row, min_col, max_col = self._bounds
+        furthest = max(abs(center[0] - min_row), abs(center[0] - max_row)) + \
+            max(abs(center[1] - min_col), abs(center[1] - max_col))
+        best = None
+        best_time = 0
+        best_rank = 0
+        manhattan = self._oracle.is_manhattan()
+        row, column = location.row, location.column
+        for distance in range(furthest + 1):
+            if best is not None and self._lower_bound(distance) > best_time:
+                break
+            for cell in self._ring(center, distance):
+                drivers = self._cells.get(cell)
+                if drivers is None:
+                    continue
+                self.scanned += len(drivers)
+                for driver in drivers.values():
+                    here = driver.location
+                    if manhattan:
+                        blocks = abs(here.row - row) + \
+                            abs(here.column - column)
+                        times = self._times[driver.id]
+                        if blocks < len(times):
+                            time = times[blocks]
+                        else:
+                            time = self._oracle.time(driver.get_speed(),
+                                                     blocks)
+                    else:
+                        try:
+                            time = self._oracle.travel_time(
+                                here, location, driver.get_speed())
+                        except ValueError:
+                            continue
+                    rank = self._rank[driver.id]
+                    if best is None or time < best_time or \
+                            (time == best_time and rank < best_rank):
+                        best, best_time, best_rank = driver, time, rank
+        return best
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={'extra-imports': ['typing', 'driver', 'location', 'oracle']})
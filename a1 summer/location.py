@@ -1,26 +1,61 @@
 """Locations for the simulation"""
 
 from __future__ import annotations
+from itertools import repeat
+from typing import Dict, List, Optional, Sequence, Tuple
 
 
 class Location:
     """A two-dimensional location.
 
+    Locations are immutable and hashable. Creating a location returns the
+    existing instance for the same coordinates if there is one, so the
+    locations of a grid are shared rather than copied. At most
+    _LOCATION_CACHE_SIZE instances are shared at a time; compare locations
+    with == rather than is.
+
     === Attributes ===
     row:
         A value representing the horizontal index
-    col:
+    column:
         A value representing the vertical index
     """
+    __slots__ = ('row', 'column')
     row: int
-    col: int
+    column: int
+
+    def __new__(cls, row: int, column: int) -> Location:
+        """Return the location at <row> and <column>.
+
+        >>> Location(1, 2) is Location(1, 2)
+        True
+        """
+        location = _LOCATIONS.get((row, column))
+        if location is None:
+            location = object.__new__(cls)
+            object.__setattr__(location, 'row', row)
+            object.__setattr__(location, 'column', column)
+            if len(_LOCATIONS) >= _LOCATION_CACHE_SIZE:
+                _LOCATIONS.clear()
+            _LOCATIONS[(row, column)] = location
+        return location
+
+    def __setattr__(self, name: str, value: object) -> None:
+        """Raise AttributeError, since locations are immutable.
+
+        >>> Location(1, 2).row = 3
+        Traceback (most recent call last):
+        ...
+        AttributeError: Location is immutable
+        """
+        raise AttributeError("Location is immutable")
 
-    def __init__(self, row: int, column: int) -> None:
-        """Initialize a location.
+    def __reduce__(self) -> tuple:
+        """Return how to rebuild this location, so that unpickling it goes
+        through the shared instances too.
 
         """
-        self.row = row
-        self.column = column
+        return Location, (self.row, self.column)
 
     def __str__(self) -> str:
         """Return a string representation.
@@ -35,10 +70,39 @@ class Location:
         """Return True if self equals other, and false otherwise.
 
         """
+        if self is other:
+            return True
         if isinstance(other, Location):
             return (self.row == other.row) and (self.column == other.column)
         return False
 
+    def __hash__(self) -> int:
+        """Return a hash of this location, consistent with __eq__.
+
+        >>> {Location(1, 2): 'a'}[Location(1, 2)]
+        'a'
+        """
+        return hash((self.row, self.column))
+
+
+# The shared instances of Location, keyed by (row, column). When it holds
+# _LOCATION_CACHE_SIZE locations, it is emptied before the next one is added,
+# so a simulation that visits a huge grid does not keep every block alive.
+_LOCATION_CACHE_SIZE = 1 << 16
+_LOCATIONS: Dict[Tuple[int, int], Location] = {}
+
+
+def clear_locations() -> None:
+    """Stop sharing the existing instances of Location, so the ones that are
+    no longer used can be freed, for example between simulations.
+
+    >>> first = Location(7, 7)
+    >>> clear_locations()
+    >>> Location(7, 7) is first, Location(7, 7) == first
+    (False, True)
+    """
+    _LOCATIONS.clear()
+
 
 def manhattan_distance(origin: Location, destination: Location) -> int:
     """Return the Manhattan distance between the origin and the destination.
@@ -55,19 +119,82 @@ def manhattan_distance(origin: Location, destination: Location) -> int:
                                                    destination.column)
 
 
-def deserialize_location(location_str: str) -> Location:
+def _bad_location(location_str: str, line_number: Optional[int]) -> ValueError:
+    """Return the error raised for a location string that can't be parsed.
+
+    """
+    message = f"invalid location {location_str!r}, expected 'row,col'"
+    if line_number is not None:
+        message = f"line {line_number}: {message}"
+    return ValueError(message)
+
+
+def deserialize_location(location_str: str,
+                         line_number: Optional[int] = None) -> Location:
     """Deserialize a location.
 
-    location_str: A location in the format 'row,col'
+    location_str: A location in the format 'row,col', optionally wrapped in
+        parentheses and with spaces around either number.
+    line_number: The line of the input <location_str> was read from, used to
+        report invalid input.
+
+    Raise ValueError if <location_str> is not in that format.
+
     >>> x = deserialize_location('3, 4')
     >>> print(x)
     (3, 4)
+    >>> deserialize_location('3;4', 7)
+    Traceback (most recent call last):
+    ...
+    ValueError: line 7: invalid location '3;4', expected 'row,col'
+    """
+    text = location_str.strip()
+    if text[:1] == '(' and text[-1:] == ')':
+        text = text[1:-1]
+    row, comma, column = text.partition(',')
+    if comma and ',' not in column:
+        try:
+            return Location(int(row), int(column))
+        except ValueError:
+            pass
+    raise _bad_location(location_str, line_number)
+
+
+def deserialize_locations(location_strs: Sequence[str],
+                          line_numbers: Optional[Sequence[int]] = None) \
+        -> List[Location]:
+    """Deserialize a column of locations at once.
+
+    The common case of plain 'row,col' strings is parsed with a single split
+    of the whole column. Anything else falls back to deserialize_location, so
+    the result and the errors are the same as deserializing one at a time.
+
+    line_numbers: The line each location was read from, used to report
+        invalid input.
+
+    >>> [str(x) for x in deserialize_locations(['1,2', '3, 4', '(5,6)'])]
+    ['(1, 2)', '(3, 4)', '(5, 6)']
+    >>> deserialize_locations(['1,2', 'x,2'], [3, 4])
+    Traceback (most recent call last):
+    ...
+    ValueError: line 4: invalid location 'x,2', expected 'row,col'
     """
-    x = eval(location_str)
-    return Location(int(x[0]), int(x[1]))
+    joined = ','.join(location_strs)
+    if '(' not in joined and \
+            all(count == 1 for count in map(str.count, location_strs,
+                                            repeat(','))):
+        parts = joined.split(',')
+        try:
+            return list(map(Location, map(int, parts[0::2]),
+                            map(int, parts[1::2])))
+        except ValueError:
+            pass
+    if line_numbers is None:
+        line_numbers = [None] * len(location_strs)
+    return list(map(deserialize_location, location_strs, line_numbers))
 
 
 if __name__ == '__main__':
     import python_ta
 
-    python_ta.check_all()
+    python_ta.check_all(config={'extra-imports': ['itertools', 'typing']})
@@ -14,11 +14,14 @@ REQUEST: A constant used for the request activity description.
 CANCEL: A constant used for the cancel activity description.
 PICKUP: A constant used for the pickup activity description.
 DROPOFF: A constant used for the dropoff activity description.
+QUANTILES: The quantiles reported by Monitor.percentiles.
 """
 
-from typing import Dict, List
+from __future__ import annotations
+from typing import Callable, Dict, Iterable, List, Tuple
 from location import Location
 from location import manhattan_distance
+from sketch import QuantileSketch
 
 PASSENGER = "passenger"
 DRIVER = "driver"
@@ -28,6 +31,8 @@ CANCEL = "cancel"
 PICKUP = "pickup"
 DROPOFF = "dropoff"
 
+QUANTILES = (0.5, 0.9, 0.99)
+
 
 class Activity:
     """An activity that occurs in the simulation.
@@ -38,6 +43,7 @@ class Activity:
     identifier: An identifier for the person doing the activity.
     location: The location at which the activity occurred.
     """
+    __slots__ = ('time', 'description', 'id', 'location')
 
     time: int
     description: str
@@ -58,6 +64,23 @@ class Activity:
 class Monitor:
     """A monitor keeps a record of activities that it is notified about.
     When required, it generates a report of the activities it has recorded.
+
+    The statistics in the report are kept as running totals that are updated
+    as each activity arrives, so report() takes constant time. A monitor
+    created with history=False also discards each activity once it has been
+    counted, so it uses memory in proportion to the number of drivers and
+    waiting passengers rather than the number of activities.
+
+    Each passenger is expected to have a request activity followed by at most
+    one pickup or cancel activity.
+
+    Passenger wait times, the distance drivers travel to each pickup, and the
+    distance of each trip are also fed into quantile sketches, which report
+    percentiles in bounded memory. Monitors from separate runs over disjoint
+    passengers can be combined with merge().
+
+    Distances are Manhattan distances unless the monitor is given another
+    way to measure them, such as the distance method of a road network.
     """
 
     # === Private Attributes ===
@@ -65,24 +88,70 @@ class Monitor:
 
     #       A dictionary whose key is a category, and value is another
     #       dictionary. The key of the second dictionary is an identifier
-    #       and its value is a list of Activities.
-
-    def __init__(self) -> None:
+    #       and its value is a list of Activities. Both inner dictionaries
+    #       stay empty if the monitor does not keep history.
+    _history: bool
+    #       True iff every activity is kept in _activities.
+    _distance: Callable[[Location, Location], int]
+    #       The function that measures the distance between two locations.
+    _waiting: Dict[str, int]
+    #       A dictionary whose key is the identifier of a passenger that has
+    #       requested a driver but not yet been picked up or cancelled, and
+    #       value is the time of the request.
+    _wait_time: int
+    #       The total wait time of passengers that have finished waiting.
+    _waited: int
+    #       The number of passengers that have finished waiting.
+    _drivers: Dict[str, Activity]
+    #       A dictionary whose key is a driver identifier, and value is the
+    #       latest activity of that driver.
+    _total_distance: int
+    #       The total distance between consecutive activities of each driver.
+    _trip_distance: int
+    #       The total distance from each driver pickup to the driver's next
+    #       activity.
+    _wait_times: QuantileSketch
+    #       The wait time of each passenger that has finished waiting.
+    _pickup_distances: QuantileSketch
+    #       The distance from each driver pickup to the driver's previous
+    #       activity.
+    _trip_distances: QuantileSketch
+    #       The distance from each driver pickup to the dropoff that follows
+    #       it, leaving out pickups of passengers who had already cancelled.
+
+    def __init__(self, history: bool = True,
+                 distance: Callable[[Location, Location], int] =
+                 manhattan_distance) -> None:
         """Initialize a Monitor.
 
+        history: Whether to keep every activity, or only the running totals
+            needed for the report.
+        distance: The function that measures the distance a driver travels
+            between two locations.
         """
         self._activities = {
             PASSENGER: {},
             DRIVER: {}
         }
         """@type _activities: dict[str, dict[str, list[Activity]]]"""
+        self._history = history
+        self._distance = distance
+        self._waiting = {}
+        self._wait_time = 0
+        self._waited = 0
+        self._drivers = {}
+        self._total_distance = 0
+        self._trip_distance = 0
+        self._wait_times = QuantileSketch()
+        self._pickup_distances = QuantileSketch()
+        self._trip_distances = QuantileSketch()
 
     def __str__(self) -> str:
         """Return a string representation.
 
         """
-        return f"Monitor ({len(self._activities[DRIVER])} drivers, " \
-               f"{len(self._activities[PASSENGER])} passengers)"
+        return f"Monitor ({len(self._drivers)} drivers, " \
+               f"{self._waited + len(self._waiting)} passengers)"
 
     def notify(self, timestamp: int, category: str, description: str,
                identifier: str, location: Location) -> None:
@@ -95,11 +164,70 @@ class Monitor:
         identifier: The identifier for the actor.
         location: The location of the activity.
         """
-        if identifier not in self._activities[category]:
-            self._activities[category][identifier] = []
-
         activity = Activity(timestamp, description, identifier, location)
-        self._activities[category][identifier].append(activity)
+        if self._history:
+            if identifier not in self._activities[category]:
+                self._activities[category][identifier] = []
+            self._activities[category][identifier].append(activity)
+
+        if category == PASSENGER:
+            # The first activity is REQUEST, and the second is PICKUP
+            # or CANCEL. The wait time is the difference between the two.
+            requested = self._waiting.pop(identifier, None)
+            if requested is None:
+                self._waiting[identifier] = timestamp
+            else:
+                self._wait_time += timestamp - requested
+                self._waited += 1
+                self._wait_times.add(timestamp - requested)
+        else:
+            previous = self._drivers.get(identifier)
+            self._drivers[identifier] = activity
+            if previous is not None:
+                distance = self._distance(previous.location, location)
+                self._total_distance += distance
+                if previous.description == PICKUP:
+                    self._trip_distance += distance
+                    if description == DROPOFF:
+                        self._trip_distances.add(distance)
+                elif description == PICKUP:
+                    self._pickup_distances.add(distance)
+
+    def notify_all(self, timestamp: int, category: str, description: str,
+                   actors: Iterable[Tuple[str, Location]]) -> None:
+        """Notify the monitor of the same activity by each of <actors>, in
+        order. Each actor is an (identifier, location) pair.
+
+        >>> monitor = Monitor()
+        >>> monitor.notify_all(0, PASSENGER, REQUEST,
+        ...                    [('a', Location(0, 0)), ('b', Location(1, 1))])
+        >>> print(monitor)
+        Monitor (0 drivers, 2 passengers)
+        """
+        notify = self.notify
+        for identifier, location in actors:
+            notify(timestamp, category, description, identifier, location)
+
+    def merge(self, other: Monitor) -> None:
+        """Add the activities recorded by <other> to this monitor.
+
+        A driver that appears in both monitors is counted once, and the
+        activity recorded by <other> becomes its latest one. A passenger
+        should only appear in one of the two monitors.
+        """
+        for category in [PASSENGER, DRIVER]:
+            activities = self._activities[category]
+            for identifier, actions in other._activities[category].items():
+                activities.setdefault(identifier, []).extend(actions)
+        self._waiting.update(other._waiting)
+        self._wait_time += other._wait_time
+        self._waited += other._waited
+        self._drivers.update(other._drivers)
+        self._total_distance += other._total_distance
+        self._trip_distance += other._trip_distance
+        self._wait_times.merge(other._wait_times)
+        self._pickup_distances.merge(other._pickup_distances)
+        self._trip_distances.merge(other._trip_distances)
 
     def report(self) -> Dict[str, float]:
         """Return a report of the activities that have occurred.
@@ -109,62 +237,44 @@ class Monitor:
                 "average_driver_total_distance": self._average_total_distance(),
                 "average_driver_trip_distance": self._average_trip_distance()}
 
+    def percentiles(self) -> Dict[str, float]:
+        """Return the QUANTILES of passenger wait time, driver pickup distance
+        and driver trip distance, keyed like 'passenger_wait_time_p90'.
+
+        """
+        stats = {}
+        for name, sketch in [("passenger_wait_time", self._wait_times),
+                             ("driver_pickup_distance",
+                              self._pickup_distances),
+                             ("driver_trip_distance", self._trip_distances)]:
+            for q in QUANTILES:
+                stats[f"{name}_p{round(q * 100)}"] = sketch.quantile(q)
+        return stats
+
     def _average_wait_time(self) -> float:
         """Return the average wait time of passengers that have either been picked
         up or have cancelled their trip.
 
         """
-        wait_time = 0
-        count = 0
-        for activities in self._activities[PASSENGER].values():
-            # A passenger that has less than two activities hasn't finished
-            # waiting (they haven't cancelled or been picked up).
-            if len(activities) >= 2:
-                # The first activity is REQUEST, and the second is PICKUP
-                # or CANCEL. The wait time is the difference between the two.
-                wait_time += activities[1].time - activities[0].time
-                count += 1
-        return wait_time / count
+        if self._waited == 0:
+            return 0
+        return self._wait_time / self._waited
 
     def _average_total_distance(self) -> float:
         """Return the average distance drivers have driven.
 
         """
-        if len(self._activities[DRIVER].values()) == 0:
+        if len(self._drivers) == 0:
             return 0
-        distance = 0
-        driver = 0
-        for activities in self._activities[DRIVER].values():
-            driver += 1
-            for x in range(len(activities)):
-                if x + 1 >= len(activities):
-                    break
-                else:
-                    distance += manhattan_distance(activities[x].location,
-                                                   activities[x + 1].location)
-        if driver == 0:
-            return 0
-        return distance / driver
+        return self._total_distance / len(self._drivers)
 
     def _average_trip_distance(self) -> float:
         """Return the average distance drivers have driven on trips.
 
         """
-        if len(self._activities[DRIVER].values()) == 0:
-            return 0
-        distance = 0
-        driver = 0
-        for activities in self._activities[DRIVER].values():
-            driver += 1
-            for x in range(len(activities)):
-                if x + 1 >= len(activities):
-                    break
-                elif activities[x].description == PICKUP:
-                    distance += manhattan_distance(activities[x].location,
-                                                   activities[x + 1].location)
-        if driver == 0:
+        if len(self._drivers) == 0:
             return 0
-        return distance / driver
+        return self._trip_distance / len(self._drivers)
 
 
 if __name__ == "__main__":
@@ -173,4 +283,4 @@ if __name__ == "__main__":
     python_ta.check_all(
         config={
             'max-args': 6,
-            'extra-imports': ['typing', 'location']})
+            'extra-imports': ['typing', 'location', 'sketch']})
@@ -0,0 +1,199 @@
+"""
+The oracle module answers travel time queries for the simulation.
+
+A TravelTimeOracle is shared by a dispatcher, its spatial index and all of
+its drivers. It turns distances into travel times with one table per speed,
+so rounding is done once per distance instead of once per query. Distances
+that are expensive to measure can be remembered in a bounded cache, and the
+distances of a small grid can be computed once, up front, into a table.
+
+=== Constants ===
+TABLE_CELLS: The largest number of cells a grid can have for an oracle to
+    measure the distances between all of them up front.
+TIMES: The longest distance an oracle's travel time tables cover. Longer
+    distances are timed directly.
+"""
+
+from typing import Dict, List, Optional, Tuple
+from location import Location, manhattan_distance
+
+TABLE_CELLS = 1024
+TIMES = 4096
+
+
+class TravelTimeOracle:
+    """A source of distances and travel times between locations.
+
+    Distances are Manhattan distances. Subclasses can measure them
+    differently by overriding measure().
+
+    The cache is split into a recent and an older generation. Lookups that
+    hit the older generation move the distance to the recent one, and when
+    the recent generation is full it becomes the older one and the previous
+    older one is dropped. This keeps the distances that are used often, like
+    an LRU cache, without reordering anything on a hit.
+
+    === Attributes ===
+    misses: The number of distances that were measured because they were in
+        neither the table nor the cache.
+    """
+
+    misses: int
+
+    # === Private Attributes ===
+    _capacity: int
+    #     The number of distances each generation of the cache holds, or 0 if
+    #     there is no cache.
+    _recent: Dict[Tuple[int, int, int, int], int]
+    #     The recent generation of the cache. Its key is the row and column
+    #     of the origin and the row and column of the destination, and its
+    #     value is the distance between them.
+    _older: Dict[Tuple[int, int, int, int], int]
+    #     The older generation of the cache, with the same keys and values.
+    _columns: int
+    #     The number of columns of the grid the table covers.
+    _table: Optional[List[List[Optional[int]]]]
+    #     A table whose entry [i][j] is the distance from the cell with index
+    #     i to the cell with index j, where the index of a cell is
+    #     row * _columns + column, or None if that distance is measured
+    #     instead. None if there is no table.
+    _times: Dict[int, List[int]]
+    #     A dictionary whose key is a speed, and value is a list whose entry
+    #     [d] is the time it takes to travel a distance d at that speed.
+
+    def __init__(self, rows: int = 0, columns: int = 0,
+                 cache_size: int = 0) -> None:
+        """Initialize a TravelTimeOracle that caches up to <cache_size>
+        distances.
+
+        If the grid has <rows> rows and <columns> columns, and at most
+        TABLE_CELLS cells, the distances between all of them are measured
+        now.
+
+        >>> TravelTimeOracle(4, 4).distance(Location(0, 0), Location(3, 2))
+        5
+        """
+        self.misses = 0
+        self._capacity = (cache_size + 1) // 2
+        self._recent = {}
+        self._older = {}
+        self._columns = columns
+        self._table = None
+        self._times = {}
+        if 0 < rows * columns <= TABLE_CELLS:
+            cells = [Location(row, column) for row in range(rows)
+                     for column in range(columns)]
+            self._table = [[self.measure(origin, destination)
+                            for destination in cells] for origin in cells]
+
+    def __len__(self) -> int:
+        """Return the number of distances in the cache.
+
+        """
+        return len(self._recent) + len(self._older)
+
+    def measure(self, origin: Location, destination: Location) -> int:
+        """Return the distance from <origin> to <destination>, without using
+        the cache or the table.
+
+        """
+        return manhattan_distance(origin, destination)
+
+    def is_manhattan(self) -> bool:
+        """Return True iff this oracle's distances are Manhattan distances,
+        so callers may compute them directly.
+
+        >>> TravelTimeOracle().is_manhattan()
+        True
+        """
+        return type(self).measure is TravelTimeOracle.measure
+
+    def distance(self, origin: Location, destination: Location) -> int:
+        """Return the distance from <origin> to <destination>.
+
+        >>> oracle = TravelTimeOracle(cache_size=10)
+        >>> oracle.distance(Location(1, 1), Location(4, 5))
+        7
+        >>> oracle.distance(Location(1, 1), Location(4, 5))
+        7
+        >>> oracle.misses, len(oracle)
+        (1, 1)
+        """
+        table = self._table
+        if table is not None:
+            columns = self._columns
+            if 0 <= origin.column < columns and \
+                    0 <= destination.column < columns:
+                start = origin.row * columns + origin.column
+                end = destination.row * columns + destination.column
+                if 0 <= start < len(table) and 0 <= end < len(table):
+                    distance = table[start][end]
+                    if distance is not None:
+                        return distance
+        if not self._capacity:
+            self.misses += 1
+            return self.measure(origin, destination)
+        key = (origin.row, origin.column, destination.row, destination.column)
+        distance = self._recent.get(key)
+        if distance is not None:
+            return distance
+        distance = self._older.get(key)
+        if distance is None:
+            self.misses += 1
+            distance = self.measure(origin, destination)
+        if len(self._recent) >= self._capacity:
+            self._older = self._recent
+            self._recent = {}
+        self._recent[key] = distance
+        return distance
+
+    def times(self, speed: int, distance: int = 0) -> List[int]:
+        """Return the list whose entry [d] is the time it takes to travel a
+        distance d at <speed>, rounded to the nearest integer. The list has
+        an entry for <distance>, or for every distance up to TIMES if
+        <distance> is longer, and is extended in place as longer distances
+        are asked for.
+
+        >>> TravelTimeOracle().times(2, 4)[:5]
+        [0, 0, 1, 2, 2]
+        >>> len(TravelTimeOracle().times(1, 10 ** 9)) == TIMES + 1
+        True
+        """
+        times = self._times.get(speed)
+        if times is None:
+            times = self._times[speed] = []
+        if distance >= len(times):
+            times.extend(round(d / speed) for d in range(
+                len(times), min(2 * distance, TIMES) + 1))
+        return times
+
+    def time(self, speed: int, distance: int) -> int:
+        """Return the time it takes to travel <distance> at <speed>, rounded
+        to the nearest integer.
+
+        >>> TravelTimeOracle().time(2, 3), TravelTimeOracle().time(2, 10 ** 9)
+        (2, 500000000)
+        """
+        if distance > TIMES:
+            return round(distance / speed)
+        return self.times(speed, distance)[distance]
+
+    def travel_time(self, origin: Location, destination: Location,
+                    speed: int) -> int:
+        """Return the time it takes to travel from <origin> to <destination>
+        at <speed>, rounded to the nearest integer.
+
+        >>> TravelTimeOracle().travel_time(Location(1, 1), Location(4, 5), 2)
+        4
+        """
+        distance = self.distance(origin, destination)
+        times = self._times.get(speed)
+        if times is None or distance >= len(times):
+            return self.time(speed, distance)
+        return times[distance]
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={'extra-imports': ['typing', 'location']})
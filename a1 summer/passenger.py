@@ -8,6 +8,8 @@ CANCELLED: A constant used for the cancelled passenger status.
 SATISFIED: A constant used for the satisfied passenger status
 """
 
+import sys
+from typing import Optional
 from location import Location
 
 WAITING = "waiting"
@@ -29,15 +31,21 @@ class Passenger:
         The destination for the passenger.
     status:
         The current status of the passenger.
+    cancellation:
+        The Cancellation event scheduled for the passenger's request, or
+        None if there is none waiting to be done.
 
     === Representation Invariants ===
     -  status: "waited" | "cancelled" | "satisfied"
     """
+    __slots__ = ('id', 'patience', 'origin', 'destination', 'status',
+                 'cancellation')
     id: str
     patience: int
     origin: Location
     destination: Location
     status: str
+    cancellation: Optional[object]
 
     def __init__(self, identifier: str, patience: int, origin: Location,
                  destination: Location) -> None:
@@ -46,11 +54,12 @@ class Passenger:
         >>> eiad.origin.row
         1
         """
-        self.id = identifier
+        self.id = sys.intern(identifier)
         self.patience = patience
         self.origin = origin
         self.destination = destination
         self.status = WAITING
+        self.cancellation = None
 
     def __eq__(self, other: object) -> bool:
         """
@@ -78,4 +87,5 @@ class Passenger:
 if __name__ == '__main__':
     import python_ta
 
-    python_ta.check_all(config={'extra-imports': ['location']})
+    python_ta.check_all(
+        config={'extra-imports': ['sys', 'typing', 'location']})
@@ -0,0 +1,153 @@
+"""Instrumentation of simulation runs
+
+=== Constants ===
+SAMPLE_EVERY: The default number of events between samples of the size of
+    the event queue.
+"""
+
+from typing import Dict, List, Tuple
+
+SAMPLE_EVERY = 1000
+
+
+class EventTiming:
+    """The time spent in the do() method of one kind of event.
+
+    === Attributes ===
+    count: The number of events done.
+    total: The total wall time of those events, in seconds.
+    longest: The longest wall time of any one of them, or of one batch of
+        them in a batched simulation, in seconds.
+    """
+    __slots__ = ('count', 'total', 'longest')
+
+    count: int
+    total: float
+    longest: float
+
+    def __init__(self) -> None:
+        """Initialize an EventTiming with no events.
+
+        >>> EventTiming().count
+        0
+        """
+        self.count = 0
+        self.total = 0.0
+        self.longest = 0.0
+
+    def mean(self) -> float:
+        """Return the mean wall time of an event, or 0 if there were none.
+
+        """
+        return self.total / self.count if self.count else 0.0
+
+
+class RunStats:
+    """Statistics about how a simulation spent its time, collected when a
+    RunStats is passed to a Simulation.
+
+    === Attributes ===
+    events: The number of events done.
+    seconds: The wall time spent doing events and managing the event queue.
+    by_type: A dictionary whose key is the name of an Event subclass, and
+        value is the time spent in the do() method of events of that class.
+    sample_every: The queue size is sampled once every <sample_every>
+        events.
+    queue_sizes: The (timestamp, size of the event queue) samples.
+    max_queue: The largest size of the event queue after an event was done.
+    scans: The number of candidate drivers the dispatcher compared to
+        choose drivers for passengers.
+    """
+
+    events: int
+    seconds: float
+    by_type: Dict[str, EventTiming]
+    sample_every: int
+    queue_sizes: List[Tuple[int, int]]
+    max_queue: int
+    scans: int
+
+    def __init__(self, sample_every: int = SAMPLE_EVERY) -> None:
+        """Initialize an empty RunStats.
+
+        >>> RunStats().events
+        0
+        """
+        self.events = 0
+        self.seconds = 0.0
+        self.by_type = {}
+        self.sample_every = sample_every
+        self.queue_sizes = []
+        self.max_queue = 0
+        self.scans = 0
+
+    def record(self, kind: str, seconds: float, timestamp: int,
+               queue_size: int, count: int = 1) -> None:
+        """Record that <count> events of the class named <kind> at
+        <timestamp> took <seconds>, leaving <queue_size> events in the queue.
+
+        >>> stats = RunStats(sample_every=2)
+        >>> stats.record('Pickup', 0.5, 3, 4)
+        >>> stats.record('Pickup', 0.25, 5, 2)
+        >>> stats.by_type['Pickup'].longest, stats.queue_sizes
+        (0.5, [(5, 2)])
+        """
+        timing = self.by_type.get(kind)
+        if timing is None:
+            timing = self.by_type[kind] = EventTiming()
+        timing.count += count
+        timing.total += seconds
+        if seconds > timing.longest:
+            timing.longest = seconds
+        self.events += count
+        if queue_size > self.max_queue:
+            self.max_queue = queue_size
+        if self.events // self.sample_every > len(self.queue_sizes):
+            self.queue_sizes.append((timestamp, queue_size))
+
+    def events_per_second(self) -> float:
+        """Return the number of events done per second of wall time.
+
+        """
+        return self.events / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        """Return these statistics as a flat dictionary, with keys like
+        'Pickup_count', 'Pickup_total_seconds' and 'Pickup_max_seconds' for
+        each kind of event.
+
+        >>> stats = RunStats()
+        >>> stats.record('Dropoff', 0.5, 1, 0)
+        >>> stats.summary()['Dropoff_max_seconds']
+        0.5
+        """
+        summary = {"events": self.events, "seconds": self.seconds,
+                   "events_per_second": self.events_per_second(),
+                   "max_queue": self.max_queue, "scans": self.scans}
+        for kind in sorted(self.by_type):
+            timing = self.by_type[kind]
+            summary[f"{kind}_count"] = timing.count
+            summary[f"{kind}_total_seconds"] = timing.total
+            summary[f"{kind}_max_seconds"] = timing.longest
+        return summary
+
+    def __str__(self) -> str:
+        """Return a table of these statistics.
+
+        """
+        lines = [f"{self.events} events in {self.seconds:.3f} s "
+                 f"({self.events_per_second():.0f} events/s), "
+                 f"max queue {self.max_queue}, {self.scans} driver scans"]
+        for kind, timing in sorted(self.by_type.items(),
+                                   key=lambda item: -item[1].total):
+            lines.append(f"  {kind:18} {timing.count:10} "
+                         f"{timing.total:10.4f} s total "
+                         f"{timing.mean() * 1e6:10.2f} us mean "
+                         f"{timing.longest * 1e6:10.2f} us max")
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={'extra-imports': ['typing']})
@@ -0,0 +1,237 @@
+"""
+The road module measures distances along the roads of a city.
+
+A road network file draws the grid one row per line, with one character for
+each column:
+    .        A block that can be driven through in any direction.
+    #        A block that cannot be entered, such as a building or the river.
+    ^ v < >  A one-way block, which cannot be entered or left against its
+             arrow. '^' points towards row 0 and '<' towards column 0.
+Lines shorter than the longest line are padded with '#'.
+
+The distance between two blocks is the number of blocks driven along the
+shortest route between them. Every move is to a neighbouring block, so a
+distance is never shorter than the Manhattan distance.
+
+A RoadNetwork is a TravelTimeOracle, so it can be passed to a Dispatcher,
+and its distance method to a Monitor. Small networks have the distances
+between all of their blocks computed up front. Larger ones compute, for each
+destination they are asked about, the distance to it from every block, with
+one breadth-first search backwards from the destination, and remember the
+most recent of these trees. A search costs about as much as one A* query,
+but the simulation mostly asks about a few destinations at a time: every
+driver compared for a passenger is measured to the passenger's origin, and a
+trip is measured to its destination when it starts and again when the
+monitor records the dropoff. So nearly every query is a lookup.
+
+=== Constants ===
+TREES: The default number of destinations a large network remembers the
+    distances to.
+"""
+
+from typing import Dict, List, Optional, Sequence
+from location import Location
+from oracle import TravelTimeOracle, TABLE_CELLS
+
+TREES = 256
+
+_OPEN = "."
+_CLOSED = "#"
+_ARROWS = {"^": (-1, 0), "v": (1, 0), "<": (0, -1), ">": (0, 1)}
+_MOVES = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class RoadNetwork(TravelTimeOracle):
+    """A grid of roads, which measures distances along them.
+
+    Trees are remembered in a recent and an older generation, in the same
+    way as the cache of a TravelTimeOracle.
+
+    === Attributes ===
+    rows: The number of rows of the grid.
+    columns: The number of columns of the grid.
+    searches: The number of breadth-first searches done.
+    """
+
+    rows: int
+    columns: int
+    searches: int
+
+    # === Private Attributes ===
+    _blocks: List[str]
+    #     The rows of the grid, padded to the same length, one character per
+    #     block as in a road network file.
+    _backward: List[List[int]]
+    #     A list whose entry [i] lists the blocks that can be driven to the
+    #     block with index i from, where the index of a block is
+    #     row * columns + column.
+    _trees: int
+    #     The number of trees each generation holds.
+    _recent_trees: Dict[int, List[Optional[int]]]
+    #     The recent generation of trees. Its key is the index of a
+    #     destination, and its value is a list of the distance to it from
+    #     each block, or None for each block that cannot reach it.
+    _older_trees: Dict[int, List[Optional[int]]]
+    #     The older generation of trees, with the same keys and values.
+
+    def __init__(self, grid: Sequence[str], trees: int = TREES) -> None:
+        """Initialize a RoadNetwork drawn by <grid>, one string per row, in
+        the format of a road network file, that remembers the distances to
+        <trees> destinations if it has more than TABLE_CELLS blocks.
+
+        Raise ValueError if <grid> has a character that is not a block.
+
+        >>> network = RoadNetwork(['..#.', '..#.', '....'])
+        >>> network.distance(Location(0, 0), Location(0, 3))
+        7
+        """
+        super().__init__()
+        self.rows = len(grid)
+        self.columns = max((len(line) for line in grid), default=0)
+        self.searches = 0
+        self._blocks = [line.ljust(self.columns, _CLOSED) for line in grid]
+        for row, line in enumerate(self._blocks):
+            for block in line:
+                if block != _OPEN and block != _CLOSED and \
+                        block not in _ARROWS:
+                    raise ValueError(f"line {row + 1}: unknown block "
+                                     f"{block!r}")
+        self._backward = [[] for _ in range(self.rows * self.columns)]
+        for row in range(self.rows):
+            for column in range(self.columns):
+                for d_row, d_col in _MOVES:
+                    if self._can_move(row, column, d_row, d_col):
+                        self._backward[(row + d_row) * self.columns +
+                                       column + d_col].append(
+                            row * self.columns + column)
+        self._trees = (trees + 1) // 2
+        self._recent_trees = {}
+        self._older_trees = {}
+        if self.rows * self.columns <= TABLE_CELLS:
+            # The table is indexed by origin, so it is the trees turned
+            # around.
+            trees_to = [self._search(end)
+                        for end in range(self.rows * self.columns)]
+            self._columns = self.columns
+            self._table = [list(distances) for distances in zip(*trees_to)]
+
+    def __str__(self) -> str:
+        """Return a string representation of this network.
+
+        >>> print(RoadNetwork(['.#', '..']))
+        RoadNetwork (2x2 grid, 3 open blocks)
+        """
+        open_blocks = sum(len(line) - line.count(_CLOSED)
+                          for line in self._blocks)
+        return f"RoadNetwork ({self.rows}x{self.columns} grid, " \
+               f"{open_blocks} open blocks)"
+
+    def _can_move(self, row: int, column: int, d_row: int, d_col: int) \
+            -> bool:
+        """Return True iff a driver can move from the block at <row> and
+        <column> to its neighbour at <d_row> and <d_col> from it.
+
+        """
+        here = self._blocks[row][column]
+        if here == _CLOSED or _ARROWS.get(here) == (-d_row, -d_col):
+            return False
+        if not (0 <= row + d_row < self.rows and
+                0 <= column + d_col < self.columns):
+            return False
+        there = self._blocks[row + d_row][column + d_col]
+        return there != _CLOSED and _ARROWS.get(there) != (-d_row, -d_col)
+
+    def _search(self, end: int) -> List[Optional[int]]:
+        """Return the distance to block <end> from each block, or None for
+        each block that cannot reach it.
+
+        """
+        self.searches += 1
+        backward = self._backward
+        distances = [None] * len(backward)
+        distances[end] = 0
+        layer = [end]
+        distance = 0
+        while layer:
+            distance += 1
+            following = []
+            for here in layer:
+                for there in backward[here]:
+                    if distances[there] is None:
+                        distances[there] = distance
+                        following.append(there)
+            layer = following
+        return distances
+
+    def _tree(self, end: int) -> List[Optional[int]]:
+        """Return the distance to block <end> from each block, searching for
+        them only if they are not remembered.
+
+        """
+        tree = self._recent_trees.get(end)
+        if tree is not None:
+            return tree
+        tree = self._older_trees.get(end)
+        if tree is None:
+            tree = self._search(end)
+        if len(self._recent_trees) >= self._trees:
+            self._older_trees = self._recent_trees
+            self._recent_trees = {}
+        self._recent_trees[end] = tree
+        return tree
+
+    def _index(self, location: Location) -> int:
+        """Return the index of the block at <location>.
+
+        Raise ValueError if <location> is not on the grid.
+        """
+        if not (0 <= location.row < self.rows and
+                0 <= location.column < self.columns):
+            raise ValueError(f"{location} is not on the road network")
+        return location.row * self.columns + location.column
+
+    def measure(self, origin: Location, destination: Location) -> int:
+        """Return the distance from <origin> to <destination> along the
+        roads.
+
+        Raise ValueError if there is no route between them.
+
+        >>> network = RoadNetwork(['.' * 40] * 40 + ['>' * 40])
+        >>> network.measure(Location(40, 5), Location(40, 2))
+        5
+        >>> network.measure(Location(40, 2), Location(40, 5))
+        3
+        >>> network.searches
+        2
+        """
+        start = self._index(origin)
+        distance = self._tree(self._index(destination))[start]
+        if distance is None:
+            raise ValueError(f"no route from {origin} to {destination}")
+        return distance
+
+
+def load_road_network(filename: str, trees: int = TREES) -> RoadNetwork:
+    """Return the road network in <filename>, which remembers the distances
+    to <trees> destinations if it is large.
+
+    Trailing blank lines are ignored. Raise ValueError naming the line of
+    any character that is not a block.
+
+    Precondition: the file stored at <filename> is in the format of a road
+    network file.
+    """
+    with open(filename) as file:
+        grid = [line.rstrip("\n") for line in file]
+    while grid and not grid[-1].strip():
+        grid.pop()
+    return RoadNetwork(grid, trees)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'allowed-io': ['load_road_network'],
+            'extra-imports': ['typing', 'location', 'oracle']})
@@ -0,0 +1,250 @@
+"""
+The runner module runs many simulation scenarios in a pool of processes and
+collects their reports into one table.
+
+A scenario names its events, either an events file (text or binary) or a
+function that generates events from a seed, together with the event queue
+engine and dispatcher to simulate them with. Every scenario is given its own
+seed, and the random module is seeded with it before the scenario is run, so
+a table is the same no matter how many processes produced it or in which
+order they finished.
+
+=== Constants ===
+COLUMNS: The columns that every row of a results table starts with.
+"""
+
+import argparse
+import csv
+import itertools
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, \
+    TextIO, Union
+from batch import BatchDispatcher
+from event import Event, create_event_list
+from monitor import Monitor
+from scenario import MAGIC, ScenarioFile
+from simulation import Simulation, HEAP, CALENDAR
+
+COLUMNS = ("scenario", "events", "engine", "window", "seed", "until")
+
+
+class Scenario:
+    """A simulation to be run by the runner.
+
+    === Attributes ===
+    name: A name for the scenario, used in the results table.
+    events: The filename of a text or binary events file, or a function,
+        such as a Workload, that takes a seed and returns the initial events.
+        Its events are sorted by timestamp before they are run, so they may
+        be in any order. A function must be defined at the top level of a
+        module so that it can be sent to other processes.
+    engine: The event queue engine, either HEAP or CALENDAR.
+    window: The window of a BatchDispatcher, or None for the greedy
+        Dispatcher.
+    seed: The seed for the random module, and for the events function.
+    until: Only the events before this time are simulated, or every event
+        if it is None.
+    """
+
+    name: str
+    events: Union[str, Callable[[int], Iterable[Event]]]
+    engine: str
+    window: Optional[int]
+    seed: int
+    until: Optional[int]
+
+    def __init__(self, name: str,
+                 events: Union[str, Callable[[int], Iterable[Event]]],
+                 engine: str = HEAP, window: Optional[int] = None,
+                 seed: int = 0, until: Optional[int] = None) -> None:
+        """Initialize a Scenario.
+
+        >>> Scenario('base', 'events.txt').engine
+        'heap'
+        """
+        self.name = name
+        self.events = events
+        self.engine = engine
+        self.window = window
+        self.seed = seed
+        self.until = until
+
+    def __str__(self) -> str:
+        """Return a string representation of this scenario.
+
+        >>> print(Scenario('base', 'events.txt', window=5, seed=3))
+        base: events.txt, heap engine, batch window 5, seed 3
+        >>> print(Scenario('base', 'events.txt', until=60))
+        base: events.txt, heap engine, greedy, seed 0, until 60
+        """
+        dispatch = "greedy" if self.window is None \
+            else f"batch window {self.window}"
+        until = "" if self.until is None else f", until {self.until}"
+        return f"{self.name}: {self._source()}, {self.engine} engine, " \
+               f"{dispatch}, seed {self.seed}{until}"
+
+    def _source(self) -> str:
+        """Return a description of where the events of this scenario come
+        from.
+
+        """
+        if isinstance(self.events, str):
+            return self.events
+        if hasattr(self.events, "__qualname__"):
+            return f"{self.events.__module__}.{self.events.__qualname__}"
+        return str(self.events)
+
+    def run(self) -> Dict[str, object]:
+        """Run this scenario and return its row of the results table: the
+        COLUMNS, followed by the report of the simulation.
+
+        >>> row = Scenario('base', 'events.txt').run()
+        >>> row['scenario'], row['average_driver_trip_distance']
+        ('base', 3.8333333333333335)
+        """
+        random.seed(self.seed)
+        dispatcher = None if self.window is None \
+            else BatchDispatcher(self.window)
+        simulation = Simulation(self.engine, Monitor(history=False),
+                                dispatcher)
+        if not isinstance(self.events, str):
+            simulation.feed(self.events(self.seed))
+            report = simulation.run_until(self.until)
+        elif _is_binary(self.events):
+            with ScenarioFile(self.events) as scenario:
+                simulation.feed(scenario.sorted_events(), presorted=True)
+                report = simulation.run_until(self.until)
+        else:
+            simulation.feed(create_event_list(self.events))
+            report = simulation.run_until(self.until)
+        row = dict(zip(COLUMNS, (self.name, self._source(), self.engine,
+                                 self.window, self.seed, self.until)))
+        row.update(report)
+        return row
+
+
+def _is_binary(filename: str) -> bool:
+    """Return True iff <filename> is a binary scenario.
+
+    """
+    with open(filename, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def _run(scenario: Scenario) -> Dict[str, object]:
+    """Run <scenario> in a worker process.
+
+    """
+    return scenario.run()
+
+
+def sweep(events: Iterable[Union[str, Callable[[int], Iterable[Event]]]],
+          engines: Iterable[str] = (HEAP,),
+          windows: Iterable[Optional[int]] = (None,),
+          repeats: int = 1, seed: int = 0,
+          until: Optional[int] = None) -> List[Scenario]:
+    """Return a scenario for every combination of events, engine, window and
+    repeat, each simulating the events before <until>.
+
+    The scenarios are seeded seed, seed + 1, seed + 2, ... in order, so the
+    same arguments always give the same scenarios.
+
+    >>> for s in sweep(['a.txt', 'b.txt'], windows=[None, 5], seed=10):
+    ...     print(s)
+    a.txt: a.txt, heap engine, greedy, seed 10
+    a.txt: a.txt, heap engine, batch window 5, seed 11
+    b.txt: b.txt, heap engine, greedy, seed 12
+    b.txt: b.txt, heap engine, batch window 5, seed 13
+    """
+    scenarios = []
+    combinations = itertools.product(events, engines, windows, range(repeats))
+    for i, (source, engine, window, _) in enumerate(combinations):
+        name = source if isinstance(source, str) \
+            else getattr(source, "__name__", type(source).__name__)
+        scenarios.append(Scenario(name, source, engine, window, seed + i,
+                                  until))
+    return scenarios
+
+
+def run_scenarios(scenarios: Iterable[Scenario],
+                  workers: Optional[int] = None) \
+        -> Iterator[Dict[str, object]]:
+    """Run <scenarios> in a pool of <workers> processes, and yield the row of
+    each one in the order of <scenarios> as soon as it and every scenario
+    before it has finished.
+
+    workers: The number of processes, or the number of CPUs if None. With 0,
+        the scenarios are run one at a time in this process.
+    """
+    if workers == 0:
+        for scenario in scenarios:
+            yield scenario.run()
+        return
+    with ProcessPoolExecutor(workers) as executor:
+        yield from executor.map(_run, scenarios)
+
+
+def write_table(rows: Iterable[Dict[str, object]], file: TextIO) -> int:
+    """Write <rows> to <file> as CSV, one line as each row arrives, and return
+    the number of rows written.
+
+    The columns are COLUMNS followed by the report keys of the first row.
+    """
+    writer = None
+    count = 0
+    for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(file, list(row))
+            writer.writeheader()
+        writer.writerow(row)
+        file.flush()
+        count += 1
+    return count
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Run the scenarios given on the command line <argv> and write their
+    results table.
+
+    """
+    parser = argparse.ArgumentParser(
+        description="Run simulation scenarios in parallel.")
+    parser.add_argument("events", nargs="+",
+                        help="text or binary events files")
+    parser.add_argument("--engine", nargs="+", default=[HEAP],
+                        choices=[HEAP, CALENDAR])
+    parser.add_argument("--window", nargs="+", default=["greedy"],
+                        help="batch windows to sweep, or 'greedy'")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--until", type=int, default=None,
+                        help="only simulate the events before this time")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument("--output", default=None,
+                        help="CSV file to write (default: standard output)")
+    args = parser.parse_args(argv)
+    windows = [None if w == "greedy" else int(w) for w in args.window]
+    scenarios = sweep(args.events, args.engine, windows, args.repeats,
+                      args.seed, args.until)
+    rows = run_scenarios(scenarios, args.workers)
+    if args.output is None:
+        write_table(rows, sys.stdout)
+    else:
+        with open(args.output, "w", newline="") as file:
+            write_table(rows, file)
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'allowed-io': ['_is_binary', 'main'],
+            'extra-imports': ['argparse', 'csv', 'itertools', 'random', 'sys',
+                              'concurrent.futures', 'typing', 'batch',
+                              'event', 'monitor', 'scenario', 'simulation']})
+
+    main()
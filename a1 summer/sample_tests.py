@@ -1,18 +1,113 @@
+import gzip
+import io
+import itertools
+import json
+import math
+import pickle
 import pytest
 
 from hypothesis import given
 from hypothesis.strategies import integers, lists
 
-from location import Location, deserialize_location, manhattan_distance
-from event import create_event_list, PassengerRequest, DriverRequest, Pickup, \
-    Dropoff, Cancellation
+from location import Location, deserialize_location, deserialize_locations, \
+    manhattan_distance, clear_locations
+import location
+from event import create_event_list, iter_events, Event, PassengerRequest, \
+    DriverRequest, Pickup, Dropoff, Cancellation
 from monitor import Monitor, Activity, DRIVER, PASSENGER, PICKUP, DROPOFF, \
     CANCEL, REQUEST
 from dispatcher import Dispatcher
-from simulation import Simulation
-from container import PriorityQueue
+from batch import BatchDispatcher, min_cost_assignment
+from benchmarks import BENCHMARKS, compare, run_benchmarks
+import benchmarks
+from runner import Scenario, run_scenarios, sweep, write_table
+from profiling import RunStats
+from shard import run_sharded
+from workload import Hotspot, Workload, write_events
+from simulation import Simulation, CALENDAR, HEAP, restore
+from container import PriorityQueue, CalendarQueue
 from passenger import Passenger
 from driver import Driver
+from sketch import QuantileSketch
+from columnar import load_event_columns
+from columnar_monitor import ColumnarMonitor
+from scenario import ScenarioFile, convert_events
+from grid import DriverGrid
+from oracle import TravelTimeOracle, TIMES
+from road import RoadNetwork, load_road_network
+
+
+# Events are mutable, so every run is given new ones from these functions.
+
+
+def _driver_request(timestamp: int, name: str, column: int) -> DriverRequest:
+    """Return a new request by a driver of speed 1 at <column> of row 0"""
+    return DriverRequest(timestamp, Driver(name, Location(0, column), 1))
+
+
+def _passenger_request(timestamp: int, name: str, patience: int,
+                       origin: int, destination: int) -> PassengerRequest:
+    """Return a new request by a passenger going from column <origin> to
+    column <destination> of row 0"""
+    return PassengerRequest(timestamp, Passenger(
+        name, patience, Location(0, origin), Location(0, destination)))
+
+
+def _walled_dispatcher(batch: bool, columns: list) -> Dispatcher:
+    """Return a dispatcher on a network with a wall at column 3, or a batch
+    dispatcher if <batch>, with an idle driver at each of <columns> of row
+    0"""
+    network = RoadNetwork(['...#.', '...#.', '...#.'])
+    result = BatchDispatcher(oracle=network) if batch else Dispatcher(network)
+    for column in columns:
+        result.request_passenger(Driver(f"d{column}", Location(0, column), 1))
+    return result
+
+
+def _run_on_roads(network: TravelTimeOracle) -> dict:
+    """Return the report of the sample events run on <network>"""
+    monitor = Monitor(distance=network.distance)
+    return Simulation(monitor=monitor, dispatcher=Dispatcher(network)).run(
+        create_event_list("events.txt"))
+
+
+def _rival_requests() -> list:
+    """Return events where two passengers ask at once, and the driver
+    nearest the first is the only one near the second"""
+    return [_driver_request(0, "a", 0), _driver_request(0, "b", 10),
+            _passenger_request(1, "p", 20, 5, 6),
+            _passenger_request(1, "q", 20, 0, 1)]
+
+
+def _crossing_trip() -> list:
+    """Return events where a driver drops a passenger off at column 20, and
+    then serves a passenger at column 21"""
+    return [_driver_request(0, "a", 0),
+            _passenger_request(1, "p", 30, 1, 20),
+            _passenger_request(10, "q", 30, 21, 21)]
+
+
+def _same_time_requests() -> list:
+    """Return events where a passenger asks for a driver at the same time a
+    driver asks for a passenger, and a later passenger has no patience"""
+    return [_passenger_request(0, "p", 9, 3, 5),
+            _driver_request(0, "a", 0),
+            _passenger_request(2, "q", 0, 4, 4)]
+
+
+def _city() -> Workload:
+    """Return a small workload with hotspots and mixed speeds"""
+    return Workload(rows=30, columns=40, drivers=20, duration=200,
+                    demand=[0.5, 2.0, 1.0],
+                    hotspots=[Hotspot(Location(5, 5), 2.0, 3.0),
+                              Hotspot(Location(25, 30), 4.0)],
+                    speeds=[(1, 1.0), (2, 3.0)], patience=6.0, ramp=10)
+
+
+def _backwards(seed: int) -> list:
+    """Return the events of the small workload for <seed>, latest first, with
+    events at the same time still in their order"""
+    return sorted(_city().events(seed), key=lambda e: -e.timestamp)
 
 
 def test_location_print() -> None:
@@ -55,6 +150,120 @@ def test_simulation_run() -> None:
         3.8333333333333335)
 
 
+def test_simulation_run_stream() -> None:
+    """Test that streaming the initial events gives the same report"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    report = Simulation().run(iter_events("events.txt"), presorted=True)
+    assert report == expected
+
+
+def test_simulation_run_stream_unsorted() -> None:
+    """Test that a stream that goes back in time is rejected"""
+    events = create_event_list("events.txt")
+    with pytest.raises(ValueError):
+        Simulation().run(reversed(events), presorted=True)
+
+
+def test_columnar_matches_event_list() -> None:
+    """Test that the columnar loader builds the same events as
+    create_event_list"""
+    columns = load_event_columns("events.txt")
+    expected = [str(event) for event in create_event_list("events.txt")]
+    assert [str(event) for event in columns] == expected
+    report = Simulation().run(columns.sorted_events(), presorted=True)
+    assert report == Simulation().run(create_event_list("events.txt"))
+
+
+def test_columnar_matches_iter_events_with_tabs(tmp_path) -> None:
+    """Test that the columnar loader splits lines on any whitespace, like
+    iter_events"""
+    path = tmp_path / "events.txt"
+    path.write_text("# tabs\n0\tDriverRequest\ta\t1,1\t1\n"
+                    "3  PassengerRequest\tb 1,1\t2,2  5\n")
+    expected = [str(event) for event in iter_events(str(path))]
+    assert len(expected) == 2
+    assert [str(event) for event in load_event_columns(str(path))] == \
+        expected
+
+
+@pytest.mark.parametrize("text", ["", "# only a comment\n\n"])
+def test_columnar_without_events(tmp_path, text: str) -> None:
+    """Test that a file with no events loads as empty columns"""
+    path = tmp_path / "events.txt"
+    path.write_text(text)
+    columns = load_event_columns(str(path))
+    assert len(columns) == 0 and columns.names == []
+    assert list(columns.sorted_events()) == []
+
+
+def test_columnar_reports_bad_line(tmp_path) -> None:
+    """Test that the columnar loader names the line of a malformed event"""
+    path = tmp_path / "events.txt"
+    path.write_text("# header\n0 DriverRequest a 1,1 1\n\n"
+                    "3 PassengerRequest b 1,1 2;2 5\n")
+    with pytest.raises(ValueError, match="line 4"):
+        load_event_columns(str(path))
+
+
+def test_scenario_round_trip(tmp_path) -> None:
+    """Test that a binary scenario holds the same events as its text file"""
+    path = str(tmp_path / "events.bin")
+    assert convert_events("events.txt", path) == 12
+    expected = [str(event) for event in create_event_list("events.txt")]
+    with ScenarioFile(path) as scenario:
+        assert scenario.is_sorted
+        assert len(scenario) == 12
+        assert [str(event) for event in scenario] == expected
+        assert str(scenario.event(11)) == expected[11]
+        report = Simulation().run(scenario.sorted_events(), presorted=True)
+    assert report == Simulation().run(create_event_list("events.txt"))
+
+
+def test_scenario_unsorted(tmp_path) -> None:
+    """Test that an unsorted scenario is streamed in timestamp order"""
+    text = tmp_path / "events.txt"
+    text.write_text("5 DriverRequest a 1,1 1\n"
+                    "2 PassengerRequest b 1,1 2,2 5\n"
+                    "5 PassengerRequest c 3,3 4,4 5\n")
+    path = str(tmp_path / "events.bin")
+    convert_events(str(text), path)
+    with ScenarioFile(path) as scenario:
+        assert not scenario.is_sorted
+        assert [event.timestamp for event in scenario.sorted_events()] == \
+               [2, 5, 5]
+        assert [str(event) for event in scenario.sorted_events()][1] == \
+               "5 -- id: a, location: (1,1), speed: 1, idle: True, " \
+               "destination: None, passenger: None: Request a passenger"
+
+
+def test_scenario_closes_mid_iteration(tmp_path) -> None:
+    """Test that a scenario can be closed while it is only partly read"""
+    path = str(tmp_path / "events.bin")
+    convert_events("events.txt", path)
+    scenario = ScenarioFile(path)
+    events = iter(scenario)
+    first = next(events)
+    scenario.close()
+    assert first.timestamp == 0
+
+
+def test_scenario_without_events(tmp_path) -> None:
+    """Test that an empty events file converts to a scenario with no ids"""
+    text = tmp_path / "events.txt"
+    text.write_text("")
+    path = str(tmp_path / "events.bin")
+    assert convert_events(str(text), path) == 0
+    with ScenarioFile(path) as scenario:
+        assert scenario.names == []
+        assert list(scenario) == []
+
+
+def test_scenario_rejects_text() -> None:
+    """Test that a text file is not mistaken for a binary scenario"""
+    with pytest.raises(ValueError):
+        ScenarioFile("events.txt")
+
+
 def test_special_events() -> None:
     """Test Cancellation and Pickup on a basic set of events"""
 
@@ -90,68 +299,195 @@ def test_special_events() -> None:
     assert passenger.status == 'cancelled'
 
 
+def _contents(pq: PriorityQueue) -> list:
+    """Return the items in <pq> in the order they would be removed."""
+    return [entry[0] for entry in sorted(pq._items)]
+
+
 def test_container_adds() -> None:
     """Test the adding and removing of events in a priorityqueue"""
     egad = PriorityQueue()
-    assert egad._items == []
+    assert _contents(egad) == []
     egad.add("bruh")
     egad.add("idk")
     egad.add("lol")
-    assert egad._items == ["bruh", "idk", "lol"]
+    assert _contents(egad) == ["bruh", "idk", "lol"]
     egad.add("cro")
-    assert egad._items == ["bruh", "cro", "idk", "lol"]
+    assert _contents(egad) == ["bruh", "cro", "idk", "lol"]
     egad.remove()
-    assert egad._items == ["cro", "idk", "lol"]
+    assert _contents(egad) == ["cro", "idk", "lol"]
     egad.add("lol")
-    assert egad._items == ["cro", "idk", "lol", "lol"]
+    assert _contents(egad) == ["cro", "idk", "lol", "lol"]
     egad.add("bro")
-    assert egad._items == ["bro", "cro", "idk", "lol", "lol"]
+    assert _contents(egad) == ["bro", "cro", "idk", "lol", "lol"]
     egad.remove()
     egad.remove()
-    assert egad._items == ["idk", "lol", "lol"]
+    assert _contents(egad) == ["idk", "lol", "lol"]
     egad.add("z")
-    assert egad._items == ["idk", "lol", "lol", "z"]
+    assert _contents(egad) == ["idk", "lol", "lol", "z"]
     egad.remove()
     egad.remove()
-    assert egad._items == ["lol", "z"]
+    assert _contents(egad) == ["lol", "z"]
     egad.add("mon")
-    assert egad._items == ["lol", "mon", "z"]
+    assert _contents(egad) == ["lol", "mon", "z"]
     egad.remove()
     egad.remove()
     egad.remove()
-    assert egad._items == []
+    assert _contents(egad) == []
 
 
 def test_container_add_nice() -> None:
     bob = PriorityQueue()
     bob.add(2)
     bob.add(1)
-    assert bob._items == [1, 2]
+    assert _contents(bob) == [1, 2]
     bob.add(4)
     bob.add(3)
-    assert bob._items == [1, 2, 3, 4]
+    assert _contents(bob) == [1, 2, 3, 4]
     bob.add(7)
     bob.add(5)
-    assert bob._items == [1, 2, 3, 4, 5, 7]
+    assert _contents(bob) == [1, 2, 3, 4, 5, 7]
     bob.remove()
     bob.add(1)
-    assert bob._items == [1, 2, 3, 4, 5, 7]
+    assert _contents(bob) == [1, 2, 3, 4, 5, 7]
     eiad = PriorityQueue()
-    assert len(eiad._items) == 0
+    assert eiad.is_empty()
     eiad.add(2)
-    assert eiad._items == [2]
+    assert _contents(eiad) == [2]
     eiad.add(3)
-    assert eiad._items == [2, 3]
+    assert _contents(eiad) == [2, 3]
     eiad.add(4)
-    assert eiad._items == [2, 3, 4]
+    assert _contents(eiad) == [2, 3, 4]
     eiad.add(4)
-    assert eiad._items == [2, 3, 4, 4]
+    assert _contents(eiad) == [2, 3, 4, 4]
     eiad.add(4)
-    assert eiad._items == [2, 3, 4, 4, 4]
+    assert _contents(eiad) == [2, 3, 4, 4, 4]
     eiad.remove()
     eiad.remove()
     eiad.add(4)
-    assert eiad._items == [4, 4, 4, 4]
+    assert _contents(eiad) == [4, 4, 4, 4]
+
+
+def test_container_fifo_ties() -> None:
+    """Test that events with equal timestamps leave in insertion order"""
+    first, second, third = Event(3), Event(3), Event(1)
+    pq = PriorityQueue()
+    pq.add(first)
+    pq.add(second)
+    pq.add(third)
+    assert pq.remove() is third
+    assert pq.remove() is first
+    assert pq.remove() is second
+
+
+def test_container_bulk_add() -> None:
+    """Test that bulk_add keeps FIFO order with items added before it"""
+    early, late = Event(5), Event(5)
+    pq = PriorityQueue()
+    pq.add(early)
+    pq.bulk_add([Event(9), late, Event(2)])
+    assert [pq.remove().timestamp for _ in range(2)] == [2, 5]
+    assert pq.remove() is late
+    assert pq.remove().timestamp == 9
+    assert pq.is_empty()
+
+
+@given(lists(integers()))
+def test_container_sorted_removal(lst: list[int]) -> None:
+    """Test that items are removed in sorted order"""
+    pq = PriorityQueue()
+    pq.bulk_add(lst)
+    assert [pq.remove() for _ in lst] == sorted(lst)
+
+
+@given(lists(integers(min_value=0, max_value=50)))
+def test_calendar_matches_heap(lst: list[int]) -> None:
+    """Test that a CalendarQueue removes events in the same order as a
+    PriorityQueue"""
+    events = [Event(x) for x in lst]
+    pq = PriorityQueue()
+    cq = CalendarQueue()
+    pq.bulk_add(events)
+    for event in events:
+        cq.add(event)
+    while not pq.is_empty():
+        assert cq.remove() is pq.remove()
+    assert cq.is_empty()
+
+
+@pytest.mark.parametrize("queue_class", [PriorityQueue, CalendarQueue])
+@given(lists(integers(min_value=0, max_value=20)),
+       lists(integers(min_value=0)))
+def test_discard_skips_items(queue_class: type, lst: list[int],
+                             picks: list[int]) -> None:
+    """Test that discarded events are never removed, and the rest come out
+    in the same order as without them"""
+    events = [Event(x) for x in lst]
+    queue = queue_class()
+    queue.bulk_add(events)
+    dead = set()
+    for pick in picks:
+        if len(dead) < len(events):
+            live = [e for e in events if id(e) not in dead]
+            victim = live[pick % len(live)]
+            queue.discard(victim)
+            dead.add(id(victim))
+            assert len(queue) == len(events) - len(dead)
+    expected = PriorityQueue()
+    expected.bulk_add(e for e in events if id(e) not in dead)
+    while not expected.is_empty():
+        assert queue.peek() is expected.peek()
+        assert queue.remove() is expected.remove()
+    assert queue.is_empty() and len(queue) == 0
+
+
+@pytest.mark.parametrize("engine", [HEAP, CALENDAR])
+def test_picked_up_cancellations_are_dropped(monkeypatch,
+                                             engine: str) -> None:
+    """Test that dropping the cancellations of picked up passengers keeps
+    the report, and that they are never done or left in the queue"""
+    city = _city()
+    lazy = RunStats(sample_every=1)
+    report = Simulation(engine, stats=lazy).run(city.events(2),
+                                                presorted=True)
+    monkeypatch.setattr(Pickup, "revokes", lambda self: [])
+    eager = RunStats(sample_every=1)
+    assert Simulation(engine, stats=eager).run(city.events(2),
+                                               presorted=True) == report
+    assert lazy.by_type["Pickup"].count == eager.by_type["Pickup"].count
+    assert lazy.by_type["Cancellation"].count < \
+        eager.by_type["Cancellation"].count
+    assert lazy.max_queue < eager.max_queue
+
+
+@pytest.mark.parametrize("queue_class", [PriorityQueue, CalendarQueue])
+@given(lists(integers(min_value=0, max_value=5), min_size=1),
+       lists(integers(min_value=0)))
+def test_remove_batch(queue_class: type, lst: list[int],
+                      picks: list[int]) -> None:
+    """Test that remove_batch takes the live events of the earliest
+    timestamp, in the order they were added"""
+    events = [Event(x) for x in lst]
+    queue = queue_class()
+    queue.bulk_add(events)
+    live = events[:]
+    for pick in picks[:len(events) - 1]:
+        queue.discard(live.pop(pick % len(live)))
+    while not queue.is_empty():
+        first = min(e.timestamp for e in live)
+        expected = [e for e in live if e.timestamp == first]
+        batch = queue.remove_batch()
+        assert len(batch) == len(expected)
+        assert all(a is b for a, b in zip(batch, expected))
+        live = [e for e in live if e.timestamp != first]
+    assert live == []
+
+
+def test_simulation_run_calendar() -> None:
+    """Test that the calendar queue engine gives the same report"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    report = Simulation(CALENDAR).run(create_event_list("events.txt"))
+    assert report == expected
 
 
 @given(integers())
@@ -229,6 +565,61 @@ def test_location_lize() -> None:
            Location(100000000, 4294729479)
 
 
+def test_location_deser_rejects() -> None:
+    """Test that malformed locations are rejected with their line number"""
+    for bad in ["3", "3,4,5", "a,b", "", "(3,4", "__import__('os')"]:
+        with pytest.raises(ValueError):
+            deserialize_location(bad)
+    with pytest.raises(ValueError, match="line 12"):
+        deserialize_location("3;4", 12)
+
+
+@given(lists(lists(integers(min_value=0), min_size=2, max_size=2)))
+def test_location_deser_batch(coords: list) -> None:
+    """Test that a column of locations is parsed like one at a time"""
+    strings = ["{},{}".format(row, col) for row, col in coords]
+    assert deserialize_locations(strings) == \
+           [deserialize_location(s) for s in strings]
+
+
+def test_location_deser_batch_rejects() -> None:
+    """Test that the batch parser reports the line of a bad location"""
+    with pytest.raises(ValueError, match="line 9"):
+        deserialize_locations(["1,2", "3,4,5", "6"], [5, 9, 11])
+
+
+def test_location_interned() -> None:
+    """Test that locations are shared, hashable and immutable"""
+    assert Location(3, 4) is deserialize_location("3,4")
+    assert len({Location(1, 1), Location(1, 1), Location(1, 2)}) == 2
+    with pytest.raises(AttributeError):
+        Location(3, 4).row = 5
+    assert pickle.loads(pickle.dumps(Location(3, 4))) is Location(3, 4)
+
+
+def test_location_cache_bounded() -> None:
+    """Test that the shared locations are bounded and can be cleared"""
+    for row in range(location._LOCATION_CACHE_SIZE // 100 + 1):
+        for column in range(100):
+            Location(row, column)
+    assert 0 < len(location._LOCATIONS) <= location._LOCATION_CACHE_SIZE
+    assert Location(3, 4) is Location(3, 4)
+    clear_locations()
+    assert len(location._LOCATIONS) == 0
+    assert Location(3, 4) == deserialize_location("3,4")
+
+
+def test_compact_objects() -> None:
+    """Test that simulation objects don't carry a per-instance dict"""
+    passenger = Passenger("p", 2, Location(1, 3), Location(1, 2))
+    driver = Driver("d", Location(1, 2), 3)
+    activity = Activity(0, PICKUP, "d", Location(1, 2))
+    for thing in [Location(1, 2), passenger, driver, activity]:
+        assert not hasattr(thing, "__dict__")
+    assert passenger.id is Passenger("".join(["p"]), 2, Location(1, 3),
+                                     Location(1, 2)).id
+
+
 def test_passenger_hypeq() -> None:
     eiad = Passenger("bruh", 2, Location(1, 3), Location(1, 2))
     idk = Passenger("bruh", 2, Location(1, 3), Location(1, 2))
@@ -297,11 +688,17 @@ def test_drive_start_drive(n1, n2, n3, n4, n5) -> None:
     assert eiad.is_idle is False
 
 
+def _waiting(dispatcher: Dispatcher) -> list[Passenger]:
+    """Return the passengers waiting in <dispatcher>, longest waiting
+    first."""
+    return list(dispatcher._waiting_passengers.values())
+
+
 def test_dispathcer_requestdrive() -> None:
     eiad = Dispatcher()
     idk = Passenger('eiad', 3, Location(1, 2), Location(5, 2))
     assert eiad.request_driver(idk) is None
-    assert eiad._waiting_passengers == [idk]
+    assert _waiting(eiad) == [idk]
 
 
 def test_dispathcer_requestpassenger() -> None:
@@ -313,27 +710,32 @@ def test_dispathcer_requestpassenger() -> None:
     assert eiad.request_passenger(damyan) is None
     assert eiad._drivers == {'damyan': damyan}
     assert eiad.request_driver(idk) == eiad._drivers['damyan']
-    assert eiad._waiting_passengers == []
-    eiad._drivers.pop('damyan')
-    assert eiad._drivers == {}
+    assert _waiting(eiad) == []
+    damyan.start_drive(idk.origin)
+    assert eiad._drivers == {'damyan': damyan}
     assert eiad.cancel_ride(idk) is None
     assert eiad.request_driver(idk) is None
-    assert eiad._waiting_passengers == [idk]
+    assert _waiting(eiad) == [idk]
     assert eiad.request_passenger(damyan) == idk
-    assert eiad._waiting_passengers == [idk]
-    eiad._drivers.pop('damyan')
+    assert _waiting(eiad) == []
     bruh = Passenger('bruh', 2, Location(3, 3), Location(2, 1))
     assert eiad.request_driver(bruh) is None
     assert eiad.request_driver(idk) is None
-    assert eiad._waiting_passengers == [idk, bruh, idk]
-    assert eiad.request_passenger(damyan) == bruh
+    assert eiad.request_driver(bruh) is None
+    assert _waiting(eiad) == [bruh, idk]
+    assert eiad.cancel_ride(bruh) is None
+    assert eiad.request_driver(bruh) is None
+    assert _waiting(eiad) == [idk, bruh]
     assert eiad.request_passenger(damyan) == idk
+    assert eiad.request_passenger(damyan) == bruh
     assert eiad.request_passenger(damyan) is None
     assert eiad.cancel_ride(idk) is None
-    assert eiad._waiting_passengers == [bruh]
+    assert _waiting(eiad) == []
+    eiad.request_driver(bruh)
+    eiad.request_driver(idk)
     eiad.cancel_ride(bruh)
     eiad.cancel_ride(idk)
-    assert eiad._waiting_passengers == []
+    assert _waiting(eiad) == []
     assert eiad._drivers == {'damyan': damyan}
     nizar = Driver("nizar", Location(4, 6), 2)
     eiad.request_passenger(nizar)
@@ -343,6 +745,607 @@ def test_dispathcer_requestpassenger() -> None:
     assert eiad.request_driver(idk) == bill
 
 
+@given(lists(lists(integers(min_value=0, max_value=40), min_size=3,
+                   max_size=3), min_size=1),
+       integers(min_value=0, max_value=40),
+       integers(min_value=0, max_value=40))
+def test_grid_nearest_matches_scan(drivers: list, row: int, col: int) -> None:
+    """Test that the grid finds the same driver as a scan of every driver,
+    breaking ties by the order the drivers were added"""
+    grid = DriverGrid(4)
+    fleet = []
+    for i, (d_row, d_col, speed) in enumerate(drivers):
+        driver = Driver(str(i), Location(d_row, d_col), speed % 3 + 1)
+        grid.add(driver)
+        fleet.append(driver)
+    fleet[0].location = Location(col, row)
+    grid.update(fleet[0])
+    target = Location(row, col)
+    expected = fleet[0]
+    for driver in fleet:
+        if driver.get_travel_time(target) < expected.get_travel_time(target):
+            expected = driver
+    assert grid.nearest(target) is expected
+
+
+def test_grid_follows_driver() -> None:
+    """Test that the grid tracks a registered driver as it moves"""
+    dispatcher = Dispatcher()
+    driver = Driver('d', Location(0, 0), 1)
+    other = Driver('o', Location(20, 20), 1)
+    dispatcher.request_passenger(driver)
+    dispatcher.request_passenger(other)
+    passenger = Passenger('p', 5, Location(30, 30), Location(40, 40))
+    assert dispatcher.request_driver(passenger) is other
+    driver.start_drive(Location(40, 40))
+    driver.end_drive()
+    assert dispatcher.request_driver(passenger) is driver
+
+
+def test_dispatcher_skips_busy_drivers() -> None:
+    """Test that only idle drivers are offered to passengers"""
+    dispatcher = Dispatcher()
+    near = Driver('near', Location(1, 1), 1)
+    far = Driver('far', Location(9, 9), 1)
+    dispatcher.request_passenger(near)
+    dispatcher.request_passenger(far)
+    passenger = Passenger('p', 5, Location(1, 2), Location(3, 3))
+    near.start_drive(Location(5, 5))
+    assert dispatcher.request_driver(passenger) is far
+    far.start_drive(passenger.origin)
+    assert dispatcher.request_driver(passenger) is None
+    assert _waiting(dispatcher) == [passenger]
+    near.end_drive()
+    assert dispatcher.request_driver(passenger) is near
+
+
+@given(lists(lists(integers(min_value=0, max_value=20), min_size=4,
+                   max_size=4), min_size=1, max_size=5),
+       integers(min_value=1, max_value=4))
+def test_min_cost_assignment(values: list, width: int) -> None:
+    """Test that the assignment cost matches a brute-force search"""
+    cost = [row[:width] for row in values]
+    rows, cols = min_cost_assignment(cost)
+    size = min(len(cost), width)
+    assert len(rows) == len(set(rows)) == len(set(cols)) == size
+    best = min(sum(cost[r][c] for r, c in zip(chosen_rows, chosen_cols))
+               for chosen_rows in itertools.combinations(range(len(cost)),
+                                                         size)
+               for chosen_cols in itertools.permutations(range(width), size))
+    assert sum(cost[r][c] for r, c in zip(rows, cols)) == best
+
+
+def test_batch_dispatch_beats_greedy() -> None:
+    """Test that a batch assignment lowers the wait of simultaneous
+    requests"""
+    greedy = Simulation().run(_rival_requests())
+    batched = Simulation(dispatcher=BatchDispatcher()).run(_rival_requests())
+    assert greedy["average_passenger_wait_time"] == 7.5
+    assert batched["average_passenger_wait_time"] == 2.5
+    windowed = Simulation(dispatcher=BatchDispatcher(4)).run(
+        _rival_requests())
+    assert windowed["average_passenger_wait_time"] == 5.5
+
+
+def test_batch_dispatch_serves_everyone() -> None:
+    """Test that batched dispatch serves the sample events"""
+    monitor = Monitor()
+    Simulation(monitor=monitor, dispatcher=BatchDispatcher(3)).run(
+        create_event_list("events.txt"))
+    assert all(len(activities) == 2
+               for activities in monitor._activities[PASSENGER].values())
+
+
+def test_runner_pool_matches_serial() -> None:
+    """Test that a process pool gives the same table, in the same order, as
+    running the scenarios one at a time"""
+    scenarios = sweep(["events.txt"], [HEAP, CALENDAR], [None, 0, 3])
+    serial = list(run_scenarios(scenarios, workers=0))
+    assert list(run_scenarios(scenarios, workers=2)) == serial
+    assert [row["seed"] for row in serial] == list(range(6))
+    assert serial[0]["average_driver_trip_distance"] == \
+        pytest.approx(3.8333, 0.01)
+
+
+def test_runner_write_table() -> None:
+    """Test that the results table has a header and one line per scenario"""
+    out = io.StringIO()
+    rows = run_scenarios(sweep(["events.txt"], repeats=2), workers=0)
+    assert write_table(rows, out) == 2
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 3
+    assert lines[0].startswith(
+        "scenario,events,engine,window,seed,until,")
+
+
+def test_sharded_single_shard_matches_simulation() -> None:
+    """Test that one shard gives the same report as a single simulation"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    assert run_sharded(create_event_list("events.txt"), shards=1) == expected
+
+
+def test_sharded_driver_moves_between_shards() -> None:
+    """Test that a driver dropped off in another strip serves passengers
+    there, at the end of the window it left in"""
+    single = Simulation().run(_crossing_trip())
+    monitor = Monitor(history=False)
+    sharded = run_sharded(_crossing_trip(), shards=2, window=5,
+                          monitor=monitor)
+    # p waits 1; q waits until the dropoff at 21 plus the drive of 1, and in
+    # the sharded run until the end of the window [21, 26).
+    assert single["average_passenger_wait_time"] == (1 + 12) / 2
+    assert sharded["average_passenger_wait_time"] == (1 + 17) / 2
+    assert sharded["average_driver_total_distance"] == \
+        single["average_driver_total_distance"]
+    assert monitor._waited == 2 and len(monitor._drivers) == 1
+
+
+def test_sharded_raises_shard_error() -> None:
+    """Test that an error in one shard is raised by run_sharded, instead of
+    leaving the other shards waiting forever"""
+    events = [DriverRequest(0, Driver("a", Location(0, 0), 0)),
+              _passenger_request(1, "p", 30, 1, 2),
+              _driver_request(0, "b", 20),
+              _passenger_request(1, "q", 30, 21, 22)]
+    with pytest.raises(ZeroDivisionError):
+        run_sharded(events, shards=2)
+
+
+@pytest.mark.parametrize("engine", [HEAP, CALENDAR])
+@pytest.mark.parametrize("presorted", [False, True])
+def test_checkpoint_restore_matches_full_run(tmp_path, engine: str,
+                                             presorted: bool) -> None:
+    """Test that a simulation restored from a checkpoint finishes with the
+    same report as one that ran straight through"""
+    snapshot = str(tmp_path / "mid.sim.gz")
+    expected = Simulation(engine).run(create_event_list("events.txt"))
+    first = Simulation(engine)
+    events = iter_events("events.txt") if presorted \
+        else create_event_list("events.txt")
+    assert first.run(events, presorted, checkpoint_at=5,
+                     checkpoint_file=snapshot) == expected
+    sources = [iter_events("events.txt")] if presorted else []
+    assert restore(snapshot, *sources).resume() == expected
+    sources = [iter_events("events.txt")] if presorted else []
+    assert restore(snapshot, *sources).resume() == expected
+
+
+def test_checkpoint_needs_file() -> None:
+    """Test that asking for a checkpoint without a file to save it to is
+    refused before any event is done"""
+    simulation = Simulation()
+    with pytest.raises(ValueError):
+        simulation.run(create_event_list("events.txt"), checkpoint_at=5)
+    assert simulation.next_time() is None
+    with pytest.raises(ValueError):
+        simulation.resume(checkpoint_at=5)
+
+
+def test_checkpoint_reads_sources_again(tmp_path) -> None:
+    """Test that a checkpoint saves how far into each fed source the
+    simulation has got instead of their events, and carries on from there
+    when the sources are given again"""
+    snapshot = str(tmp_path / "mid.sim.gz")
+    events = list(_city().events(4))
+    middle = len(events) // 2
+    expected = Simulation().run(_city().events(4), presorted=True)
+    simulation = Simulation()
+    simulation.feed(events[:middle], presorted=True)
+    simulation.run_until(events[middle].timestamp)
+    simulation.feed(events[middle:])
+    simulation.run_until(events[middle].timestamp + 20)
+    simulation.checkpoint(snapshot)
+    assert simulation.resume() == expected
+    with pytest.raises(ValueError):
+        restore(snapshot)
+    events = list(_city().events(4))
+    restored = restore(snapshot, events[:middle], events[middle:])
+    assert restored.resume() == expected
+
+
+def test_checkpoint_batch_dispatcher(tmp_path) -> None:
+    """Test that a checkpoint keeps the waiting list, idle drivers and
+    pending batch of a BatchDispatcher"""
+    snapshot = str(tmp_path / "batch.sim.gz")
+    expected = Simulation(dispatcher=BatchDispatcher(3)).run(
+        create_event_list("events.txt"))
+    Simulation(dispatcher=BatchDispatcher(3)).run(
+        create_event_list("events.txt"), checkpoint_at=4,
+        checkpoint_file=snapshot)
+    assert restore(snapshot).resume() == expected
+
+
+def test_checkpoint_after_unsorted_and_streamed_sources(tmp_path) -> None:
+    """Test that restore takes every fed source in order, including an
+    unsorted first one that was added straight to the event queue"""
+    snapshot = str(tmp_path / "mid.sim.gz")
+    events = list(_city().events(4))
+    middle = len(events) // 2
+    simulation = Simulation()
+    simulation.feed(events[middle - 1::-1])
+    simulation.run_until(events[middle].timestamp)
+    simulation.feed(iter(events[middle:]), presorted=True)
+    simulation.run_until(events[middle].timestamp + 20)
+    simulation.checkpoint(snapshot)
+    expected = simulation.resume()
+    for keep_first in (False, True):
+        events = list(_city().events(4))
+        first = events[middle - 1::-1] if keep_first else None
+        restored = restore(snapshot, first, iter(events[middle:]))
+        assert restored.resume() == expected
+
+
+def test_restore_rejects_other_files(tmp_path) -> None:
+    """Test that restore refuses a file that is not a snapshot"""
+    path = tmp_path / "other.gz"
+    with gzip.open(path, "wb") as file:
+        pickle.dump((99, "not a simulation"), file)
+    with pytest.raises(ValueError):
+        restore(str(path))
+
+
+def test_workload_is_seeded_and_sorted() -> None:
+    """Test that a workload gives the same sorted events for a seed, and
+    keeps every location on the grid"""
+    city = _city()
+    events = list(city.events(3))
+    assert [str(e) for e in events] == [str(e) for e in city.events(3)]
+    assert [str(e) for e in events] != [str(e) for e in city.events(4)]
+    assert all(a.timestamp <= b.timestamp for a, b in zip(events, events[1:]))
+    drivers = [e for e in events if isinstance(e, DriverRequest)]
+    passengers = [e for e in events if isinstance(e, PassengerRequest)]
+    assert len(drivers) == 20 and all(e.timestamp < 10 for e in drivers)
+    assert 150 < len(passengers) < 300
+    for e in passengers:
+        for location in (e.passenger.origin, e.passenger.destination):
+            assert 0 <= location.row < 30 and 0 <= location.column < 40
+        assert e.passenger.patience >= 0 and e.timestamp < 200
+
+
+def test_workload_round_trips_through_events_file(tmp_path) -> None:
+    """Test that a written workload simulates the same as the stream"""
+    path = str(tmp_path / "city.txt")
+    assert write_events(_city().events(1), path) == \
+        sum(1 for _ in _city().events(1))
+    expected = Simulation().run(_city().events(1), presorted=True)
+    assert Simulation().run(create_event_list(path)) == expected
+
+
+def test_runner_generated_workload() -> None:
+    """Test that workloads can be swept in the process pool"""
+    scenarios = sweep([_city()], windows=[None, 2], repeats=2)
+    serial = list(run_scenarios(scenarios, workers=0))
+    assert list(run_scenarios(scenarios, workers=2)) == serial
+    assert serial[0]["scenario"] == "Workload"
+    assert serial[0] != serial[2]
+
+
+def test_benchmarks_run_at_small_scale() -> None:
+    """Test that every benchmark runs and reports its operations"""
+    current = run_benchmarks((200,), repeat=1)
+    assert set(current["results"]) == {f"{name}@200" for name in BENCHMARKS}
+    for result in current["results"].values():
+        assert result["operations"] > 0 and result["seconds"] >= 0
+
+
+def test_benchmarks_flag_regressions(tmp_path) -> None:
+    """Test that a run slower than its baseline fails, and others pass"""
+    baseline = tmp_path / "baseline.json"
+    args = ["--scale", "100", "--only", "cancel_ride", "--repeat", "1"]
+    assert benchmarks.main(args + ["--output", str(baseline)]) == 0
+    saved = json.loads(baseline.read_text())
+    assert benchmarks.main(args + ["--baseline", str(baseline),
+                                   "--threshold", "1000"]) == 0
+    saved["results"]["cancel_ride@100"]["nanoseconds_per_operation"] = 1e-6
+    baseline.write_text(json.dumps(saved))
+    assert benchmarks.main(args + ["--baseline", str(baseline)]) == 1
+    assert compare(saved, saved) == []
+
+
+@pytest.mark.parametrize("presorted", [False, True])
+def test_profiled_run_counts_events(presorted: bool) -> None:
+    """Test that an instrumented run gives the same report, and counts
+    every event by kind"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    stats = RunStats(sample_every=5)
+    simulation = Simulation(engine=CALENDAR, stats=stats)
+    assert simulation.run(create_event_list("events.txt"), presorted) == \
+        expected
+    assert simulation.stats() is stats
+    assert stats.by_type["PassengerRequest"].count == 6
+    assert stats.by_type["DriverRequest"].count >= 6
+    assert stats.events == sum(t.count for t in stats.by_type.values())
+    assert len(stats.queue_sizes) == stats.events // 5
+    assert stats.max_queue >= max(size for _, size in stats.queue_sizes)
+    assert stats.scans > 0 and stats.events_per_second() > 0
+    assert stats.summary()["Pickup_count"] == stats.by_type["Pickup"].count
+    assert Simulation().stats() is None
+
+
+def test_profiled_batch_dispatch_scans() -> None:
+    """Test that a batch dispatcher reports the candidates it compared"""
+    stats = RunStats()
+    Simulation(dispatcher=BatchDispatcher(5), stats=stats).run(
+        create_event_list("events.txt"))
+    assert stats.by_type["Dispatch"].count > 0
+    assert stats.scans > 0
+
+
+class _LoggingMonitor(Monitor):
+    """A monitor that logs the order of the activities it is told about"""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.log = []
+
+    def notify(self, timestamp: int, category: str, description: str,
+               identifier: str, location: Location) -> None:
+        self.log.append((timestamp, category, description, identifier))
+        super().notify(timestamp, category, description, identifier,
+                       location)
+
+
+@pytest.mark.parametrize("engine", [HEAP, CALENDAR])
+def test_batched_run_same_report(engine: str) -> None:
+    """Test that a batched run of the sample events gives the same report"""
+    expected = Simulation().run(create_event_list("events.txt"))
+    for presorted in (False, True):
+        simulation = Simulation(engine, batched=True)
+        assert simulation.run(iter_events("events.txt"), presorted) == \
+            expected
+
+
+def test_batched_run_phase_order() -> None:
+    """Test that events with the same timestamp are done by kind, in the
+    order of the phases, while a plain run does them in the order they were
+    added"""
+    plain, batched = _LoggingMonitor(), _LoggingMonitor()
+    Simulation(monitor=plain).run(_same_time_requests())
+    Simulation(monitor=batched, batched=True).run(_same_time_requests())
+    assert [entry[1:3] for entry in plain.log[:2]] == \
+        [(PASSENGER, REQUEST), (DRIVER, REQUEST)]
+    assert [entry[1:3] for entry in batched.log[:2]] == \
+        [(DRIVER, REQUEST), (PASSENGER, REQUEST)]
+    # q has no patience, so it is cancelled in the batch of its request.
+    assert (2, PASSENGER, CANCEL, "q") in batched.log
+    assert batched.report() == plain.report()
+
+
+def test_batched_run_profiled() -> None:
+    """Test that a batched run records every event it does"""
+    stats = RunStats(sample_every=4)
+    Simulation(CALENDAR, stats=stats, batched=True,
+               dispatcher=BatchDispatcher()).run(_city().events(5),
+                                                 presorted=True)
+    assert stats.events == sum(t.count for t in stats.by_type.values())
+    assert stats.by_type["PassengerRequest"].count == \
+        sum(isinstance(e, PassengerRequest) for e in _city().events(5))
+    assert len(stats.queue_sizes) == stats.events // 4
+
+
+@given(lists(lists(integers(min_value=-3, max_value=11), min_size=5,
+                   max_size=5), min_size=1))
+def test_oracle_matches_manhattan(queries: list) -> None:
+    """Test that an oracle with a table or a cache gives the same travel
+    times as the Manhattan distance, and that the cache stays bounded"""
+    tabled = TravelTimeOracle(8, 8)
+    cached = TravelTimeOracle(cache_size=4)
+    for row1, col1, row2, col2, speed in queries:
+        origin, destination = Location(row1, col1), Location(row2, col2)
+        expected = round(manhattan_distance(origin, destination) /
+                         (speed % 3 + 1))
+        assert tabled.travel_time(origin, destination, speed % 3 + 1) == \
+            expected
+        assert cached.travel_time(origin, destination, speed % 3 + 1) == \
+            expected
+        assert len(cached) <= 4
+
+
+def test_oracle_long_trip() -> None:
+    """Test that a very long trip is timed without growing the time table"""
+    oracle = TravelTimeOracle()
+    assert oracle.travel_time(Location(0, 0), Location(0, 5_000_000), 1) == \
+        5_000_000
+    assert len(oracle.times(1)) <= TIMES + 1
+
+
+class _DetourOracle(TravelTimeOracle):
+    """An oracle where crossing column 5 takes a detour of 10 blocks"""
+
+    def measure(self, origin: Location, destination: Location) -> int:
+        detour = 10 if (origin.column < 5) != (destination.column < 5) else 0
+        return manhattan_distance(origin, destination) + detour
+
+
+def test_dispatcher_shares_oracle() -> None:
+    """Test that drivers and the nearest-driver search use the dispatcher's
+    oracle, and that the oracle caches for all of them"""
+    oracle = _DetourOracle(cache_size=100)
+    dispatcher = Dispatcher(oracle)
+    across = Driver('across', Location(0, 5), 1)
+    behind = Driver('behind', Location(0, 0), 1)
+    dispatcher.request_passenger(across)
+    dispatcher.request_passenger(behind)
+    passenger = Passenger('p', 5, Location(0, 4), Location(0, 6))
+    assert dispatcher.request_driver(passenger) is behind
+    assert across.get_travel_time(passenger.origin) == 11
+    assert behind.start_drive(passenger.origin) == 4
+    assert oracle.misses == len(oracle) == 2
+
+
+@pytest.mark.parametrize("size", [6, 40])
+def test_road_network_open_grid_is_manhattan(size: int) -> None:
+    """Test that the distances of a network without obstacles are Manhattan
+    distances, whether they come from the table or from searches"""
+    network = RoadNetwork(['.' * size] * size, trees=3)
+    blocks = [Location(row, col) for row in (0, 2, size - 1)
+              for col in (0, 3, size - 1)]
+    for origin in blocks:
+        for destination in blocks:
+            assert network.distance(origin, destination) == \
+                manhattan_distance(origin, destination)
+
+
+def test_road_network_river_and_one_way(tmp_path) -> None:
+    """Test detours around a river, one-way blocks and missing routes"""
+    filename = tmp_path / "city.txt"
+    filename.write_text("......\n"
+                        "###.##\n"
+                        "......\n"
+                        ">>>>>>\n"
+                        "#.\n"
+                        "\n")
+    network = load_road_network(str(filename))
+    assert (network.rows, network.columns) == (5, 6)
+    assert network.distance(Location(0, 0), Location(2, 0)) == 8
+    assert network.distance(Location(3, 0), Location(3, 4)) == 4
+    assert network.distance(Location(3, 4), Location(3, 0)) == 6
+    assert network.distance(Location(4, 1), Location(0, 1)) == 8
+    with pytest.raises(ValueError):
+        network.distance(Location(0, 0), Location(4, 0))
+    with pytest.raises(ValueError):
+        RoadNetwork(["..", ".x"])
+
+
+def test_road_network_unreachable_drivers() -> None:
+    """Test that drivers who cannot reach a passenger, because of a wall or
+    because they are on a closed block, are passed over"""
+    left = Passenger("left", 10, Location(1, 1), Location(2, 2))
+    right = Passenger("right", 10, Location(2, 4), Location(1, 4))
+    assert _walled_dispatcher(False, [4, 3, 0]).request_driver(left).id == "d0"
+    batch = _walled_dispatcher(True, [4, 3, 0])
+    batch.request_driver(left)
+    batch.request_driver(right)
+    assert sorted((d.id, p.id) for d, p in batch.dispatch()) == \
+        [("d0", "left"), ("d4", "right")]
+    greedy = _walled_dispatcher(False, [4, 3])
+    assert greedy.request_driver(left) is None
+    assert _waiting(greedy) == [left]
+    assert greedy.request_passenger(Driver("d4", Location(1, 4), 1)) is None
+    assert _waiting(greedy) == [left]
+    batch = _walled_dispatcher(True, [4, 3])
+    batch.request_driver(left)
+    assert batch.dispatch() == []
+    assert _waiting(batch) == [left]
+
+
+def test_simulation_with_stranded_passenger() -> None:
+    """Test that a passenger no idle driver can reach waits, instead of
+    stopping the simulation"""
+    for dispatcher in (Dispatcher(RoadNetwork(['..#..'] * 3)),
+                       BatchDispatcher(oracle=RoadNetwork(['..#..'] * 3))):
+        report = Simulation(dispatcher=dispatcher).run(
+            [_driver_request(0, "a", 0), _passenger_request(1, "p", 5, 4, 3)])
+        assert report["average_passenger_wait_time"] == 5
+
+
+def test_simulation_on_road_network() -> None:
+    """Test that a simulation measures travel times and distances on the
+    road network it is given"""
+    assert _run_on_roads(RoadNetwork(['.' * 40] * 40, trees=4)) == \
+        Simulation().run(create_event_list("events.txt"))
+    walled = RoadNetwork(['......', '......', '..#.#.', '......',
+                          '....#.', '....#.'])
+    assert _run_on_roads(walled)["average_driver_total_distance"] > \
+        Simulation().run(create_event_list("events.txt"))[
+            "average_driver_total_distance"]
+
+
+@pytest.mark.parametrize("batched", [False, True])
+@pytest.mark.parametrize("profiled", [False, True])
+def test_stepping_matches_run(batched: bool, profiled: bool) -> None:
+    """Test that running in steps gives the same report as one run"""
+    expected = Simulation(batched=batched).run(_city().events(3),
+                                               presorted=True)
+    simulation = Simulation(CALENDAR, Monitor(history=False),
+                            stats=RunStats() if profiled else None,
+                            batched=batched)
+    simulation.feed(_city().events(3), presorted=True)
+    simulation.run_until(60)
+    assert simulation.next_time() >= 60
+    done = simulation.step(10)
+    assert done >= 10
+    while simulation.step():
+        pass
+    assert simulation.next_time() is None
+    assert simulation.report() == expected
+
+
+def test_feed_between_steps() -> None:
+    """Test that events fed to a running simulation, sorted or not, give the
+    same report as running them all from the start"""
+    expected = Simulation().run(_city().events(4), presorted=True)
+    for presorted in (False, True):
+        events = list(_city().events(4))
+        middle = len(events) // 2
+        simulation = Simulation()
+        simulation.feed(events[:middle], presorted)
+        simulation.run_until(events[middle].timestamp)
+        simulation.feed(events[middle:], presorted)
+        assert simulation.resume() == expected
+
+
+def test_feed_many_times() -> None:
+    """Test that a simulation fed thousands of times still runs, and does
+    the events in the same order as one run"""
+    events = list(_city().events(4))
+    simulation = Simulation()
+    simulation.feed(events[:1], presorted=True)
+    simulation.step()
+    for event in events[1:]:
+        simulation.feed([event], presorted=True)
+    for _ in range(5000):
+        simulation.feed([], presorted=True)
+    assert simulation.resume() == \
+        Simulation().run(_city().events(4), presorted=True)
+
+
+def test_run_until_stops_early() -> None:
+    """Test that a run stops as soon as the report meets a condition, and
+    can be carried on"""
+    simulation = Simulation(monitor=Monitor(history=False))
+    simulation.feed(_city().events(2), presorted=True)
+    report = simulation.run_until(
+        stop_when=lambda r: r["average_driver_total_distance"] >= 5)
+    assert report["average_driver_total_distance"] >= 5
+    assert simulation.next_time() is not None
+    assert simulation.resume() == \
+        Simulation().run(_city().events(2), presorted=True)
+
+
+def test_runner_sorts_generated_events() -> None:
+    """Test that a function's events are run in timestamp order even when
+    it does not return them that way"""
+    for until in (None, 60):
+        expected = Scenario("city", _city(), seed=2, until=until).run()
+        row = Scenario("city", _backwards, seed=2, until=until).run()
+        assert {key: row[key] for key in row if key != "events"} == \
+            {key: expected[key] for key in expected if key != "events"}
+
+
+def test_runner_until() -> None:
+    """Test that a scenario can simulate only the start of its events"""
+    row = sweep([_city()], seed=2, until=60)[0].run()
+    assert row["until"] == 60
+    simulation = Simulation()
+    simulation.feed(_city().events(2), presorted=True)
+    assert {key: row[key] for key in simulation.report()} == \
+        simulation.run_until(60)
+    assert row["average_driver_total_distance"] < \
+        sweep([_city()], seed=2)[0].run()["average_driver_total_distance"]
+
+
+def test_runner_until_binary(tmp_path) -> None:
+    """Test that a binary scenario stopped early is closed cleanly, and gives
+    the same row as its text file"""
+    path = str(tmp_path / "events.bin")
+    convert_events("events.txt", path)
+    row = Scenario("binary", path, until=5).run()
+    expected = Scenario("binary", "events.txt", until=5).run()
+    assert {key: row[key] for key in expected if key != "events"} == \
+        {key: expected[key] for key in expected if key != "events"}
+
+
 def test_monitor_avg_trip_dis() -> None:
     eiad = Monitor()
     eiad.notify(2, DRIVER, REQUEST, "Eiad", Location(1, 1))
@@ -357,6 +1360,126 @@ def test_monitor_avg_trip_dis() -> None:
     assert eiad._average_trip_distance() == 6
 
 
+def test_monitor_streaming() -> None:
+    """Test that a monitor without history reports the same statistics"""
+    monitor = Monitor(history=False)
+    report = Simulation(monitor=monitor).run(create_event_list("events.txt"))
+    assert report == Simulation().run(create_event_list("events.txt"))
+    assert monitor._activities == {PASSENGER: {}, DRIVER: {}}
+
+
+def test_monitor_wait_time() -> None:
+    """Test that wait times are taken from the first two passenger
+    activities"""
+    monitor = Monitor(history=False)
+    monitor.notify(1, PASSENGER, REQUEST, "a", Location(1, 1))
+    monitor.notify(2, PASSENGER, REQUEST, "b", Location(1, 1))
+    monitor.notify(4, PASSENGER, PICKUP, "a", Location(1, 1))
+    assert monitor._average_wait_time() == 3
+    monitor.notify(9, PASSENGER, CANCEL, "b", Location(1, 1))
+    assert monitor._average_wait_time() == 5
+    assert str(monitor) == "Monitor (0 drivers, 2 passengers)"
+
+
+def test_columnar_monitor_matches_monitor() -> None:
+    """Test that the columnar monitor reports the same statistics"""
+    monitor = ColumnarMonitor()
+    report = Simulation(monitor=monitor).run(create_event_list("events.txt"))
+    assert report == pytest.approx(
+        Simulation().run(create_event_list("events.txt")))
+    assert str(monitor) == "Monitor (6 drivers, 6 passengers)"
+
+
+@given(lists(lists(integers(min_value=0, max_value=3), min_size=4,
+                   max_size=4)),
+       lists(integers(min_value=0, max_value=9), min_size=1))
+def test_columnar_monitor_random(activities: list, waits: list) -> None:
+    """Test the columnar monitor against a Monitor on interleaved
+    activities"""
+    descriptions = [REQUEST, PICKUP, DROPOFF, CANCEL]
+    expected = Monitor()
+    monitor = ColumnarMonitor()
+    for target in [expected, monitor]:
+        for time, (actor, description, row, col) in enumerate(activities):
+            target.notify(time, DRIVER, descriptions[description], str(actor),
+                          Location(row, col))
+        for passenger, wait in enumerate(waits):
+            target.notify(passenger, PASSENGER, REQUEST, str(passenger),
+                          Location(0, 0))
+        for passenger, wait in reversed(list(enumerate(waits))):
+            target.notify(passenger + wait, PASSENGER, PICKUP, str(passenger),
+                          Location(0, 0))
+    assert monitor.report() == pytest.approx(expected.report())
+    assert monitor.percentiles() == pytest.approx(expected.percentiles())
+
+
+@given(lists(integers(min_value=0, max_value=10 ** 9), min_size=1),
+       lists(integers(min_value=0, max_value=10 ** 9)))
+def test_sketch_quantiles(first: list, second: list) -> None:
+    """Test that a merged sketch's quantiles are within its error bound"""
+    sketch, other = QuantileSketch(), QuantileSketch()
+    for x in first:
+        sketch.add(x)
+    for x in second:
+        other.add(x)
+    sketch.merge(other)
+    values = sorted(first + second)
+    assert sketch.count == len(values)
+    for q in [0, 0.5, 0.9, 0.99, 1]:
+        exact = values[max(1, math.ceil(q * len(values))) - 1]
+        assert abs(sketch.quantile(q) - exact) <= exact / 64 + 0.5
+
+
+def test_monitor_merge() -> None:
+    """Test that merging monitors of disjoint passengers combines their
+    statistics"""
+    whole, first, second = Monitor(), Monitor(history=False), Monitor()
+    notes = [(0, PASSENGER, REQUEST, "a", Location(1, 1)),
+             (0, DRIVER, REQUEST, "x", Location(0, 0)),
+             (2, DRIVER, PICKUP, "x", Location(1, 1)),
+             (2, PASSENGER, PICKUP, "a", Location(1, 1)),
+             (5, DRIVER, DROPOFF, "x", Location(4, 1)),
+             (6, PASSENGER, REQUEST, "b", Location(4, 2)),
+             (6, DRIVER, REQUEST, "x", Location(4, 1)),
+             (7, DRIVER, PICKUP, "x", Location(4, 2)),
+             (7, PASSENGER, PICKUP, "b", Location(4, 2)),
+             (9, DRIVER, DROPOFF, "x", Location(6, 2))]
+    for i, note in enumerate(notes):
+        whole.notify(*note)
+        (first if i < 5 else second).notify(*note)
+    first.merge(second)
+    assert first.report() == whole.report()
+    assert first.percentiles() == whole.percentiles()
+    assert whole.percentiles()["driver_trip_distance_p50"] == 2
+    columns, first, second = ColumnarMonitor(), ColumnarMonitor(), \
+        ColumnarMonitor()
+    for i, note in enumerate(notes):
+        columns.notify(*note)
+        (first if i < 5 else second).notify(*note)
+    first.merge(second)
+    assert first.report() == columns.report() == whole.report()
+    assert first.percentiles() == whole.percentiles()
+
+
+def test_trip_distance_skips_no_shows() -> None:
+    """Test that arriving for a passenger who already cancelled doesn't count
+    as a trip in the trip distance percentiles"""
+    notes = [(0, DRIVER, REQUEST, "x", Location(0, 0)),
+             (0, DRIVER, PICKUP, "x", Location(0, 0)),
+             (20, DRIVER, DROPOFF, "x", Location(20, 0)),
+             (20, DRIVER, REQUEST, "x", Location(20, 0)),
+             (25, DRIVER, PICKUP, "x", Location(20, 5)),
+             (25, DRIVER, REQUEST, "x", Location(20, 5))]
+    for monitor in [Monitor(), ColumnarMonitor()]:
+        for note in notes:
+            monitor.notify(*note)
+        percentiles = monitor.percentiles()
+        assert percentiles["driver_trip_distance_p50"] == pytest.approx(
+            20, rel=1 / 64)
+        assert percentiles["driver_trip_distance_p90"] == pytest.approx(
+            20, rel=1 / 64)
+
+
 def test_learning_pop() -> None:
     eiad = LinkedList([1, 2, 3, 4])
     assert eiad.pop(0) == _Node(1)
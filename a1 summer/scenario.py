@@ -0,0 +1,214 @@
+"""
+The scenario module converts events files into a compact binary format, and
+reads that format back through a read-only memory map.
+
+A binary scenario starts with a header, followed by one fixed-width record per
+event in file order, followed by the driver and passenger ids separated by
+newlines. Records refer to ids by their index in that list. Because the file
+is mapped rather than read, every simulation process that opens the same
+scenario shares one copy of it in the page cache, and no text is parsed.
+
+=== Constants ===
+MAGIC: The bytes every binary scenario starts with.
+VERSION: The version of the binary scenario format written by this module.
+"""
+
+import mmap
+import struct
+from typing import Dict, Iterator, List
+from driver import Driver
+from event import Event, DriverRequest, PassengerRequest, iter_events
+from location import Location
+from passenger import Passenger
+
+MAGIC = b"UBERSCN\0"
+VERSION = 1
+
+# magic, version, sorted flag, record count, offset of the id list
+_HEADER = struct.Struct("<8sIIQQ")
+# timestamp, kind, id index, origin row and column, destination row and
+# column, speed, patience
+_RECORD = struct.Struct("<qB3xIiiiiii")
+
+_DRIVER_REQUEST = 0
+_PASSENGER_REQUEST = 1
+
+
+def _record(event: Event, ids: Dict[str, int]) -> bytes:
+    """Return the binary record for <event>, adding its id to <ids> if it is
+    new.
+
+    """
+    if isinstance(event, DriverRequest):
+        driver = event.driver
+        index = ids.setdefault(driver.id, len(ids))
+        return _RECORD.pack(event.timestamp, _DRIVER_REQUEST, index,
+                            driver.location.row, driver.location.column,
+                            -1, -1, driver.get_speed(), -1)
+    passenger = event.passenger
+    index = ids.setdefault(passenger.id, len(ids))
+    return _RECORD.pack(event.timestamp, _PASSENGER_REQUEST, index,
+                        passenger.origin.row, passenger.origin.column,
+                        passenger.destination.row,
+                        passenger.destination.column, -1, passenger.patience)
+
+
+def convert_events(text_filename: str, binary_filename: str) -> int:
+    """Convert the events file <text_filename> into a binary scenario stored
+    at <binary_filename>, and return the number of events.
+
+    The events file is read one line at a time, so only the ids are held in
+    memory.
+
+    Precondition: the file stored at <text_filename> is in the format
+    specified by the assignment handout.
+    """
+    ids = {}
+    count = 0
+    is_sorted = True
+    last = None
+    with open(binary_filename, "wb") as file:
+        file.write(_HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        for event in iter_events(text_filename):
+            if last is not None and event.timestamp < last:
+                is_sorted = False
+            last = event.timestamp
+            file.write(_record(event, ids))
+            count += 1
+        names_offset = file.tell()
+        file.write("\n".join(ids).encode("utf-8"))
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, VERSION, int(is_sorted), count,
+                                names_offset))
+    return count
+
+
+class ScenarioFile:
+    """A binary scenario, memory-mapped for reading.
+
+    Events are built from the mapped records as they are requested; the
+    records themselves are never copied out of the map.
+
+    === Attributes ===
+    names: The driver and passenger ids of the scenario.
+    is_sorted: True iff the events are in non-decreasing timestamp order.
+    """
+
+    names: List[str]
+    is_sorted: bool
+
+    # === Private Attributes ===
+    _file: object
+    #     The open scenario file.
+    _map: mmap.mmap
+    #     A read-only memory map of the whole file.
+    _count: int
+    #     The number of events in the scenario.
+
+    def __init__(self, filename: str) -> None:
+        """Open and map the binary scenario stored at <filename>.
+
+        Raise ValueError if it is not a binary scenario this module can read.
+        """
+        self._file = open(filename, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, is_sorted, count, names_offset = \
+            _HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{filename} is not a version {VERSION} "
+                             f"binary scenario")
+        self.is_sorted = bool(is_sorted)
+        self._count = count
+        names = self._map[names_offset:].decode("utf-8")
+        self.names = names.split("\n") if names else []
+
+    def __enter__(self) -> 'ScenarioFile':
+        """Return this ScenarioFile, for use in a with statement.
+
+        """
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        """Close this ScenarioFile at the end of a with statement.
+
+        """
+        self.close()
+
+    def close(self) -> None:
+        """Unmap and close the scenario.
+
+        """
+        self._map.close()
+        self._file.close()
+
+    def __len__(self) -> int:
+        """Return the number of events in the scenario.
+
+        """
+        return self._count
+
+    def _event(self, record: tuple) -> Event:
+        """Return a new Event for the unpacked <record>.
+
+        """
+        timestamp, kind, index, row, col, d_row, d_col, speed, patience = \
+            record
+        if kind == _DRIVER_REQUEST:
+            return DriverRequest(timestamp, Driver(
+                self.names[index], Location(row, col), speed))
+        return PassengerRequest(timestamp, Passenger(
+            self.names[index], patience, Location(row, col),
+            Location(d_row, d_col)))
+
+    def event(self, index: int) -> Event:
+        """Return a new Event for the event at <index>.
+
+        """
+        return self._event(_RECORD.unpack_from(
+            self._map, _HEADER.size + index * _RECORD.size))
+
+    def __iter__(self) -> Iterator[Event]:
+        """Yield a new Event for each event, in file order.
+
+        """
+        # Each record is unpacked straight from the map rather than through a
+        # memoryview, so an iteration left unfinished does not stop the map
+        # from being closed.
+        for offset in range(_HEADER.size,
+                            _HEADER.size + self._count * _RECORD.size,
+                            _RECORD.size):
+            yield self._event(_RECORD.unpack_from(self._map, offset))
+
+    def sorted_events(self) -> Iterator[Event]:
+        """Yield a new Event for each event, in timestamp order.
+
+        Events with equal timestamps stay in file order, so this can be passed
+        to Simulation.run with presorted=True.
+        """
+        if self.is_sorted:
+            yield from self
+            return
+        order = sorted(range(self._count), key=self._timestamp)
+        for index in order:
+            yield self.event(index)
+
+    def _timestamp(self, index: int) -> int:
+        """Return the timestamp of the event at <index>.
+
+        """
+        return struct.unpack_from(
+            "<q", self._map, _HEADER.size + index * _RECORD.size)[0]
+
+
+if __name__ == '__main__':
+    import sys
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'allowed-io': ['convert_events', 'ScenarioFile.__init__'],
+            'extra-imports': ['mmap', 'struct', 'sys', 'typing', 'driver',
+                              'event', 'location', 'passenger']})
+
+    print(convert_events(sys.argv[1], sys.argv[2]), "events converted")
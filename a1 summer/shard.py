@@ -0,0 +1,292 @@
+"""
+The shard module runs one simulation split across several processes.
+
+The grid is divided into strips of columns, one for each shard. Every shard
+has its own event queue, dispatcher and monitor, and runs in its own process.
+A passenger belongs to the shard that holds the passenger's origin, and is
+only ever assigned the drivers of that shard. A driver belongs to the shard
+it became idle in, and moves to another shard when a trip drops it off there.
+
+The shards are kept in step with conservative time windows. In each window,
+every shard does all of its events before the end of the window, in
+parallel, and then reports the drivers that have left its strip. Those
+drivers request a passenger in their new shard at the end of the window, so
+no shard ever receives an event from its past. A window starts at the
+earliest event of any shard, so stretches with nothing to do are skipped.
+
+At the end, the monitors of the shards are merged into one report. With one
+shard, the result is the same as running a single Simulation.
+
+=== Constants ===
+WINDOW: The default length of a synchronization window.
+"""
+
+import bisect
+import multiprocessing
+import multiprocessing.connection
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+from dispatcher import Dispatcher
+from driver import Driver
+from event import Event, DriverRequest, PassengerRequest
+from location import Location
+from monitor import Monitor
+from passenger import Passenger
+from simulation import Simulation, HEAP
+
+WINDOW = 5
+
+
+class _StripDispatcher(Dispatcher):
+    """A dispatcher for the drivers and passengers of one strip of columns.
+
+    === Attributes ===
+    low: The first column of the strip, or None if it is the first strip.
+    high: The first column after the strip, or None if it is the last strip.
+    leaving: The drivers that have become idle outside the strip since
+        leaving was last cleared.
+    """
+
+    low: Optional[int]
+    high: Optional[int]
+    leaving: List[Driver]
+
+    def __init__(self, low: Optional[int], high: Optional[int]) -> None:
+        """Initialize a dispatcher for the columns from <low> up to <high>.
+
+        """
+        super().__init__()
+        self.low = low
+        self.high = high
+        self.leaving = []
+
+    def holds(self, location: Location) -> bool:
+        """Return True iff <location> is in the strip of this dispatcher.
+
+        >>> dispatcher = _StripDispatcher(3, 6)
+        >>> dispatcher.holds(Location(0, 3)), dispatcher.holds(Location(0, 6))
+        (True, False)
+        """
+        return (self.low is None or self.low <= location.column) and \
+            (self.high is None or location.column < self.high)
+
+    def request_passenger(self, driver: Driver) -> Optional[Passenger]:
+        """Return a passenger for the driver, or None if no passenger is
+        available.
+
+        An idle driver outside the strip is unregistered, added to leaving,
+        and given no passenger. It leaves this shard's oracle behind, so the
+        cache is not copied to the next shard with the driver.
+        """
+        if driver.is_idle and not self.holds(driver.location):
+            if driver.id in self._drivers:
+                del self._drivers[driver.id]
+                driver.watch(None)
+                driver.use_oracle(None)
+            if driver in self._idle:
+                self._idle.remove(driver)
+            self.leaving.append(driver)
+            return None
+        return super().request_passenger(driver)
+
+
+class _ShardSimulation(Simulation):
+    """The simulation of one shard.
+
+    """
+
+    # === Private Attributes ===
+    _dispatcher: _StripDispatcher
+
+    def advance(self, events: List[Event], until: int) \
+            -> Tuple[List[Driver], Optional[int]]:
+        """Add <events> to the event queue, and do every event before
+        <until>.
+
+        Return the drivers that left the strip, and the time of the next
+        event, or None if there is none.
+        """
+        self._events.bulk_add(events)
+        self._do_events(None, until)
+        leaving = self._dispatcher.leaving
+        self._dispatcher.leaving = []
+        if self._events.is_empty():
+            return leaving, None
+        return leaving, self._events.peek().timestamp
+
+    def monitor(self) -> Monitor:
+        """Return the monitor of this shard.
+
+        """
+        return self._monitor
+
+
+def _serve(connection: multiprocessing.connection.Connection,
+           low: Optional[int], high: Optional[int], engine: str) -> None:
+    """Run the shard for the columns from <low> up to <high> in this process,
+    taking (events, until) requests from <connection> until it receives None.
+
+    An exception raised by the simulation is sent back in place of a reply,
+    and ends the shard.
+    """
+    simulation = _ShardSimulation(engine, Monitor(history=False),
+                                  _StripDispatcher(low, high))
+    while True:
+        request = connection.recv()
+        if request is None:
+            connection.send(simulation.monitor())
+            connection.close()
+            return
+        try:
+            leaving, upcoming = simulation.advance(*request)
+        except Exception as error:
+            connection.send(error)
+            connection.close()
+            return
+        connection.send((leaving, upcoming))
+
+
+def _receive(connection: multiprocessing.connection.Connection) -> object:
+    """Return the next reply of the shard at the other end of <connection>,
+    raising the exception the shard sent instead, if any.
+
+    """
+    reply = connection.recv()
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
+
+
+def _location(event: Event) -> Location:
+    """Return the location that decides which shard <event> belongs to.
+
+    """
+    if isinstance(event, DriverRequest):
+        return event.driver.location
+    return event.passenger.origin
+
+
+def _boundaries(events: List[Event], shards: int) -> List[int]:
+    """Return the first column of every strip but the first, dividing the
+    columns used by <events> into <shards> strips of about the same width.
+
+    >>> events = [PassengerRequest(0, Passenger('a', 5, Location(0, 0),
+    ...                                         Location(3, 9)))]
+    >>> _boundaries(events, 3)
+    [3, 6]
+    """
+    columns = set()
+    for event in events:
+        columns.add(_location(event).column)
+        if isinstance(event, PassengerRequest):
+            columns.add(event.passenger.destination.column)
+    low, high = min(columns), max(columns) + 1
+    bounds = []
+    for k in range(1, shards):
+        bound = low + (high - low) * k // shards
+        if bounds and bound <= bounds[-1]:
+            continue
+        bounds.append(bound)
+    return bounds
+
+
+def run_sharded(initial_events: Iterable[Event], shards: Optional[int] = None,
+                window: int = WINDOW, engine: str = HEAP,
+                monitor: Optional[Monitor] = None) -> Dict[str, float]:
+    """Run a simulation of <initial_events> split over <shards> processes,
+    and return the merged report.
+
+    shards: The number of shards, or the number of CPUs if None. There may
+        be fewer if the events use fewer columns.
+    window: The length of a synchronization window. A driver that moves to
+        another shard becomes available there at the end of the window it
+        left in, so shorter windows are more faithful and longer windows
+        synchronize less often.
+    engine: The event queue engine of every shard.
+    monitor: A monitor to merge the monitors of the shards into, for
+        statistics beyond the report. A new Monitor(history=False) if None.
+
+    An exception raised in any shard stops every shard and is raised here.
+    """
+    events = list(initial_events)
+    if monitor is None:
+        monitor = Monitor(history=False)
+    if not events:
+        return monitor.report()
+    bounds = _boundaries(events, shards or os.cpu_count() or 1)
+    strips = list(zip([None] + bounds, bounds + [None]))
+    pending = [[] for _ in strips]
+    for event in events:
+        pending[bisect.bisect_right(bounds, _location(event).column)].append(
+            event)
+
+    connections = []
+    processes = []
+    for low, high in strips:
+        ours, theirs = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_serve,
+                                          args=(theirs, low, high, engine))
+        process.start()
+        theirs.close()
+        connections.append(ours)
+        processes.append(process)
+    try:
+        # Nothing is before the first event, so this only loads the shards.
+        first = min(event.timestamp for event in events)
+        upcoming = _step(connections, pending, first, bounds)
+        while upcoming is not None:
+            upcoming = _step(connections, pending, upcoming + window, bounds)
+        for connection in connections:
+            connection.send(None)
+        for connection in connections:
+            monitor.merge(_receive(connection))
+    except BaseException:
+        # The other shards would wait forever for their next request.
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for connection in connections:
+            connection.close()
+        for process in processes:
+            process.join()
+    return monitor.report()
+
+
+def _step(connections: List[multiprocessing.connection.Connection],
+          pending: List[List[Event]], until: int, bounds: List[int]) \
+        -> Optional[int]:
+    """Send every shard its <pending> events and have it do every event
+    before <until>. Then add a request at <until> for each driver that moved
+    shards to the pending events of its new shard.
+
+    Return the time of the earliest event of any shard, or None if every
+    shard is done.
+    """
+    for connection, events in zip(connections, pending):
+        connection.send((events, until))
+        events.clear()
+    upcoming = None
+    for connection in connections:
+        leaving, next_time = _receive(connection)
+        for driver in leaving:
+            shard = bisect.bisect_right(bounds, driver.location.column)
+            pending[shard].append(DriverRequest(until, driver))
+            upcoming = until if upcoming is None else min(upcoming, until)
+        if next_time is not None:
+            upcoming = next_time if upcoming is None \
+                else min(upcoming, next_time)
+    return upcoming
+
+
+if __name__ == '__main__':
+    import python_ta
+    from event import iter_events
+
+    python_ta.check_all(
+        config={
+            'extra-imports': ['bisect', 'multiprocessing', 'os', 'typing',
+                              'dispatcher', 'driver', 'event', 'location',
+                              'monitor', 'passenger', 'simulation']})
+
+    print(run_sharded(iter_events("events.txt")))
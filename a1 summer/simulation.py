@@ -1,10 +1,35 @@
-"""Starting point for simulation"""
+"""Starting point for simulation
 
-from typing import List, Dict
-from container import PriorityQueue
+=== Constants ===
+HEAP: A constant used to select the binary heap event queue.
+CALENDAR: A constant used to select the calendar (bucketed) event queue.
+SNAPSHOT_VERSION: The version of the snapshots written by
+    Simulation.checkpoint.
+PHASES: The order in which the kinds of events with the same timestamp are
+    done in a batched simulation. Other kinds of events, such as Dispatch,
+    are done last.
+"""
+
+import gzip
+import heapq
+import itertools
+import pickle
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, \
+    Tuple
+from container import Container, PriorityQueue, CalendarQueue
 from dispatcher import Dispatcher
-from event import Event, create_event_list
+from event import Event, Dropoff, Pickup, DriverRequest, PassengerRequest, \
+    Cancellation, iter_events
 from monitor import Monitor
+from profiling import RunStats
+
+HEAP = "heap"
+CALENDAR = "calendar"
+SNAPSHOT_VERSION = 2
+PHASES = (Dropoff, Pickup, DriverRequest, PassengerRequest, Cancellation)
+
+_RANKS = {kind: rank for rank, kind in enumerate(PHASES)}
 
 
 class Simulation:
@@ -13,42 +38,103 @@ class Simulation:
     This is the class that is responsible for setting up and running a
     simulation.
 
-    The API is given to you: your main task is to implement the run
-    method below according to its docstring.
-
-    Of course, you may add whatever private attributes and methods you want.
-    But because you should not change the interface, you may not add any public
-    attributes or methods.
-
-    This is the entry point into your program, and in particular is used for
-    auto-testing purposes. This makes it ESSENTIAL that you do not change the
-    interface in any way!
+    run() does a whole scenario at once. A simulation can also be driven a
+    piece at a time: feed() adds initial events, run_until() and step() do
+    some of them, next_time() and report() tell how far it has got, and
+    resume() does the rest. checkpoint() saves a snapshot that restore()
+    carries on from, and stats() returns the RunStats the simulation was
+    instrumented with. The constructor chooses the event queue engine, the
+    monitor and dispatcher, the RunStats, and whether events with the same
+    timestamp are batched.
     """
 
     # === Private Attributes ===
-    _events: PriorityQueue
+    _events: Container
     #     A sequence of events arranged in priority determined by the event
     #     sorting order.
     _dispatcher: Dispatcher
     #     The dispatcher associated with the simulation.
     _monitor: Monitor
     #     The monitor associated with the simulation.
+    _sources: List[Tuple[Event, int, Iterator[Event], int]]
+    #     A heap with an entry for each source of initial events that has not
+    #     been used up: its next event, the number of sources fed before it,
+    #     the rest of its events, in timestamp order, and the index of the
+    #     next event in the source. The number breaks ties, so equal
+    #     timestamps are done in the order they were fed.
+    _fed: List[Optional[bool]]
+    #     A list with an entry for each source of initial events that has
+    #     been fed, which is True iff feed sorted its events, or None if they
+    #     were added straight to the event queue.
+    _upcoming: Optional[Event]
+    #     The next initial event, at the top of _sources, or None if there is
+    #     none.
+    _stats: Optional[RunStats]
+    #     The statistics the run is instrumented with, or None if it is not.
+    _batched: bool
+    #     True iff events with the same timestamp are done together, in the
+    #     order of PHASES.
 
-    def __init__(self) -> None:
+    def __init__(self, engine: str = HEAP,
+                 monitor: Optional[Monitor] = None,
+                 dispatcher: Optional[Dispatcher] = None,
+                 stats: Optional[RunStats] = None,
+                 batched: bool = False) -> None:
         """Initialize a Simulation.
 
+        engine: The event queue to use, either HEAP for a PriorityQueue or
+            CALENDAR for a CalendarQueue. Both process events in the same
+            order; CALENDAR is faster when many events share timestamps.
+        monitor: The monitor to report activities to, such as
+            Monitor(history=False) for long runs. A new Monitor() if None.
+        dispatcher: The dispatcher to use, such as a BatchDispatcher. A new
+            Dispatcher() if None.
+        stats: A RunStats to record the time spent on each kind of event,
+            the size of the event queue and the work of the dispatcher in.
+            If None, the run is not instrumented and pays nothing for it.
+        batched: If True, all the events with the same timestamp are taken
+            from the queue together and done a kind at a time, in the order
+            of PHASES, with one dispatcher and monitor call per kind. Events
+            they spawn for the same timestamp join the batch if their kind
+            has not been done yet. Otherwise events are done one at a time
+            in the order they were added.
         """
-        self._events = PriorityQueue()
-        self._dispatcher = Dispatcher()
-        self._monitor = Monitor()
+        if engine == CALENDAR:
+            self._events = CalendarQueue()
+        elif engine == HEAP:
+            self._events = PriorityQueue()
+        else:
+            raise ValueError(f"Unknown event queue engine: {engine}")
+        self._dispatcher = Dispatcher() if dispatcher is None else dispatcher
+        self._monitor = Monitor() if monitor is None else monitor
+        self._sources = []
+        self._fed = []
+        self._upcoming = None
+        self._stats = stats
+        self._batched = batched
 
-    def run(self, initial_events: List[Event]) -> Dict[str, float]:
+    def run(self, initial_events: Iterable[Event],
+            presorted: bool = False, checkpoint_at: Optional[int] = None,
+            checkpoint_file: Optional[str] = None) -> Dict[str, float]:
         """Run the simulation on the list of events in <initial_events>.
 
         Return a dictionary containing statistics of the simulation,
         according to the specifications in the assignment handout.
 
         initial_events: An initial list of events.
+        presorted: If True, <initial_events> may be any iterable, such as
+            iter_events, and is pulled from lazily instead of being loaded
+            into the event queue up front. Only the events that have been
+            spawned but not yet done are held in memory.
+        checkpoint_at: If not None, save a snapshot of the simulation to
+            <checkpoint_file> just before the first event at or after this
+            time is done. The snapshot can be passed to restore() to carry on
+            from that point.
+        checkpoint_file: The file to save the snapshot to. Raise ValueError
+            if it is None but <checkpoint_at> is not.
+
+        Precondition: if <presorted> is True, <initial_events> is in
+        non-decreasing timestamp order.
         """
 
         # Add all initial events to the event queue.
@@ -56,24 +142,353 @@ class Simulation:
         # Until there are no more events, remove an event
         # from the event queue and do it. Add any returned
         # events to the event queue.
-        for x in initial_events:
-            self._events.add(x)
-        while not self._events.is_empty():
-            event = self._events.remove()
-            y = event.do(self._dispatcher, self._monitor)
-            for s in y:
-                self._events.add(s)
+        _check_checkpoint(checkpoint_at, checkpoint_file)
+        self.feed(initial_events, presorted)
+        return self.resume(checkpoint_at, checkpoint_file)
+
+    def feed(self, events: Iterable[Event], presorted: bool = False) -> None:
+        """Add <events> to the simulation, to be done by the next call to
+        run_until, step, resume or run.
+
+        Like the initial events of run(), each of <events> is done before
+        any spawned event with the same timestamp, so feeding the events of
+        a scenario in pieces between steps gives the same result as running
+        them all at once.
+
+        presorted: If True, <events> is pulled from lazily, like the initial
+            events of run(). Otherwise it is read and sorted now.
+
+        Precondition: no event in <events> is before an event that has
+        already been done. If <presorted> is True, <events> is in
+        non-decreasing timestamp order.
+
+        >>> simulation = Simulation()
+        >>> simulation.feed([Event(3), Event(1)])
+        >>> simulation.next_time()
+        1
+        """
+        if not presorted:
+            if self._upcoming is None and self._events.is_empty():
+                self._events.bulk_add(events)
+                self._fed.append(None)
+                return
+            events = sorted(events)
+        # Each source is a separate entry of one heap rather than a merge of
+        # the sources fed before it, so feeding often does not nest merges.
+        source = iter(events)
+        first = next(source, None)
+        if first is not None:
+            heapq.heappush(self._sources, (first, len(self._fed), source, 0))
+            self._upcoming = self._sources[0][0]
+        self._fed.append(not presorted)
+
+    def run_until(self, timestamp: Optional[int] = None,
+                  stop_when: Optional[Callable[[Dict[str, float]], bool]]
+                  = None, every: int = 1) -> Dict[str, float]:
+        """Do every event before the time <timestamp>, or every event if
+        <timestamp> is None, and return the statistics of the simulation so
+        far like run(). The simulation can be carried on afterwards.
+
+        stop_when: If not None, a function that is given the statistics after
+            every <every> events, and stops the run early by returning True.
+            In a batched simulation it is given them after whole batches.
+
+        >>> simulation = Simulation()
+        >>> simulation.feed(iter_events("events.txt"), presorted=True)
+        >>> report = simulation.run_until(
+        ...     stop_when=lambda r: r["average_driver_trip_distance"] > 0)
+        >>> simulation.next_time()
+        7
+        """
+        if stop_when is None:
+            self._do_events(None, timestamp)
+            return self._monitor.report()
+        report = self._monitor.report()
+        while not stop_when(report) and self._do_events(every, timestamp):
+            report = self._monitor.report()
+        return report
+
+    def step(self, count: int = 1) -> int:
+        """Do the next <count> events, and return the number of events done,
+        which is less than <count> if the simulation ran out of events.
+
+        In a batched simulation, whole batches are done until at least
+        <count> events have been done.
+
+        >>> Simulation().step()
+        0
+        """
+        return self._do_events(count, None)
+
+    def next_time(self) -> Optional[int]:
+        """Return the time of the next event, or None if every event has
+        been done.
+
+        >>> Simulation().next_time() is None
+        True
+        """
+        upcoming = self._upcoming
+        if self._events.is_empty():
+            return None if upcoming is None else upcoming.timestamp
+        spawned = self._events.peek().timestamp
+        return spawned if upcoming is None else min(spawned,
+                                                    upcoming.timestamp)
+
+    def report(self) -> Dict[str, float]:
+        """Return the statistics of the simulation so far, like run().
+
+        """
+        return self._monitor.report()
+
+    def resume(self, checkpoint_at: Optional[int] = None,
+               checkpoint_file: Optional[str] = None) -> Dict[str, float]:
+        """Do every remaining event, and return the statistics of the
+        simulation like run().
+
+        This carries on a simulation returned by restore().
+
+        checkpoint_at: If not None, save a snapshot of the simulation to
+            <checkpoint_file> just before the first event at or after this
+            time is done.
+        checkpoint_file: The file to save the snapshot to. Raise ValueError
+            if it is None but <checkpoint_at> is not.
+        """
+        _check_checkpoint(checkpoint_at, checkpoint_file)
+        if checkpoint_at is not None:
+            self._do_events(None, checkpoint_at)
+            self.checkpoint(checkpoint_file)
+        self._do_events(None, None)
         return self._monitor.report()
 
+    def _do_events(self, count: Optional[int],
+                   until: Optional[int]) -> int:
+        """Do up to <count> events, or every event if <count> is None,
+        before the time <until>, or at any time if <until> is None, and
+        return the number of events done. If the simulation is instrumented,
+        record the work in _stats.
+
+        The time-sorted initial events in _sources are merged with the events
+        they spawn, and an initial event is done before any spawned event
+        with the same timestamp, which is the same order run() uses for a
+        list. In a batched simulation, whole batches are done until at least
+        <count> events have been done.
+        """
+        events = self._events
+        stats = self._stats
+        clock = time.perf_counter
+        started = clock()
+        done = 0
+        while count is None or done < count:
+            upcoming = self._upcoming
+            if upcoming is not None and (events.is_empty() or
+                                         not events.peek() < upcoming):
+                if until is not None and upcoming.timestamp >= until:
+                    break
+                event = upcoming
+                self._next_initial()
+            elif events.is_empty() or \
+                    (until is not None and events.peek().timestamp >= until):
+                break
+            else:
+                event = events.remove()
+            if self._batched:
+                batch = [event]
+                while self._upcoming is not None and \
+                        self._upcoming.timestamp == event.timestamp:
+                    batch.append(self._upcoming)
+                    self._next_initial()
+                if not events.is_empty() and \
+                        events.peek().timestamp == event.timestamp:
+                    batch.extend(events.remove_batch())
+                self._do_batch(batch)
+                done += len(batch)
+                continue
+            if stats is None:
+                for s in event.do(self._dispatcher, self._monitor):
+                    events.add(s)
+            else:
+                began = clock()
+                spawned = event.do(self._dispatcher, self._monitor)
+                took = clock() - began
+                for s in spawned:
+                    events.add(s)
+            for s in event.revokes():
+                events.discard(s)
+            if stats is not None:
+                stats.record(type(event).__name__, took, event.timestamp,
+                             len(events))
+            done += 1
+        if stats is not None:
+            stats.seconds += clock() - started
+            stats.scans = self._dispatcher.scan_count()
+        return done
+
+    def _next_initial(self) -> None:
+        """Move _upcoming on to the next initial event.
+
+        Raise ValueError if the initial events are not sorted.
+        """
+        sources = self._sources
+        previous, number, rest, index = sources[0]
+        upcoming = next(rest, None)
+        if upcoming is None:
+            heapq.heappop(sources)
+        elif upcoming < previous:
+            raise ValueError(
+                f"Initial events are not sorted by timestamp: "
+                f"{upcoming.timestamp} follows {previous.timestamp}")
+        else:
+            heapq.heapreplace(sources, (upcoming, number, rest, index + 1))
+        self._upcoming = sources[0][0] if sources else None
+
+    def _do_batch(self, batch: List[Event]) -> None:
+        """Do the events of <batch>, which all have the same timestamp, a
+        kind at a time in the order of PHASES.
+
+        """
+        timestamp = batch[0].timestamp
+        last = len(PHASES)
+        phases = [[] for _ in range(last + 1)]
+        for event in batch:
+            phases[_RANKS.get(type(event), last)].append(event)
+        stats = self._stats
+        for rank, events in enumerate(phases):
+            if not events:
+                continue
+            groups = [events] if rank < last else [[e] for e in events]
+            for group in groups:
+                began = time.perf_counter()
+                spawned = type(group[0]).do_batch(group, self._dispatcher,
+                                                  self._monitor)
+                for s in spawned:
+                    phase = _RANKS.get(type(s), last)
+                    if s.timestamp == timestamp and phase > rank:
+                        phases[phase].append(s)
+                    else:
+                        self._events.add(s)
+                for event in group:
+                    for s in event.revokes():
+                        # A revoked event for this timestamp is still in
+                        # the batch, and does nothing when it is done.
+                        if s.timestamp != timestamp:
+                            self._events.discard(s)
+                if stats is not None:
+                    stats.record(type(group[0]).__name__,
+                                 time.perf_counter() - began, timestamp,
+                                 len(self._events), len(group))
+        if stats is not None:
+            stats.scans = self._dispatcher.scan_count()
+
+    def stats(self) -> Optional[RunStats]:
+        """Return the statistics this simulation was instrumented with, or
+        None if it was not instrumented.
+
+        """
+        return self._stats
+
+    def checkpoint(self, filename: str) -> None:
+        """Save a snapshot of the whole state of the simulation to
+        <filename>.
+
+        The snapshot holds the events in the event queue, the dispatcher with
+        its drivers and waiting passengers, and the monitor, compressed with
+        gzip. Initial events that have not been reached yet are not saved:
+        only how far into each source the simulation has got is, and
+        restore() is given the sources again.
+        """
+        with gzip.open(filename, "wb", compresslevel=6) as file:
+            pickle.dump((SNAPSHOT_VERSION, self), file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    def __getstate__(self) -> dict:
+        """Return the state of this simulation to pickle, with the number
+        and the index of the next event of each source in place of its
+        events.
+
+        """
+        state = self.__dict__.copy()
+        state["_sources"] = [(number, index)
+                             for _, number, _, index in self._sources]
+        state["_upcoming"] = None
+        return state
+
+    def _reopen(self, sources: Tuple[Iterable[Event], ...]) -> None:
+        """Carry on reading the initial events of this unpickled simulation
+        from <sources>, skipping the events that were done before it was
+        saved.
+
+        Raise ValueError if a source it had not used up is missing or has
+        fewer events than before.
+        """
+        positions = self._sources
+        self._sources = []
+        for number, index in positions:
+            if number >= len(sources) or sources[number] is None:
+                raise ValueError(f"the snapshot needs initial events source "
+                                 f"{number} to carry on")
+            events = sources[number]
+            if self._fed[number]:
+                events = sorted(events)
+            rest = itertools.islice(events, index, None)
+            upcoming = next(rest, None)
+            if upcoming is None:
+                raise ValueError(f"initial events source {number} has fewer "
+                                 f"than {index + 1} events")
+            heapq.heappush(self._sources, (upcoming, number, rest, index))
+        self._upcoming = self._sources[0][0] if self._sources else None
+
+
+def _check_checkpoint(checkpoint_at: Optional[int],
+                      checkpoint_file: Optional[str]) -> None:
+    """Raise ValueError if <checkpoint_at> is given without a
+    <checkpoint_file> to save the snapshot to.
+
+    >>> _check_checkpoint(5, None)
+    Traceback (most recent call last):
+    ...
+    ValueError: checkpoint_at needs a checkpoint_file
+    """
+    if checkpoint_at is not None and checkpoint_file is None:
+        raise ValueError("checkpoint_at needs a checkpoint_file")
+
+
+def restore(filename: str,
+            *sources: Optional[Iterable[Event]]) -> Simulation:
+    """Return the simulation saved by Simulation.checkpoint in <filename>.
+
+    Call resume() on the result to carry on running it. Only restore
+    snapshots from a trusted source, since loading one can run arbitrary
+    code.
+
+    sources: The initial events given to run() and to each call of feed(),
+        in the same order, such as iter_events for the same events file.
+        Their events before the checkpoint are read again and skipped.
+        Sources that were used up, and sources given unsorted to a
+        simulation with no events left, whose events are saved in the event
+        queue, may be passed again, passed as None, or left out at the end.
+
+    Raise ValueError if <filename> is not a snapshot this module can read,
+    or if <sources> do not hold the events the simulation has not reached.
+    """
+    with gzip.open(filename, "rb") as file:
+        version, simulation = pickle.load(file)
+    if version != SNAPSHOT_VERSION or not isinstance(simulation, Simulation):
+        raise ValueError(f"{filename} is not a version {SNAPSHOT_VERSION} "
+                         f"simulation snapshot")
+    simulation._reopen(sources)
+    return simulation
+
 
 if __name__ == "__main__":
     import python_ta
     python_ta.check_all(
         config={
-            'extra-imports': ['typing', 'container', 'dispatcher', 'event',
-                              'monitor']})
+            'allowed-io': ['Simulation.checkpoint', 'restore'],
+            'extra-imports': ['gzip', 'heapq', 'itertools', 'pickle',
+                              'time', 'typing',
+                              'container', 'dispatcher', 'event', 'monitor',
+                              'profiling']})
 
-    events = create_event_list("events.txt")
     sim = Simulation()
-    final_stats = sim.run(events)
+    final_stats = sim.run(iter_events("events.txt"), presorted=True)
     print(final_stats)
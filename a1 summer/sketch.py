@@ -0,0 +1,108 @@
+"""Streaming quantile sketches for simulation statistics"""
+
+from __future__ import annotations
+import math
+from typing import Dict
+
+# Values below 2 ** PRECISION are counted exactly. Larger values share a
+# bucket with values within 1 / 2 ** (PRECISION - 1) of them.
+PRECISION = 7
+_EXACT = 1 << PRECISION
+
+
+class QuantileSketch:
+    """A histogram of non-negative integers with logarithmically sized
+    buckets, in the style of an HDR histogram.
+
+    Small values each have their own bucket. Above that, every power of two
+    is split into the same number of buckets, so a quantile is accurate to
+    within about 1.6% of its value while memory stays bounded by the number
+    of distinct buckets, no matter how many values are added. Two sketches
+    can be merged by adding their bucket counts.
+
+    === Attributes ===
+    count: The number of values added to the sketch.
+    """
+
+    count: int
+
+    # === Private Attributes ===
+    _buckets: Dict[int, int]
+    #     A dictionary whose key is a bucket index, and value is the number
+    #     of values added to that bucket.
+
+    def __init__(self) -> None:
+        """Initialize an empty QuantileSketch.
+
+        >>> QuantileSketch().count
+        0
+        """
+        self.count = 0
+        self._buckets = {}
+
+    def add(self, value: int, count: int = 1) -> None:
+        """Add <value> to the sketch <count> times.
+
+        Precondition: value >= 0
+
+        >>> sketch = QuantileSketch()
+        >>> sketch.add(5)
+        >>> sketch.add(7, 3)
+        >>> sketch.count
+        4
+        """
+        if value < _EXACT:
+            bucket = value
+        else:
+            shift = value.bit_length() - PRECISION
+            bucket = (shift << PRECISION) + (value >> shift)
+        self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+        self.count += count
+
+    def merge(self, other: QuantileSketch) -> None:
+        """Add every value in <other> to this sketch.
+
+        >>> first, second = QuantileSketch(), QuantileSketch()
+        >>> first.add(1)
+        >>> second.add(3, 2)
+        >>> first.merge(second)
+        >>> first.count, first.quantile(0.5)
+        (3, 3.0)
+        """
+        for bucket, count in other._buckets.items():
+            self._buckets[bucket] = self._buckets.get(bucket, 0) + count
+        self.count += other.count
+
+    def quantile(self, q: float) -> float:
+        """Return the smallest value that at least a fraction <q> of the
+        values are less than or equal to, or 0 if the sketch is empty.
+
+        Values that share a bucket are reported as the middle of the bucket.
+
+        Precondition: 0 <= q <= 1
+
+        >>> sketch = QuantileSketch()
+        >>> for x in range(1, 101):
+        ...     sketch.add(x)
+        >>> sketch.quantile(0.5), sketch.quantile(0.99), sketch.quantile(1)
+        (50.0, 99.0, 100.0)
+        """
+        if self.count == 0:
+            return 0.0
+        target = max(1, math.ceil(q * self.count))
+        seen = 0
+        for bucket in sorted(self._buckets):
+            seen += self._buckets[bucket]
+            if seen >= target:
+                break
+        shift = bucket >> PRECISION
+        if shift == 0:
+            return float(bucket)
+        low = (bucket & (_EXACT - 1)) << shift
+        return low + ((1 << shift) - 1) / 2
+
+
+if __name__ == '__main__':
+    import python_ta
+
+    python_ta.check_all(config={'extra-imports': ['math', 'typing']})
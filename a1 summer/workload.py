@@ -0,0 +1,254 @@
+"""
+The workload module generates synthetic scenarios of any size.
+
+A Workload describes a city: the size of its grid, its fleet of drivers and
+their speeds, how demand for rides rises and falls over the day, where rides
+tend to start and end, and how patient passengers are. Its events are
+generated one at a time in timestamp order from a seed, so the same seed
+always gives the same scenario, and a scenario of any length can be streamed
+into a Simulation with presorted=True or written to an events file without
+ever being held in memory.
+
+=== Constants ===
+DAILY_DEMAND: A demand curve with a morning and an evening peak, in
+    passenger requests per unit of time.
+"""
+
+import heapq
+import itertools
+import math
+import random
+from typing import Iterator, List, Optional, Sequence, Tuple
+from driver import Driver
+from event import Event, DriverRequest, PassengerRequest
+from location import Location
+from passenger import Passenger
+
+DAILY_DEMAND = (0.2, 0.1, 0.1, 0.3, 1.0, 0.8, 0.5, 0.5, 0.6, 1.0, 0.9, 0.4)
+
+
+class Hotspot:
+    """An area of the grid where many rides start or end.
+
+    === Attributes ===
+    center: The middle of the hotspot.
+    spread: The standard deviation, in blocks, of the distance of rides from
+        the center along each axis.
+    weight: How likely a ride is to use this hotspot, relative to the other
+        hotspots of the workload.
+    """
+
+    center: Location
+    spread: float
+    weight: float
+
+    def __init__(self, center: Location, spread: float,
+                 weight: float = 1.0) -> None:
+        """Initialize a Hotspot.
+
+        >>> Hotspot(Location(5, 5), 2.0).weight
+        1.0
+        """
+        self.center = center
+        self.spread = spread
+        self.weight = weight
+
+
+class Workload:
+    """A description of a synthetic scenario.
+
+    === Attributes ===
+    rows: The number of rows of the grid.
+    columns: The number of columns of the grid.
+    drivers: The number of drivers.
+    duration: The length of the scenario. Every event happens before it.
+    demand: The mean number of passenger requests per unit of time over
+        equal periods that together cover the duration.
+    hotspots: The hotspots rides start and end around.
+    background: The fraction of ride ends placed uniformly over the grid
+        instead of around a hotspot.
+    speeds: The speeds of the drivers, each with a relative weight.
+    patience: The mean patience of passengers. Patience is geometrically
+        distributed, so most passengers are impatient and a few wait long.
+    ramp: Drivers start their shifts at times spread evenly over the first
+        <ramp> units of time.
+    """
+
+    rows: int
+    columns: int
+    drivers: int
+    duration: int
+    demand: Sequence[float]
+    hotspots: List[Hotspot]
+    background: float
+    speeds: List[Tuple[int, float]]
+    patience: float
+    ramp: int
+
+    def __init__(self, rows: int = 100, columns: int = 100,
+                 drivers: int = 200, duration: int = 1440,
+                 demand: Sequence[float] = DAILY_DEMAND,
+                 hotspots: Optional[List[Hotspot]] = None,
+                 background: float = 0.3,
+                 speeds: Optional[List[Tuple[int, float]]] = None,
+                 patience: float = 15.0, ramp: int = 60) -> None:
+        """Initialize a Workload.
+
+        With no hotspots, rides start and end uniformly over the grid. With
+        no speeds, every driver has speed 1.
+
+        >>> Workload(drivers=10).drivers
+        10
+        """
+        self.rows = rows
+        self.columns = columns
+        self.drivers = drivers
+        self.duration = duration
+        self.demand = demand
+        self.hotspots = [] if hotspots is None else hotspots
+        self.background = background
+        self.speeds = [(1, 1.0)] if speeds is None else speeds
+        self.patience = patience
+        self.ramp = ramp
+
+    def __str__(self) -> str:
+        """Return a string representation of this workload.
+
+        >>> print(Workload(rows=10, columns=20, drivers=5, duration=60))
+        Workload (10x20 grid, 5 drivers, 60 time units)
+        """
+        return f"Workload ({self.rows}x{self.columns} grid, " \
+               f"{self.drivers} drivers, {self.duration} time units)"
+
+    def __call__(self, seed: int) -> Iterator[Event]:
+        """Return the events of this workload for <seed>, so a Workload can
+        be used as the events of a runner Scenario.
+
+        """
+        return self.events(seed)
+
+    def events(self, seed: int) -> Iterator[Event]:
+        """Yield the events of this workload for <seed>, in timestamp order.
+
+        Driver requests come before passenger requests with the same
+        timestamp. Drivers and passengers are drawn from separate random
+        streams, so changing the fleet does not change the passengers.
+
+        >>> events = list(Workload(drivers=3, duration=50).events(7))
+        >>> events == list(Workload(drivers=3, duration=50).events(7))
+        True
+        >>> all(a.timestamp <= b.timestamp for a, b in zip(events, events[1:]))
+        True
+        """
+        return heapq.merge(self._driver_requests(random.Random(f"{seed}d")),
+                           self._passenger_requests(
+                               random.Random(f"{seed}p")),
+                           key=lambda event: event.timestamp)
+
+    def _driver_requests(self, rng: random.Random) -> Iterator[DriverRequest]:
+        """Yield a request for each driver, in timestamp order.
+
+        """
+        speeds, weights = zip(*self.speeds)
+        for n in range(self.drivers):
+            location = self._location(rng)
+            speed = rng.choices(speeds, weights)[0]
+            yield DriverRequest(n * self.ramp // self.drivers,
+                                Driver(f"d{n}", location, speed))
+
+    def _passenger_requests(self, rng: random.Random) \
+            -> Iterator[PassengerRequest]:
+        """Yield the passenger requests, in timestamp order.
+
+        Requests arrive as a Poisson process whose rate follows the demand
+        curve.
+        """
+        period = self.duration / len(self.demand)
+        ids = itertools.count()
+        time = 0.0
+        for n, rate in enumerate(self.demand):
+            end = (n + 1) * period
+            if rate <= 0:
+                time = end
+                continue
+            while True:
+                time += rng.expovariate(rate)
+                if time >= end:
+                    time = end
+                    break
+                origin = self._location(rng)
+                destination = self._location(rng)
+                patience = self._patience(rng)
+                yield PassengerRequest(int(time), Passenger(
+                    f"p{next(ids)}", patience, origin, destination))
+
+    def _location(self, rng: random.Random) -> Location:
+        """Return a random location, around a hotspot or uniformly over the
+        grid.
+
+        """
+        if not self.hotspots or rng.random() < self.background:
+            return Location(rng.randrange(self.rows),
+                            rng.randrange(self.columns))
+        hotspot = rng.choices(self.hotspots,
+                              [h.weight for h in self.hotspots])[0]
+        row = round(rng.gauss(hotspot.center.row, hotspot.spread))
+        column = round(rng.gauss(hotspot.center.column, hotspot.spread))
+        return Location(min(max(row, 0), self.rows - 1),
+                        min(max(column, 0), self.columns - 1))
+
+    def _patience(self, rng: random.Random) -> int:
+        """Return a random patience with mean self.patience.
+
+        """
+        if self.patience <= 0:
+            return 0
+        # The number of failures before a success, each with probability
+        # 1 / (patience + 1), has mean <patience>.
+        stop = 1 / (self.patience + 1)
+        return int(math.log(1.0 - rng.random()) / math.log(1 - stop))
+
+
+def write_events(events: Iterator[Event], filename: str) -> int:
+    """Write <events> to <filename> in the format of an events file, and
+    return the number of events written.
+
+    The events are written one at a time as they are generated.
+    """
+    count = 0
+    with open(filename, "w") as file:
+        for event in events:
+            if isinstance(event, DriverRequest):
+                driver = event.driver
+                location = driver.location
+                file.write(f"{event.timestamp} DriverRequest {driver.id} "
+                           f"{location.row},{location.column} "
+                           f"{driver.get_speed()}\n")
+            else:
+                passenger = event.passenger
+                origin, destination = passenger.origin, passenger.destination
+                file.write(f"{event.timestamp} PassengerRequest "
+                           f"{passenger.id} {origin.row},{origin.column} "
+                           f"{destination.row},{destination.column} "
+                           f"{passenger.patience}\n")
+            count += 1
+    return count
+
+
+if __name__ == '__main__':
+    import sys
+    import python_ta
+
+    python_ta.check_all(
+        config={
+            'allowed-io': ['write_events'],
+            'extra-imports': ['heapq', 'itertools', 'math', 'random', 'sys',
+                              'typing', 'driver', 'event', 'location',
+                              'passenger']})
+
+    # python workload.py <filename> [drivers] [duration] [seed]
+    arguments = [int(a) for a in sys.argv[2:]]
+    fleet, length, seed_ = (arguments + [200, 1440, 0][len(arguments):])[:3]
+    city = Workload(drivers=fleet, duration=length, hotspots=[
+        Hotspot(Location(30, 30), 5.0, 2.0), Hotspot(Location(70, 60), 8.0)])
+    print(write_events(city.events(seed_), sys.argv[1]), "events written")